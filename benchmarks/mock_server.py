@@ -0,0 +1,331 @@
+"""Local stand-in for the Dynatrace API routes used by request_handler
+
+Serves /api/v1/, /api/config/v1/ and /api/v1.0/onpremise/ (Managed tenant
+URLs /e/<tenant id>/api/...) over HTTPS with generated payloads of a
+configurable size, added latency and injected error rate. Runs in its own
+process so the server does not compete with the benchmarked client for
+the GIL.
+"""
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import socket
+import ssl
+import subprocess
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+ENV_PREFIX = "/api/v1/"
+CONFIG_PREFIX = "/api/config/v1/"
+CLUSTER_PREFIX = "/api/v1.0/onpremise/"
+ENTITY_LAYERS = {
+    'applications': 'APPLICATION',
+    'hosts': 'HOST',
+    'processes': 'PROCESS_GROUP_INSTANCE',
+    'process-groups': 'PROCESS_GROUP',
+    'services': 'SERVICE'
+}
+DEFAULT_SETTINGS = {
+    # Entities per layer and tenant
+    'entities': 1000,
+    # Extra bytes of filler in every entity and config item
+    'payload_size': 0,
+    'config_items': 50,
+    'users': 500,
+    'latency_ms': 0.0,
+    # Fraction of requests answered with 503 and Retry-After: 0
+    'error_rate': 0.0,
+    'seed': 0
+}
+# Paths that read and reset the server's statistics, outside the API routes
+CONTROL_PATH = "/__mock/"
+
+def generate_certificate(directory):
+  """Self-signed certificate for localhost, made with the openssl command line tool"""
+  if shutil.which('openssl') is None:
+    raise Exception("The benchmark mock server needs the openssl command to create its certificate")
+  cert_file = os.path.join(directory, "mock_cert.pem")
+  key_file = os.path.join(directory, "mock_key.pem")
+  subprocess.run(
+      [
+          'openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+          '-subj', '/CN=localhost', '-keyout', key_file, '-out', cert_file
+      ],
+      check=True,
+      stdout=subprocess.DEVNULL,
+      stderr=subprocess.DEVNULL
+  )
+  return cert_file, key_file
+
+def build_entities(layer, settings):
+  """Entity list of a layer, shaped like the v1 topology API"""
+  prefix = ENTITY_LAYERS[layer]
+  now = int(time.time() * 1000)
+  filler = "x" * settings['payload_size']
+  entity_list = []
+  for number in range(settings['entities']):
+    entity = {
+        'entityId': prefix + "-" + format(number, '016X'),
+        'displayName': layer + "-" + str(number),
+        'discoveredName': layer + "-" + str(number),
+        'firstSeenTimestamp': now - 86400000,
+        'lastSeenTimestamp': now - (number % 60) * 60000,
+        'tags': [{'context': 'CONTEXTLESS', 'key': 'team', 'value': 'team' + str(number % 10)}],
+        'managementZones': [{'id': str(number % 5), 'name': 'zone' + str(number % 5)}],
+        'fromRelationships': {},
+        'toRelationships': {},
+        'filler': filler
+    }
+    if layer == 'hosts':
+      entity['consumedHostUnits'] = 0.25 * (1 + number % 8)
+      entity['osType'] = 'LINUX' if number % 4 else 'WINDOWS'
+      entity['hostGroup'] = {'meId': 'HOST_GROUP-' + str(number % 3), 'name': 'group' + str(number % 3)}
+      entity['toRelationships'] = {'isProcessOf': ['PROCESS_GROUP_INSTANCE-' + format(number, '016X')]}
+    if layer == 'processes':
+      entity['fromRelationships'] = {'isProcessOf': ['HOST-' + format(number, '016X')]}
+    entity_list.append(entity)
+  return entity_list
+
+def build_payloads(settings):
+  """Pre-encoded response bodies, so serving costs no JSON encoding"""
+  filler = "x" * settings['payload_size']
+  payloads = {}
+  for layer in ENTITY_LAYERS:
+    entity_list = build_entities(layer, settings)
+    payloads[layer] = json.dumps(entity_list).encode()
+    payloads[layer + "/"] = dict(
+        (entity['entityId'], json.dumps(entity).encode()) for entity in entity_list
+    )
+  payloads['config_list'] = json.dumps({'values': [
+      {'id': "config-" + str(number), 'name': "config " + str(number)}
+      for number in range(settings['config_items'])
+  ]}).encode()
+  payloads['config_item'] = filler
+  payloads['users'] = json.dumps([
+      {'id': "user" + str(number), 'email': "user" + str(number) + "@example.com",
+       'firstName': "User", 'lastName': str(number), 'groups': ['group' + str(number % 10)]}
+      for number in range(settings['users'])
+  ]).encode()
+  payloads['groups'] = json.dumps([
+      {'id': "group" + str(number), 'name': "group" + str(number), 'isClusterAdminGroup': False}
+      for number in range(10)
+  ]).encode()
+  return payloads
+
+class MockState():
+  """Settings, payloads and request statistics shared by the handler threads"""
+  def __init__(self, settings):
+    self.settings = settings
+    self.payloads = build_payloads(settings)
+    self.random = random.Random(settings['seed'])
+    self.lock = threading.Lock()
+    self.stats = {}
+    self.reset()
+
+  def reset(self):
+    """Zero the request statistics"""
+    with self.lock:
+      self.stats = {'requests': 0, 'errors': 0, 'bytes_out': 0, 'routes': {}}
+
+  def record(self, route, size, error):
+    """Count one request"""
+    with self.lock:
+      self.stats['requests'] = self.stats['requests'] + 1
+      self.stats['bytes_out'] = self.stats['bytes_out'] + size
+      self.stats['routes'][route] = self.stats['routes'].get(route, 0) + 1
+      if error:
+        self.stats['errors'] = self.stats['errors'] + 1
+
+  def inject_error(self):
+    """Whether the next request fails"""
+    if not self.settings['error_rate']:
+      return False
+    with self.lock:
+      return self.random.random() < self.settings['error_rate']
+
+class MockHandler(BaseHTTPRequestHandler):
+  """Routes the Dynatrace API paths to generated payloads"""
+  protocol_version = 'HTTP/1.1'
+  state = None
+
+  def setup(self):
+    super().setup()
+    # Headers and body are written separately; without this, Nagle's algorithm
+    # and delayed ACKs add ~40 ms to small responses
+    self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+  def log_message(self, *args):
+    return
+
+  def send_body(self, status, body, headers=None):
+    self.send_response(status)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(body)))
+    for name, value in (headers or {}).items():
+      self.send_header(name, value)
+    self.end_headers()
+    self.wfile.write(body)
+    return len(body)
+
+  def handle_request(self):
+    path = urlparse(self.path).path
+    length = int(self.headers.get('Content-Length') or 0)
+    if length:
+      self.rfile.read(length)
+    if path.startswith(CONTROL_PATH):
+      return self.handle_control(path[len(CONTROL_PATH):])
+
+    latency = self.state.settings['latency_ms']
+    if latency:
+      time.sleep(latency / 1000.0)
+    api_start = path.find("/api/")
+    api_path = path[api_start:] if api_start >= 0 else path
+    if self.state.inject_error():
+      size = self.send_body(503, b'{"error": "injected"}', {'Retry-After': '0'})
+      self.state.record(self.command + " " + route_name(api_path), size, True)
+      return
+    status, body = self.route(api_path)
+    size = self.send_body(status, body)
+    self.state.record(self.command + " " + route_name(api_path), size, status >= 400)
+
+  def handle_control(self, command):
+    if command == 'stats':
+      with self.state.lock:
+        body = json.dumps(self.state.stats).encode()
+      self.send_body(200, body)
+    elif command == 'reset':
+      self.state.reset()
+      self.send_body(200, b'{}')
+    else:
+      self.send_body(404, b'{}')
+
+  def route(self, api_path):
+    """(status, body) of an API request"""
+    payloads = self.state.payloads
+    if api_path.startswith(CLUSTER_PREFIX):
+      endpoint = api_path[len(CLUSTER_PREFIX):].strip('/')
+      if self.command == 'GET' and endpoint in ('users', 'groups'):
+        return 200, payloads[endpoint]
+      if self.command == 'GET' and endpoint.startswith(('users/', 'groups/')):
+        return 200, json.dumps({'id': endpoint.split('/')[-1]}).encode()
+      return (201 if self.command == 'POST' else 200), b'{}'
+
+    if api_path.startswith(CONFIG_PREFIX):
+      parts = api_path[len(CONFIG_PREFIX):].strip('/').split('/')
+      if self.command == 'GET' and len(parts) == 1:
+        return 200, payloads['config_list']
+      if self.command == 'GET':
+        return 200, json.dumps({
+            'id': parts[1], 'name': parts[1], 'enabled': True,
+            'metadata': {'configurationVersions': [1]}, 'filler': payloads['config_item']
+        }).encode()
+      if self.command == 'POST':
+        return 201, json.dumps({'id': "created-" + str(self.state.stats['requests'])}).encode()
+      return 204, b''
+
+    if api_path.startswith(ENV_PREFIX):
+      parts = api_path[len(ENV_PREFIX):].strip('/').split('/')
+      if parts[:2] == ['entity', 'infrastructure']:
+        parts = parts[2:]
+      elif parts[:1] == ['entity']:
+        parts = parts[1:]
+      if parts and parts[0] in ENTITY_LAYERS:
+        layer = parts[0]
+        if self.command == 'GET' and len(parts) == 1:
+          return 200, payloads[layer]
+        if self.command == 'GET':
+          body = payloads[layer + "/"].get(parts[1])
+          return (200, body) if body else (404, b'{"error": "not found"}')
+        return 204, b''
+      return 200, b'{}'
+    return 404, b'{"error": "unknown route"}'
+
+  do_GET = do_POST = do_PUT = do_DELETE = handle_request
+
+def route_name(api_path):
+  """Path without tenant IDs and entity/config IDs, for the per-route request counts"""
+  for prefix in (CLUSTER_PREFIX, CONFIG_PREFIX, ENV_PREFIX):
+    if api_path.startswith(prefix):
+      parts = api_path[len(prefix):].strip('/').split('/')
+      if parts[:2] == ['entity', 'infrastructure'] and len(parts) > 2:
+        return prefix + "/".join(parts[:3]) + ("/{id}" if len(parts) > 3 else "")
+      return prefix + parts[0] + ("/{id}" if len(parts) > 1 else "")
+  return api_path
+
+def serve(settings, cert_file, key_file, port_queue, port=0):
+  """Run the mock server until the process is terminated"""
+  handler = type('Handler', (MockHandler,), {'state': MockState(settings)})
+  server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+  server.daemon_threads = True
+  context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+  context.load_cert_chain(cert_file, key_file)
+  server.socket = context.wrap_socket(server.socket, server_side=True)
+  port_queue.put(server.server_address[1])
+  server.serve_forever()
+
+class MockServer():
+  """Starts the mock server in a child process
+
+  Use as a context manager. url is "localhost:<port>" for the cluster dict.
+  """
+  def __init__(self, directory, settings=None, port=0):
+    self.settings = dict(DEFAULT_SETTINGS)
+    self.settings.update(settings or {})
+    self.directory = directory
+    self.port = port
+    self.process = None
+
+  def __enter__(self):
+    self.start()
+    return self
+
+  def __exit__(self, *exc_info):
+    self.stop()
+
+  def start(self):
+    """Start the server process and wait for its port"""
+    cert_file, key_file = generate_certificate(self.directory)
+    port_queue = multiprocessing.Queue()
+    self.process = multiprocessing.Process(
+        target=serve,
+        args=(self.settings, cert_file, key_file, port_queue, self.port),
+        daemon=True
+    )
+    self.process.start()
+    self.port = port_queue.get(timeout=60)
+
+  def stop(self):
+    """Stop the server process"""
+    if self.process is not None:
+      self.process.terminate()
+      self.process.join()
+      self.process = None
+
+  @property
+  def url(self):
+    return "localhost:" + str(self.port)
+
+  def control(self, command):
+    """Call a control path of the server, without going through request_handler"""
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    connection = http.client.HTTPSConnection('127.0.0.1', self.port, context=context)
+    try:
+      connection.request('GET', CONTROL_PATH + command)
+      return json.loads(connection.getresponse().read())
+    finally:
+      connection.close()
+
+  def get_stats(self):
+    """Requests, injected errors, bytes sent and per-route counts since the last reset"""
+    return self.control('stats')
+
+  def reset_stats(self):
+    """Zero the server's request statistics"""
+    self.control('reset')
@@ -0,0 +1,272 @@
+"""Benchmark the framework against the local mock Dynatrace API
+
+Reports operations/sec, requests/sec, p50/p99 operation latency and peak
+Python memory per benchmark. With --save-baseline the results are stored;
+later runs are compared to the stored baseline and regressions beyond
+--tolerance are flagged (exit code 1).
+
+Example: python benchmarks/run_benchmarks.py --entities 5000 --latency-ms 5
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from benchmarks import mock_server
+from dynatrace.requests import request_handler as rh
+from dynatrace.requests import rate_limiter
+from dynatrace.tenant import config_pull
+from dynatrace.topology import hosts as topology_hosts
+from dynatrace.topology import tag_sync
+from dynatrace.cluster import users as cluster_users
+
+DEFAULT_BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+DEFAULT_ITERATIONS = 20
+DEFAULT_TOLERANCE = 0.2
+DEFAULT_TENANTS = 3
+# Entities tagged in each tag_hosts operation
+TAGGED_ENTITIES = 100
+# In sync_cluster_users, every tenth user gets new groups and this many users are new
+NEW_USERS = 50
+# Higher is better for these, lower is better for the rest that are compared
+HIGHER_IS_BETTER = ['ops_per_sec', 'requests_per_sec']
+COMPARED_METRICS = ['ops_per_sec', 'requests_per_sec', 'p50_ms', 'p99_ms', 'peak_memory_kb']
+
+def make_cluster(url, tenant_count):
+  """Managed cluster dict pointing at the mock server"""
+  tenants = ["tenant" + str(number) for number in range(tenant_count)]
+  return {
+      'url': url,
+      'tenant': dict((tenant, tenant + "-id") for tenant in tenants),
+      'api_token': dict((tenant, "token-" + tenant) for tenant in tenants),
+      'is_managed': True,
+      'verify_ssl': False,
+      'cluster_token': "cluster-token"
+  }
+
+def make_context(server, tenant_count, directory):
+  """Cluster, full set (two cluster names on the same server) and scratch directory"""
+  cluster = make_cluster(server.url, tenant_count)
+  full_set = {
+      'cluster1': cluster,
+      'cluster2': make_cluster("127.0.0.1:" + str(server.port), tenant_count)
+  }
+  return {'cluster': cluster, 'tenant': "tenant0", 'full_set': full_set, 'directory': directory}
+
+def list_hosts(context):
+  topology_hosts.get_hosts_tenantwide(context['cluster'], context['tenant'])
+
+def stream_hosts(context):
+  for _ in topology_hosts.iter_hosts_tenantwide(context['cluster'], context['tenant']):
+    pass
+
+def count_hosts(context):
+  topology_hosts.get_host_count_tenantwide(context['cluster'], context['tenant'])
+
+def tag_hosts(context):
+  desired_tags = dict(
+      ("HOST-" + format(number, '016X'), ["benchmark:" + str(number)])
+      for number in range(TAGGED_ENTITIES)
+  )
+  tag_sync.sync_tags(context['cluster'], context['tenant'], {'hosts': desired_tags})
+
+def pull_config(context):
+  config_pull.pull_to_files(
+      context['cluster'],
+      context['tenant'],
+      "managementZones",
+      lambda item, position: os.path.join(context['directory'], str(position) + ".json")
+  )
+
+def setwide_host_units(context):
+  topology_hosts.get_host_units_setwide(context['full_set'])
+
+def setwide_host_count(context):
+  topology_hosts.get_host_count_setwide(context['full_set'])
+
+def list_cluster_users(context):
+  cluster_users.get_users(context['cluster'])
+
+def sync_cluster_users(context):
+  if 'desired_users' not in context:
+    # Built on the warm-up run from the mock's users
+    desired_users = cluster_users.get_users(context['cluster'])
+    for user in desired_users[::10]:
+      user['groups'] = ['benchmark']
+    desired_users += [
+        {'id': "new" + str(number), 'email': "new" + str(number) + "@example.com",
+         'firstName': "New", 'lastName': str(number), 'groups': ['benchmark']}
+        for number in range(NEW_USERS)
+    ]
+    context['desired_users'] = desired_users
+  cluster_users.sync_users(context['cluster'], context['desired_users'])
+
+BENCHMARKS = OrderedDict([
+    ('list_hosts', list_hosts),
+    ('stream_hosts', stream_hosts),
+    ('count_hosts', count_hosts),
+    ('tag_hosts', tag_hosts),
+    ('pull_config', pull_config),
+    ('setwide_host_units', setwide_host_units),
+    ('setwide_host_count', setwide_host_count),
+    ('list_cluster_users', list_cluster_users),
+    ('sync_cluster_users', sync_cluster_users)
+])
+
+def percentile(sorted_values, fraction):
+  """Nearest-rank percentile of a sorted list"""
+  if not sorted_values:
+    return None
+  rank = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+  return sorted_values[rank]
+
+def run_benchmark(function, context, server, iterations):
+  """Time iterations of one benchmark, then measure peak memory of one more run"""
+  # Warm-up: connections, TLS sessions and imports are not part of the numbers
+  function(context)
+  server.reset_stats()
+  latencies = []
+  start = time.perf_counter()
+  for _ in range(iterations):
+    operation_start = time.perf_counter()
+    function(context)
+    latencies.append(time.perf_counter() - operation_start)
+  elapsed = time.perf_counter() - start
+  server_stats = server.get_stats()
+
+  tracemalloc.start()
+  function(context)
+  peak_memory = tracemalloc.get_traced_memory()[1]
+  tracemalloc.stop()
+
+  latencies.sort()
+  return OrderedDict([
+      ('iterations', iterations),
+      ('ops_per_sec', iterations / elapsed),
+      ('requests', server_stats['requests']),
+      ('requests_per_sec', server_stats['requests'] / elapsed),
+      ('errors_injected', server_stats['errors']),
+      ('p50_ms', percentile(latencies, 0.50) * 1000),
+      ('p99_ms', percentile(latencies, 0.99) * 1000),
+      ('peak_memory_kb', peak_memory / 1024.0),
+      ('mb_received_per_sec', server_stats['bytes_out'] / elapsed / 1048576.0)
+  ])
+
+def compare(results, baseline, tolerance):
+  """Regressions against a baseline: [(benchmark, metric, baseline value, value)]"""
+  regressions = []
+  for name, metrics in results.items():
+    baseline_metrics = baseline.get(name)
+    if not baseline_metrics:
+      continue
+    for metric in COMPARED_METRICS:
+      old = baseline_metrics.get(metric)
+      new = metrics.get(metric)
+      if not old or new is None:
+        continue
+      if metric in HIGHER_IS_BETTER:
+        regressed = new < old * (1 - tolerance)
+      else:
+        regressed = new > old * (1 + tolerance)
+      if regressed:
+        regressions.append((name, metric, old, new))
+  return regressions
+
+def load_baseline(file_name):
+  """Stored baseline, or None if there is none"""
+  if not os.path.exists(file_name):
+    return None
+  with open(file_name, 'r') as baseline_file:
+    return json.load(baseline_file)
+
+def save_baseline(file_name, settings, results):
+  """Store the results (and the settings they were measured with) as baseline"""
+  with open(file_name, 'w') as baseline_file:
+    json.dump({'settings': settings, 'results': results}, baseline_file, indent=2)
+
+def print_results(results):
+  """Results as a table"""
+  columns = ['ops_per_sec', 'requests_per_sec', 'p50_ms', 'p99_ms', 'peak_memory_kb', 'errors_injected']
+  print("benchmark".ljust(20) + "".join(column.rjust(18) for column in columns))
+  for name, metrics in results.items():
+    print(name.ljust(20) + "".join(
+        ("%.1f" % metrics[column]).rjust(18) if isinstance(metrics[column], float)
+        else str(metrics[column]).rjust(18)
+        for column in columns
+    ))
+
+def parse_args(argv=None):
+  parser = argparse.ArgumentParser(description="Benchmark the framework against a local mock API")
+  parser.add_argument('--benchmarks', '-b', nargs='*', choices=list(BENCHMARKS),
+                      help="Benchmarks to run (default: all)")
+  parser.add_argument('--iterations', '-n', type=int, default=DEFAULT_ITERATIONS)
+  parser.add_argument('--tenants', type=int, default=DEFAULT_TENANTS)
+  parser.add_argument('--entities', type=int, default=mock_server.DEFAULT_SETTINGS['entities'])
+  parser.add_argument('--payload-size', type=int, default=mock_server.DEFAULT_SETTINGS['payload_size'])
+  parser.add_argument('--config-items', type=int, default=mock_server.DEFAULT_SETTINGS['config_items'])
+  parser.add_argument('--users', type=int, default=mock_server.DEFAULT_SETTINGS['users'])
+  parser.add_argument('--latency-ms', type=float, default=mock_server.DEFAULT_SETTINGS['latency_ms'])
+  parser.add_argument('--error-rate', type=float, default=mock_server.DEFAULT_SETTINGS['error_rate'])
+  parser.add_argument('--baseline', default=DEFAULT_BASELINE_FILE)
+  parser.add_argument('--save-baseline', action='store_true')
+  parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+  parser.add_argument('--output', '-o', help="Also write the results to this JSON file")
+  return parser.parse_args(argv)
+
+def main(argv=None):
+  args = parse_args(argv)
+  settings = OrderedDict([
+      ('entities', args.entities),
+      ('payload_size', args.payload_size),
+      ('config_items', args.config_items),
+      ('users', args.users),
+      ('latency_ms', args.latency_ms),
+      ('error_rate', args.error_rate),
+      ('tenants', args.tenants),
+      ('iterations', args.iterations)
+  ])
+  # Injected 503s carry Retry-After: 0, so retries should not sleep on backoff
+  rate_limiter.configure(backoff_base=0.0)
+  results = OrderedDict()
+  with tempfile.TemporaryDirectory() as directory:
+    server_settings = dict((key, value) for key, value in settings.items()
+                           if key in mock_server.DEFAULT_SETTINGS)
+    with mock_server.MockServer(directory, settings=server_settings) as server:
+      context = make_context(server, args.tenants, directory)
+      for name in args.benchmarks or list(BENCHMARKS):
+        results[name] = run_benchmark(BENCHMARKS[name], context, server, args.iterations)
+        print(name + " done", file=sys.stderr)
+      rh.close_sessions()
+
+  print_results(results)
+  if args.output:
+    with open(args.output, 'w') as output_file:
+      json.dump({'settings': settings, 'results': results}, output_file, indent=2)
+
+  if args.save_baseline:
+    save_baseline(args.baseline, settings, results)
+    print("Baseline saved to " + args.baseline)
+    return 0
+  baseline = load_baseline(args.baseline)
+  if baseline is None:
+    print("No baseline at " + args.baseline + " (store one with --save-baseline)")
+    return 0
+  if baseline.get('settings') != settings:
+    print("Baseline was measured with other settings, comparison skipped: " + json.dumps(baseline.get('settings')))
+    return 0
+  regressions = compare(results, baseline['results'], args.tolerance)
+  for name, metric, old, new in regressions:
+    print("REGRESSION " + name + " " + metric + ": " + ("%.2f" % old) + " -> " + ("%.2f" % new))
+  if not regressions:
+    print("No regressions against the baseline (tolerance " + str(args.tolerance) + ")")
+  return 1 if regressions else 0
+
+if __name__ == '__main__':
+  sys.exit(main())
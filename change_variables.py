@@ -1,15 +1,15 @@
-"""Replace active variables with another set"""
-from platform import system
+"""Replace active variables with another set
+
+Scripts can also use a set without copying it, see dynatrace.settings
+(e.g. settings.get_variables('prod').FULL_SET).
+"""
 import argparse
 import os
+import shutil
 
 def replace_set(set_file):
   """Replace Variable File"""
-  # Options are Darwin, Linux, Java and Windows. Java not supported
-  if "Windows" in system():
-    os.system("copy variable_sets\\" + str(set_file) + ".py user_variables.py")
-  else:
-    os.system("cp variable_sets/" + str(set_file) + ".py user_variables.py")
+  shutil.copyfile(os.path.join("variable_sets", str(set_file) + ".py"), "user_variables.py")
 
 def get_variable_set_file(variable_set_arg):
   """Checks if the set file was provided via arg else prompt"""
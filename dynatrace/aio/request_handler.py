@@ -0,0 +1,224 @@
+"""Make Asynchronous API Requests to available Dynatrace API (requires aiohttp)"""
+import asyncio
+import json as jsonlib
+from dynatrace.requests import instrumentation
+from dynatrace.requests import request_handler as rh
+from dynatrace.requests import rate_limiter
+
+try:
+  import aiohttp
+except ImportError:
+  aiohttp = None
+
+DEFAULT_TENANT_CONCURRENCY = 10
+DEFAULT_CLUSTER_CONCURRENCY = 5
+DEFAULT_TOTAL_CONNECTIONS = 100
+
+class ApiResponse():
+  """Fully read response exposing the parts of requests.Response the framework uses"""
+  def __init__(self, url, status_code, headers, content):
+    self.url = url
+    self.status_code = status_code
+    self.headers = headers
+    self.content = content
+
+  @property
+  def text(self):
+    """Body decoded as text"""
+    return self.content.decode('utf-8', errors='replace')
+
+  def json(self):
+    """Body decoded as JSON"""
+    return jsonlib.loads(self.content)
+
+class AsyncSessionRegistry():
+  """One aiohttp session and set of per-tenant semaphores for each event loop"""
+  def __init__(self):
+    self.total_connections = DEFAULT_TOTAL_CONNECTIONS
+    self.default_limits = {'tenant': DEFAULT_TENANT_CONCURRENCY, 'cluster': DEFAULT_CLUSTER_CONCURRENCY}
+    self.limits = {}
+    self._loops = {}
+
+  def get_session(self):
+    """Get the session for the running loop"""
+    if aiohttp is None:
+      raise Exception("aiohttp is required for dynatrace.aio (python3 -m pip install aiohttp)")
+    loop = asyncio.get_running_loop()
+    state = self._loops.get(loop)
+    if state is None or state['session'].closed:
+      connector = aiohttp.TCPConnector(limit=self.total_connections)
+      state = {'session': aiohttp.ClientSession(connector=connector), 'semaphores': {}}
+      self._loops[loop] = state
+    return state['session']
+
+  def get_semaphore(self, cluster, tenant=None):
+    """Get the concurrency limiter for a cluster API (tenant=None) or tenant API"""
+    self.get_session()
+    semaphores = self._loops[asyncio.get_running_loop()]['semaphores']
+    key = (cluster['url'], tenant)
+    if key not in semaphores:
+      if key in self.limits:
+        limit = self.limits[key]
+      else:
+        limit = self.default_limits['cluster' if tenant is None else 'tenant']
+      semaphores[key] = asyncio.Semaphore(limit)
+    return semaphores[key]
+
+  async def close(self):
+    """Close the session of the running loop"""
+    state = self._loops.pop(asyncio.get_running_loop(), None)
+    if state is not None:
+      await state['session'].close()
+
+_SESSIONS = AsyncSessionRegistry()
+
+def configure_concurrency(tenant_limit=None, cluster_limit=None, total_connections=None):
+  """Set default in-flight request limits per tenant API, per cluster API and in total"""
+  if tenant_limit is not None:
+    _SESSIONS.default_limits['tenant'] = tenant_limit
+  if cluster_limit is not None:
+    _SESSIONS.default_limits['cluster'] = cluster_limit
+  if total_connections is not None:
+    _SESSIONS.total_connections = total_connections
+
+def set_concurrency_limit(cluster, limit, tenant=None):
+  """Override the in-flight request limit of one tenant (or the cluster API)"""
+  _SESSIONS.limits[(cluster['url'], tenant)] = limit
+
+async def close_sessions():
+  """Close the session of the running event loop. Await before the loop ends"""
+  await _SESSIONS.close()
+
+def prepare_params(params):
+  """aiohttp only takes str/int/float values, so send booleans the way Dynatrace expects"""
+  prepared = {}
+  for key, value in params.items():
+    if isinstance(value, bool):
+      value = "true" if value else "false"
+    prepared[key] = value
+  return prepared
+
+async def make_api_call(cluster, method, url, tenant=None, params=None, json=None):
+  """Send a request through the loop's session, honouring limits and retries"""
+  session = _SESSIONS.get_session()
+  limiter = rate_limiter.RATE_LIMITER
+  limiter_key = rate_limiter.bucket_key(cluster, tenant)
+  # None (default verification) rather than True: aiohttp before 3.9 took True as unverified
+  ssl = None if cluster.get('verify_ssl', True) else False
+  params = prepare_params(params) if params else None
+  attempt = 0
+  async with _SESSIONS.get_semaphore(cluster, tenant):
+    while True:
+      delay = limiter.reserve(limiter_key)
+      if delay > 0:
+        await asyncio.sleep(delay)
+      info = instrumentation.INSTRUMENTATION.before_request(
+          cluster, tenant, method, url, attempt, json=json
+      )
+      try:
+        async with session.request(method, url, params=params, json=json, ssl=ssl) as raw:
+          response = ApiResponse(str(raw.url), raw.status, raw.headers, await raw.read())
+      except Exception as error:
+        instrumentation.INSTRUMENTATION.after_request(info, error=error)
+        raise
+      instrumentation.INSTRUMENTATION.after_request(info, response=response)
+      limiter.update(limiter_key, response)
+      if not limiter.should_retry(method, response, attempt):
+        break
+      await asyncio.sleep(limiter.retry_delay(limiter_key, response, attempt))
+      attempt = attempt + 1
+  rh.check_response(response)
+  return response
+
+async def cluster_api_call(cluster, method, endpoint, params=None, json=None):
+  """Request to Cluster API"""
+  rh.check_managed(cluster["is_managed"])
+
+  params = dict(params) if params else {}
+  params['Api-Token'] = cluster['cluster_token']
+
+  return await make_api_call(
+      cluster,
+      method,
+      rh.HTTPS_STR + cluster['url'] + rh.CLUSTER_V1_PATH + rh.sanitize_endpoint(endpoint),
+      params=params,
+      json=json
+  )
+
+async def tenant_api_call(cluster, tenant, method, api_path, endpoint, params=None, json=None):
+  """Request to Tenant Environment or Configuration API"""
+  params = dict(params) if params else {}
+  params['Api-Token'] = cluster['api_token'][tenant]
+
+  return await make_api_call(
+      cluster,
+      method,
+      rh.generate_tenant_url(cluster, tenant) + api_path + rh.sanitize_endpoint(endpoint),
+      tenant=tenant,
+      params=params,
+      json=json
+  )
+
+async def cluster_get(cluster, endpoint, params=None):
+  """Get Request to Cluster API"""
+  return await cluster_api_call(cluster, "GET", endpoint, params=params)
+
+async def cluster_post(cluster, endpoint, params=None, json=None):
+  """Post Request to Cluster API"""
+  return await cluster_api_call(cluster, "POST", endpoint, params=params, json=json)
+
+async def cluster_put(cluster, endpoint, params=None, json=None):
+  """Put Request to Cluster API"""
+  return await cluster_api_call(cluster, "PUT", endpoint, params=params, json=json)
+
+async def cluster_delete(cluster, endpoint, params=None, json=None):
+  """Delete Request to Cluster API"""
+  return await cluster_api_call(cluster, "DELETE", endpoint, params=params, json=json)
+
+async def env_get(cluster, tenant, endpoint, params=None):
+  """Get Request to Tenant Environment API"""
+  return await tenant_api_call(cluster, tenant, "GET", rh.ENV_API_V1, endpoint, params=params)
+
+async def env_post(cluster, tenant, endpoint, params=None, json=None):
+  """Post Request to Tenant Environment API"""
+  return await tenant_api_call(cluster, tenant, "POST", rh.ENV_API_V1, endpoint, params=params, json=json)
+
+async def env_put(cluster, tenant, endpoint, params=None, json=None):
+  """Put Request to Tenant Environment API"""
+  return await tenant_api_call(cluster, tenant, "PUT", rh.ENV_API_V1, endpoint, params=params, json=json)
+
+async def env_delete(cluster, tenant, endpoint, params=None):
+  """Delete Request to Tenant Environment API"""
+  return await tenant_api_call(cluster, tenant, "DELETE", rh.ENV_API_V1, endpoint, params=params)
+
+async def config_get(cluster, tenant, endpoint, params=None, json=None):
+  """Get Request to Tenant Configuration API"""
+  return await tenant_api_call(cluster, tenant, "GET", rh.CONFIG_API_V1, endpoint, params=params, json=json)
+
+async def config_post(cluster, tenant, endpoint, params=None, json=None):
+  """Post Request to Tenant Configuration API"""
+  return await tenant_api_call(cluster, tenant, "POST", rh.CONFIG_API_V1, endpoint, params=params, json=json)
+
+async def config_put(cluster, tenant, endpoint, params=None, json=None):
+  """Put Request to Tenant Configuration API"""
+  return await tenant_api_call(cluster, tenant, "PUT", rh.CONFIG_API_V1, endpoint, params=params, json=json)
+
+async def config_delete(cluster, tenant, endpoint, params=None, json=None):
+  """Delete Request to Tenant Configuration API"""
+  return await tenant_api_call(cluster, tenant, "DELETE", rh.CONFIG_API_V1, endpoint, params=params, json=json)
+
+async def gather_clusterwide(cluster, coroutine_function, *args, **kwargs):
+  """Run coroutine_function(cluster, tenant, ...) for every tenant. Returns {tenant: result}"""
+  tenants = list(cluster['tenant'])
+  results = await asyncio.gather(
+      *[coroutine_function(cluster, tenant, *args, **kwargs) for tenant in tenants]
+  )
+  return dict(zip(tenants, results))
+
+async def gather_setwide(full_set, coroutine_function, *args, **kwargs):
+  """Run coroutine_function(cluster, tenant, ...) for every tenant of every cluster"""
+  cluster_names = list(full_set)
+  results = await asyncio.gather(
+      *[gather_clusterwide(full_set[name], coroutine_function, *args, **kwargs) for name in cluster_names]
+  )
+  return dict(zip(cluster_names, results))
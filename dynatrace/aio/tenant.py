@@ -0,0 +1,83 @@
+"""Asynchronous tenant operations mirroring dynatrace.tenant"""
+import asyncio
+from dynatrace.aio import request_handler as arh
+from dynatrace.aio import topology as async_topology
+from dynatrace.tenant import maintenance
+from dynatrace.tenant import management_zones as mzh
+from dynatrace.tenant import request_attributes
+from dynatrace.tenant import request_naming
+
+MAINTENANCE_ENDPOINT = maintenance.MZ_ENDPOINT
+
+async def get_host_groups_tenantwide(cluster, tenant):
+  """Get all Host Groups in a tenant. Dict uses HostGroup ID for the Key"""
+  params = {
+      'relativeTime':'day',
+      'includeDetails':'true'
+  }
+  response = await async_topology.get_hosts_tenantwide(cluster, tenant, params=params)
+  host_groups = {}
+  for host in response:
+    host_groups[host['hostGroup']['meId']] = host['hostGroup']['name']
+  return host_groups
+
+async def get_host_groups_setwide(full_set):
+  """Get all Host Groups in the full_set of Clusters"""
+  results = await arh.gather_setwide(full_set, get_host_groups_tenantwide)
+  host_groups_setwide = {}
+  for tenants in results.values():
+    for host_groups in tenants.values():
+      host_groups_setwide.update(host_groups)
+  return host_groups_setwide
+
+async def get_management_zone_list(cluster, tenant):
+  """Get all Management Zones in Environment"""
+  response = await arh.config_get(cluster, tenant, "managementZones")
+  return response.json()['values']
+
+async def get_management_zone_id(cluster, tenant, mz_name):
+  """Get Management Zone ID of Management Zone Name"""
+  for m_zone in await get_management_zone_list(cluster, tenant):
+    if m_zone['name'] == mz_name:
+      return m_zone['id']
+  return None
+
+async def add_management_zone(cluster, tenant, application, env_zone=None):
+  """Add Management Zone based on Application and Environment"""
+  mz_payload = mzh.generate_mz_payload(application, env_zone)
+  response = await arh.config_post(cluster, tenant, '/managementZones', json=mz_payload)
+  if "id" in response.json():
+    return (response.json())['id']
+  return response.text
+
+async def delete_management_zone_by_id(cluster, tenant, mz_id):
+  """Delete Management Zone by Management Zone ID"""
+  response = await arh.config_delete(cluster, tenant, "managementZones/" + str(mz_id))
+  return response.status_code
+
+async def get_windows(cluster, tenant):
+  """Return List of Maintenance Windows in Effect"""
+  response = await arh.config_get(cluster, tenant, MAINTENANCE_ENDPOINT)
+  return response.json()
+
+async def get_window(cluster, tenant, window_id):
+  """Return Maintenance Window Details"""
+  response = await arh.config_get(cluster, tenant, MAINTENANCE_ENDPOINT + window_id)
+  return response.json()
+
+async def get_config_details(cluster, tenant, endpoint):
+  """List a config endpoint and fetch every item's details concurrently, in list order"""
+  response = await arh.config_get(cluster, tenant, endpoint)
+  item_list = response.json()['values']
+  detail_responses = await asyncio.gather(
+      *[arh.config_get(cluster, tenant, endpoint + str(item['id'])) for item in item_list]
+  )
+  return [detail.json() for detail in detail_responses]
+
+async def get_request_attributes(cluster, tenant):
+  """Get the details of every Request Attribute in a tenant"""
+  return await get_config_details(cluster, tenant, request_attributes.ENDPOINT)
+
+async def get_request_naming_rules(cluster, tenant):
+  """Get the details of every Service Request Naming Rule in a tenant"""
+  return await get_config_details(cluster, tenant, request_naming.ENDPOINT)
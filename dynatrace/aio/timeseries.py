@@ -0,0 +1,27 @@
+"""Asynchronous timeseries operations mirroring dynatrace.timeseries"""
+from dynatrace.aio import request_handler as arh
+from dynatrace.timeseries.timeseries import ENDPOINT
+
+async def get_timeseries_list(cluster, tenant, params=None):
+  """Get List of Timeseries Metics"""
+  response = await arh.env_get(cluster, tenant, ENDPOINT, params=params)
+  return response.json()
+
+async def get_timeseries_metric(cluster, tenant, metric, params=None):
+  """Get Timeseries Metric"""
+  response = await arh.env_get(cluster, tenant, ENDPOINT + metric, params=params)
+  return response.json()
+
+async def get_timeseries_metric_setwide(full_set, metric, params=None):
+  """Get a Timeseries Metric from every tenant. Returns {cluster: {tenant: json}}"""
+  return await arh.gather_setwide(full_set, get_timeseries_metric, metric, params=params)
+
+async def create_custom_metric(cluster, tenant, metric, json, params=None):
+  """Create a custom metric"""
+  response = await arh.env_put(cluster, tenant, ENDPOINT + metric, params=params, json=json)
+  return response.status_code
+
+async def delete_custom_metic(cluster, tenant, metric):
+  """Delete a custom metric"""
+  response = await arh.env_delete(cluster, tenant, ENDPOINT + metric)
+  return response.status_code
@@ -0,0 +1,132 @@
+"""Asynchronous topology operations mirroring dynatrace.topology"""
+from dynatrace.aio import request_handler as arh
+from dynatrace.requests import json_stream
+from dynatrace.topology import shared as topology_shared
+from dynatrace.topology import applications as topology_applications
+
+async def get_env_layer_entities(cluster, tenant, layer, params=None):
+  """Get all Entities of Specified Layer"""
+  layer_list = ['applications','hosts', 'processes', 'process-groups', 'services']
+  topology_shared.check_valid_layer(layer, layer_list)
+  response = await arh.env_get(cluster, tenant, topology_shared.ENDPOINT + layer, params=params)
+  return response.json()
+
+async def get_env_layer_entity(cluster, tenant, layer, entity, params=None):
+  """Get Entity Information for Specified Layer"""
+  layer_list = ['applications','hosts', 'processes', 'process-groups', 'services']
+  topology_shared.check_valid_layer(layer, layer_list)
+  response = await arh.env_get(
+      cluster,
+      tenant,
+      topology_shared.ENDPOINT + layer + "/" + entity,
+      params=params
+  )
+  return response.json()
+
+async def set_env_layer_properties(cluster, tenant, layer, entity, prop_json):
+  """Update Properties of Entity"""
+  layer_list = ['applications', 'custom', 'hosts', 'process-groups', 'services']
+  topology_shared.check_valid_layer(layer, layer_list)
+  response = await arh.env_post(
+      cluster,
+      tenant,
+      topology_shared.ENDPOINT + layer + "/" + entity,
+      json=prop_json
+  )
+  return response.status_code
+
+async def add_env_layer_tags(cluster, tenant, layer, entity, tag_list):
+  """Add tags to an entity"""
+  layer_list = ['applications','hosts', 'custom', 'process-groups', 'services']
+  topology_shared.check_valid_layer(layer, layer_list)
+  if tag_list is None:
+    raise Exception ("tag_list cannot be None type")
+  return await set_env_layer_properties(cluster, tenant, layer, entity, {'tags': tag_list})
+
+async def get_env_layer_count(cluster, tenant, layer, params=None):
+  """Get total entities of a layer in an environment without decoding their details"""
+  layer_list = ['applications','hosts', 'processes', 'process-groups', 'services']
+  topology_shared.check_valid_layer(layer, layer_list)
+  response = await arh.env_get(
+      cluster,
+      tenant,
+      topology_shared.ENDPOINT + layer,
+      params=topology_shared.get_count_params(params)
+  )
+  return json_stream.count_json_array_chunks([response.content])
+
+async def get_cluster_layer_count(cluster, layer, params=None):
+  """Get total count for all environments in cluster"""
+  counts = await arh.gather_clusterwide(cluster, get_env_layer_count, layer, params=params)
+  return sum(counts.values())
+
+async def get_set_layer_count(full_set, layer, params=None):
+  """Get total count for all clusters definied in variable file"""
+  counts = await arh.gather_setwide(full_set, get_env_layer_count, layer, params=params)
+  return sum(sum(tenants.values()) for tenants in counts.values())
+
+async def get_set_layer_entities(full_set, layer, params=None):
+  """Get every entity of a layer for all clusters. Returns {cluster: {tenant: list}}"""
+  return await arh.gather_setwide(full_set, get_env_layer_entities, layer, params=params)
+
+async def get_hosts_tenantwide(cluster, tenant, params=None):
+  """Get Information for all hosts in a tenant"""
+  return await get_env_layer_entities(cluster, tenant, 'hosts', params=params)
+
+async def get_host(cluster, tenant, entity, params=None):
+  """Get Information on one host for in a tenant"""
+  return await get_env_layer_entity(cluster, tenant, 'hosts', entity, params=params)
+
+async def get_host_units_tenantwide(cluster, tenant, params=None):
+  """Get total consumed host units in a tenant"""
+  host_list = await get_hosts_tenantwide(cluster, tenant, params=params)
+  return sum(host['consumedHostUnits'] for host in host_list)
+
+async def get_processes_tenantwide(cluster, tenant, params=None):
+  """Get Information for all processes in a tenant"""
+  return await get_env_layer_entities(cluster, tenant, 'processes', params=params)
+
+async def get_process(cluster, tenant, entity, params=None):
+  """Get Information on one process for in a tenant"""
+  return await get_env_layer_entity(cluster, tenant, 'processes', entity, params=params)
+
+async def get_process_groups_tenantwide(cluster, tenant):
+  """Get Information for all process-groups in a tenant"""
+  return await get_env_layer_entities(cluster, tenant, 'process-groups')
+
+async def get_process_group(cluster, tenant, entity):
+  """Get Information on one process-group for in a tenant"""
+  return await get_env_layer_entity(cluster, tenant, 'process-groups', entity)
+
+async def get_services_tenantwide(cluster, tenant):
+  """Get Information for all services in a tenant"""
+  return await get_env_layer_entities(cluster, tenant, 'services')
+
+async def get_service(cluster, tenant, entity):
+  """Get Information on one service for in a tenant"""
+  return await get_env_layer_entity(cluster, tenant, 'services', entity)
+
+async def get_applications_tenantwide(cluster, tenant):
+  """Get Information for all applications in a tenant"""
+  response = await arh.env_get(cluster, tenant, topology_applications.ENDPOINT)
+  return response.json()
+
+async def get_application(cluster, tenant, entity):
+  """Get Information on one application for in a tenant"""
+  response = await arh.env_get(cluster, tenant, topology_applications.ENDPOINT + entity)
+  return response.json()
+
+async def get_application_count_tenantwide(cluster, tenant):
+  """Get total count for all applications in a tenant"""
+  response = await arh.env_get(
+      cluster,
+      tenant,
+      topology_applications.ENDPOINT,
+      params=topology_shared.get_count_params()
+  )
+  return json_stream.count_json_array_chunks([response.content])
+
+async def get_application_count_setwide(full_set):
+  """Get total count of applications for all clusters"""
+  counts = await arh.gather_setwide(full_set, get_application_count_tenantwide)
+  return sum(sum(tenants.values()) for tenants in counts.values())
@@ -1,7 +1,8 @@
 #!/bin/python3
 """Cluster Group Operations"""
-import user_variables
+from dynatrace import settings
 from dynatrace.requests import request_handler as rh
+from dynatrace.requests import parallel
 from dynatrace.tenant import management_zones as mzh
 
 MZ_USER_PERMISSONS = {
@@ -18,59 +19,152 @@ def generate_group_name(template, user_type, tenant, app_name):
   template = template.lower()
   return template
 
-def create_app_groups(cluster, app_name):
-  """Create Dynatrace User Groups for Applications"""
-  role_types = user_variables.USER_GROUPS['role_types']
-  role_tenants = user_variables.USER_GROUPS['role_tenants']
+def get_group_id(group_name):
+  """Group ID the cluster derives from a group name"""
+  return ''.join(e for e in group_name if e.isalnum())
 
-  all_new_groups = {}
+def generate_app_groups(app_name, variables=None):
+  """Desired groups of an application: {group name: (role tenant, role type key)}"""
+  variables = settings.get_variables(variables)
+  role_types = variables.USER_GROUPS['role_types']
+  role_tenants = variables.USER_GROUPS['role_tenants']
+
+  app_groups = {}
   for current_tenant in role_tenants:
-    all_new_groups[current_tenant] = {}
     for current_type_key, current_type_value in role_types.items():
-      group_id = generate_group_name(user_variables.USER_GROUP_TEMPLATE, current_type_value, current_tenant, app_name)
-      current_group = {
-          "isClusterAdminGroup": False,
-          "name":group_id,
-          "ldapGroupNames": [
-              group_id,
-          ],
-          "accessRight": {}
-      }
-
-      response = rh.cluster_post(
-          cluster,
-          "groups",
-          json=current_group
-      )
-      all_new_groups[current_tenant][current_type_key] = ((response.json())['id'])
+      group_name = generate_group_name(variables.USER_GROUP_TEMPLATE, current_type_value, current_tenant, app_name)
+      app_groups[group_name] = (current_tenant, current_type_key)
+  return app_groups
+
+def generate_group_payload(group_name):
+  """Payload to create a user group mapped to the LDAP group of the same name"""
+  return {
+      "isClusterAdminGroup": False,
+      "name": group_name,
+      "ldapGroupNames": [
+          group_name,
+      ],
+      "accessRight": {}
+  }
+
+def get_groups(cluster):
+  """List the user groups of a cluster"""
+  response = rh.cluster_get(cluster, "groups")
+  return response.json()
+
+def plan_app_groups(existing_groups, app_name, present=True, variables=None):
+  """Minimal changes to bring an application's groups to the desired state, without calling the API
+
+  Returns (names to create, {name: ID to delete}, {name: ID already as desired}).
+  present=False plans the removal of the application's groups.
+  """
+  existing_ids = {}
+  for group in existing_groups:
+    existing_ids[group['name']] = group['id']
+    existing_ids.setdefault(group['id'], group['id'])
+  to_create = []
+  to_delete = {}
+  unchanged = {}
+  for group_name in generate_app_groups(app_name, variables=variables):
+    group_id = existing_ids.get(group_name, existing_ids.get(get_group_id(group_name)))
+    if present and group_id is None:
+      to_create.append(group_name)
+    elif not present and group_id is not None:
+      to_delete[group_name] = group_id
+    else:
+      unchanged[group_name] = group_id
+  return to_create, to_delete, unchanged
+
+def sync_app_groups(cluster, app_name, present=True, variables=None, max_workers=None, existing_groups=None):
+  """Create (or with present=False delete) only the application groups that are missing (or still there)
+
+  Lists the cluster's groups once (unless existing_groups is given) and
+  applies the changes concurrently. Returns a report with "created"
+  ({name: ID}), "deleted" ({name: ID}), "unchanged" ({name: ID or None})
+  and "failed" ({name: error}).
+  """
+  if existing_groups is None:
+    existing_groups = get_groups(cluster)
+  to_create, to_delete, unchanged = plan_app_groups(
+      existing_groups, app_name, present=present, variables=variables
+  )
+  report = {'created': {}, 'deleted': {}, 'unchanged': unchanged, 'failed': {}}
+
+  def apply(change):
+    action, group_name = change
+    if action == 'create':
+      response = rh.cluster_post(cluster, "groups", json=generate_group_payload(group_name))
+      return response.json()['id']
+    rh.cluster_delete(cluster, "groups/" + to_delete[group_name])
+    return to_delete[group_name]
+
+  changes = [('create', group_name) for group_name in to_create] + \
+      [('delete', group_name) for group_name in to_delete]
+  group_ids, errors = parallel.run_parallel_collect(apply, changes, max_workers=max_workers)
+  for position, ((action, group_name), group_id) in enumerate(zip(changes, group_ids)):
+    if position in errors:
+      report['failed'][group_name] = str(errors[position])
+    else:
+      report['created' if action == 'create' else 'deleted'][group_name] = group_id
+  return report
+
+def sync_app_groups_setwide(app_name, present=True, variables=None, max_workers=None):
+  """sync_app_groups on every Managed cluster of FULL_SET, clusters in parallel
+
+  max_workers bounds the requests in flight over all clusters: it is split
+  between the clusters and the group changes within each cluster.
+  Returns {cluster name: report}. The report of a cluster that failed as a
+  whole (e.g. its groups could not be listed) has the error in "error".
+  """
+  variables = settings.get_variables(variables)
+  cluster_names = [name for name, cluster in variables.FULL_SET.items() if cluster['is_managed']]
+  max_workers = max_workers or parallel.DEFAULT_MAX_WORKERS
+  cluster_workers = max(1, min(max_workers, len(cluster_names)))
+  reports, errors = parallel.run_parallel_collect(
+      lambda cluster_name: sync_app_groups(
+          variables.FULL_SET[cluster_name],
+          app_name,
+          present=present,
+          variables=variables,
+          max_workers=max(1, max_workers // cluster_workers)
+      ),
+      cluster_names,
+      max_workers=cluster_workers
+  )
+  for position, error in errors.items():
+    reports[position] = {
+        'created': {}, 'deleted': {}, 'unchanged': {}, 'failed': {}, 'error': str(error)
+    }
+  return dict(zip(cluster_names, reports))
+
+def create_app_groups(cluster, app_name, variables=None):
+  """Create Dynatrace User Groups for Applications. Groups that already exist are kept"""
+  report = sync_app_groups(cluster, app_name, variables=variables)
+  if report['failed']:
+    raise Exception("Could not create user groups: " + str(report['failed']))
+  group_ids = dict(report['unchanged'], **report['created'])
+
+  all_new_groups = {}
+  for group_name, (current_tenant, current_type_key) in generate_app_groups(app_name, variables=variables).items():
+    all_new_groups.setdefault(current_tenant, {})[current_type_key] = group_ids[group_name]
   return all_new_groups
 
-def create_app_groups_setwide(app_name):
-  """Create Dynatrace User Groups for Applications"""
-  for cluster in user_variables.FULL_SET.values():
-    if cluster['is_managed']:
-      create_app_groups(cluster, app_name)
-
-def delete_app_groups (cluster, app_name):
-  role_types = user_variables.USER_GROUPS['role_types']
-  role_tenants = user_variables.USER_GROUPS['role_tenants']
-  
-  for current_tenant in role_tenants:
-    for current_type_value in role_types:
-      group_id = generate_group_name(user_variables.USER_GROUP_TEMPLATE, current_type_value, current_tenant, app_name)
-      group_id = ''.join(e for e in group_id if e.isalnum())
-      rh.cluster_delete(
-          cluster,
-          "groups/" + group_id
-      )
-
-def delete_app_groups_setwide(app_name):
+def create_app_groups_setwide(app_name, variables=None, max_workers=None):
   """Create Dynatrace User Groups for Applications"""
-  for cluster in user_variables.FULL_SET.values():
-    if cluster['is_managed']:
-      delete_app_groups(cluster, app_name)
+  return sync_app_groups_setwide(app_name, variables=variables, max_workers=max_workers)
+
+def delete_app_groups (cluster, app_name, variables=None):
+  """Delete the User Groups of an Application. Groups that do not exist are skipped"""
+  report = sync_app_groups(cluster, app_name, present=False, variables=variables)
+  if report['failed']:
+    raise Exception("Could not delete user groups: " + str(report['failed']))
+  return report
+
+def delete_app_groups_setwide(app_name, variables=None, max_workers=None):
+  """Delete the User Groups of an Application on every Managed cluster"""
+  return sync_app_groups_setwide(app_name, present=False, variables=variables, max_workers=max_workers)
 
-def create_app_clusterwide(cluster, app_name, zones=None):
+def create_app_clusterwide(cluster, app_name, zones=None, variables=None):
   """Create App User Groups and Management Zones"""
   # Create Standard App MZs
   mz_list = {}
@@ -93,9 +187,9 @@ def create_app_clusterwide(cluster, app_name, zones=None):
           mz_list[tenant_key].append(mz_id)
 
   # Create User Groups
-  user_groups = create_app_groups(cluster, app_name)
+  user_groups = create_app_groups(cluster, app_name, variables=variables)
   print(user_groups)
 
-  # for tenant in user_variables.USER_GROUPS['role_tenants']:
+  # for tenant in variables.USER_GROUPS['role_tenants']:
   #   if "access_env" in user_groups [tenant]:
   #     add_mz_to_user
\ No newline at end of file
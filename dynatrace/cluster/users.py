@@ -1,5 +1,15 @@
 """User Operations in Cluster Mangement"""
+import hashlib
+import json
 import dynatrace.requests.request_handler as rh
+from dynatrace.requests import parallel
+
+# Users sent per users/bulk call when syncing
+BULK_CHUNK_SIZE = 100
+# Fields compared to decide whether a user needs an update
+USER_FIELDS = ['id', 'email', 'firstName', 'lastName', 'groups']
+# Never deleted by sync_users, even if missing from the desired users
+PROTECTED_USER_IDS = ['admin']
 
 # TODO add check for is_managed
 
@@ -39,9 +49,11 @@ def delete_user(cluster, user_id, ignore_saas=True):
   response = rh.cluster_delete(cluster, "users/" + user_id)
   return response.json()
 
-def get_user_count(cluster, ignore_saas=True):
-  """Return the number of, users in a cluster"""
+def get_user_count(cluster, ignore_saas=True, snapshot=None):
+  """Return the number of, users in a cluster. A UserSnapshot is counted without calling the API"""
   check_is_managed(cluster, ignore_saas)
+  if snapshot is not None:
+    return len(snapshot)
   return len(get_users(cluster))
 
 def add_user_bulk(cluster, user_json, ignore_saas=True):
@@ -49,3 +61,119 @@ def add_user_bulk(cluster, user_json, ignore_saas=True):
   check_is_managed(cluster, ignore_saas)
   rh.cluster_put(cluster, "/users/bulk", json=user_json)
   return 'OK'
+
+def get_user_hash(user):
+  """Hash of the compared fields of a user (group order does not matter)"""
+  fields = {}
+  for field in USER_FIELDS:
+    value = user.get(field)
+    if field == 'groups' and value is not None:
+      value = sorted(value)
+    if field == 'email' and value is not None:
+      value = value.lower()
+    fields[field] = value
+  return hashlib.sha1(json.dumps(fields, sort_keys=True).encode()).hexdigest()
+
+class UserSnapshot():
+  """One listing of a cluster's users, indexed by ID and by email"""
+  def __init__(self, users):
+    self.users = users
+    self.by_id = {}
+    self.by_email = {}
+    self.hashes = {}
+    for user in users:
+      self.by_id[user['id']] = user
+      if user.get('email'):
+        self.by_email[user['email'].lower()] = user
+      self.hashes[user['id']] = get_user_hash(user)
+
+  def __len__(self):
+    return len(self.users)
+
+  def find(self, user):
+    """The existing user matching a user by ID, else by email. None if there is none"""
+    existing = self.by_id.get(user.get('id'))
+    if existing is None and user.get('email'):
+      existing = self.by_email.get(user['email'].lower())
+    return existing
+
+def get_user_snapshot(cluster, ignore_saas=True):
+  """List the users of a cluster once, as a UserSnapshot"""
+  return UserSnapshot(get_users(cluster, ignore_saas=ignore_saas))
+
+def plan_user_sync(snapshot, desired_users, delete_missing=False):
+  """Changes that bring a cluster from a UserSnapshot to the desired users, without calling the API
+
+  Desired users are matched by ID, then by email. Fields a desired user
+  leaves out keep their current values. Returns (users to add, users to
+  update, IDs to delete, IDs unchanged).
+  """
+  to_add = []
+  to_update = []
+  unchanged = []
+  matched = set()
+  for user in desired_users:
+    existing = snapshot.find(user)
+    if existing is None:
+      to_add.append(user)
+      continue
+    merged = dict(existing, **user)
+    merged['id'] = existing['id']
+    matched.add(existing['id'])
+    if get_user_hash(merged) == snapshot.hashes[existing['id']]:
+      unchanged.append(existing['id'])
+    else:
+      to_update.append(merged)
+  to_delete = []
+  if delete_missing:
+    to_delete = [
+        user_id for user_id in snapshot.by_id
+        if user_id not in matched and user_id not in PROTECTED_USER_IDS
+    ]
+  return to_add, to_update, to_delete, unchanged
+
+def sync_users(cluster, desired_users, delete_missing=False, chunk_size=BULK_CHUNK_SIZE,
+               max_workers=None, snapshot=None, ignore_saas=True):
+  """Make the cluster's users match the desired users
+
+  Lists the users once (unless a snapshot is given), then sends new and
+  changed users in chunks of chunk_size through users/bulk. With
+  delete_missing, users not in the desired set are deleted (except
+  PROTECTED_USER_IDS). Requests run on a pool of max_workers.
+  Returns a report with "added", "updated", "deleted" and "unchanged"
+  (lists of user IDs) and "failed" (user ID to error).
+  """
+  report = {'added': [], 'updated': [], 'deleted': [], 'unchanged': [], 'failed': {}}
+  if not check_is_managed(cluster, ignore_saas):
+    return report
+  if snapshot is None:
+    snapshot = get_user_snapshot(cluster, ignore_saas=ignore_saas)
+  to_add, to_update, to_delete, report['unchanged'] = plan_user_sync(
+      snapshot, desired_users, delete_missing=delete_missing
+  )
+
+  changed_users = [('added', user) for user in to_add] + [('updated', user) for user in to_update]
+  chunks = [changed_users[start:start + chunk_size] for start in range(0, len(changed_users), chunk_size)]
+  _, errors = parallel.run_parallel_collect(
+      lambda chunk: add_user_bulk(cluster, [user for _, user in chunk], ignore_saas=ignore_saas),
+      chunks,
+      max_workers=max_workers
+  )
+  for position, chunk in enumerate(chunks):
+    for change, user in chunk:
+      if position in errors:
+        report['failed'][user.get('id', user.get('email'))] = str(errors[position])
+      else:
+        report[change].append(user.get('id', user.get('email')))
+
+  _, errors = parallel.run_parallel_collect(
+      lambda user_id: rh.cluster_delete(cluster, "users/" + user_id),
+      to_delete,
+      max_workers=max_workers
+  )
+  for position, user_id in enumerate(to_delete):
+    if position in errors:
+      report['failed'][user_id] = str(errors[position])
+    else:
+      report['deleted'].append(user_id)
+  return report
@@ -0,0 +1,372 @@
+"""Request Instrumentation: hooks, metrics and profiling for request_handler"""
+import json as jsonlib
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse
+
+# Upper bounds (seconds) of the latency histogram buckets, +Inf is added on export
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+API_PATHS = ["/api/v1.0/onpremise/", "/api/config/v1/", "/api/v1/"]
+# Path segments holding IDs (entities, config items, users, ...) are replaced by {id}
+ID_SEGMENT = re.compile(r'.*[0-9@]|.{40,}')
+METRIC_PREFIX = "dynatrace_api"
+DEFAULT_METRICS_PORT = 9464
+
+def get_endpoint(url):
+  """API path of a request URL without tenant IDs, query and IDs, e.g. /api/v1/entity/infrastructure/hosts/{id}"""
+  path = urlparse(url).path
+  for api_path in API_PATHS:
+    position = path.find(api_path)
+    if position != -1:
+      segments = path[position + len(api_path):].strip('/').split('/')
+      return api_path + "/".join(
+          "{id}" if ID_SEGMENT.match(segment) else segment for segment in segments
+      )
+  return path
+
+def escape_label(value):
+  """Label value escaped for the Prometheus text format"""
+  return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(labels):
+  """{name="value",...} for a list of (name, value) pairs"""
+  return "{" + ",".join(name + '="' + escape_label(value) + '"' for name, value in labels) + "}"
+
+class Instrumentation():
+  """Pre- and post-request hooks called by request_handler and aio.request_handler
+
+  pre_hook(info) runs before every attempt (retries included), post_hook(info)
+  after it. info is a dict with method, url, endpoint, cluster, tenant,
+  attempt and start. Post hooks also get elapsed (seconds), status (None if
+  the request raised), error, bytes_in, bytes_out and response. Hooks run on
+  the requesting thread and should be quick. Exceptions in hooks are not
+  caught.
+  """
+  def __init__(self):
+    # Replaced instead of changed, so requests read them without locking
+    self.pre_hooks = ()
+    self.post_hooks = ()
+    self._lock = threading.Lock()
+
+  def add_hooks(self, pre_hook=None, post_hook=None):
+    """Register a pre-request hook, a post-request hook or both"""
+    with self._lock:
+      if pre_hook is not None:
+        self.pre_hooks = self.pre_hooks + (pre_hook,)
+      if post_hook is not None:
+        self.post_hooks = self.post_hooks + (post_hook,)
+
+  def remove_hooks(self, pre_hook=None, post_hook=None):
+    """Unregister hooks added with add_hooks"""
+    with self._lock:
+      self.pre_hooks = tuple(hook for hook in self.pre_hooks if hook != pre_hook)
+      self.post_hooks = tuple(hook for hook in self.post_hooks if hook != post_hook)
+
+  def before_request(self, cluster, tenant, method, url, attempt, stream=False, json=None):
+    """Call the pre hooks. Returns the info for after_request, None when nothing is registered"""
+    pre_hooks = self.pre_hooks
+    if not pre_hooks and not self.post_hooks:
+      return None
+    info = {
+        'method': method,
+        'url': url,
+        'endpoint': get_endpoint(url),
+        'cluster': cluster['url'],
+        'tenant': tenant,
+        'attempt': attempt,
+        'stream': stream,
+        'json': json,
+        'start': time.perf_counter()
+    }
+    for hook in pre_hooks:
+      hook(info)
+    return info
+
+  def after_request(self, info, response=None, error=None):
+    """Complete the info of before_request and call the post hooks"""
+    if info is None:
+      return
+    info['elapsed'] = time.perf_counter() - info['start']
+    info['response'] = response
+    info['error'] = error
+    info['status'] = None if response is None else response.status_code
+    info['bytes_in'] = 0
+    if response is not None:
+      if info['stream']:
+        info['bytes_in'] = int(response.headers.get('Content-Length') or 0)
+      else:
+        info['bytes_in'] = len(response.content)
+    request = getattr(response, 'request', None)
+    body = getattr(request, 'body', None)
+    if body is None and info['json'] is not None:
+      body = jsonlib.dumps(info['json'])
+    info['bytes_out'] = len(body) if body else 0
+    for hook in self.post_hooks:
+      hook(info)
+
+class RequestMetrics():
+  """Per-endpoint latency histograms, status code counters, bytes in/out,
+  retries, per-tenant time and the number of requests in flight
+
+  Register with add_to(instrumentation). Safe to share between threads.
+  """
+  def __init__(self, buckets=None):
+    self.buckets = list(buckets or LATENCY_BUCKETS)
+    self._lock = threading.Lock()
+    self.reset()
+
+  def reset(self):
+    """Drop everything recorded so far"""
+    with self._lock:
+      self.endpoints = {}
+      self.statuses = {}
+      self.tenants = {}
+      self.in_flight = 0
+      self.max_in_flight = 0
+
+  def add_to(self, instrumentation):
+    """Start recording the requests of an Instrumentation"""
+    instrumentation.add_hooks(pre_hook=self.pre_request, post_hook=self.post_request)
+
+  def remove_from(self, instrumentation):
+    """Stop recording"""
+    instrumentation.remove_hooks(pre_hook=self.pre_request, post_hook=self.post_request)
+
+  def pre_request(self, info):
+    with self._lock:
+      self.in_flight = self.in_flight + 1
+      self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+  def post_request(self, info):
+    elapsed = info['elapsed']
+    status = 'error' if info['status'] is None else str(info['status'])
+    endpoint_key = (info['method'], info['endpoint'])
+    tenant_key = (info['cluster'], info['tenant'] or '')
+    with self._lock:
+      # Hooks added while a request was in flight see its end without its start
+      self.in_flight = max(0, self.in_flight - 1)
+      endpoint = self.endpoints.get(endpoint_key)
+      if endpoint is None:
+        endpoint = {
+            'count': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'retries': 0,
+            'bytes_in': 0, 'bytes_out': 0, 'buckets': [0] * len(self.buckets)
+        }
+        self.endpoints[endpoint_key] = endpoint
+      endpoint['count'] = endpoint['count'] + 1
+      endpoint['seconds'] = endpoint['seconds'] + elapsed
+      endpoint['max_seconds'] = max(endpoint['max_seconds'], elapsed)
+      endpoint['bytes_in'] = endpoint['bytes_in'] + info['bytes_in']
+      endpoint['bytes_out'] = endpoint['bytes_out'] + info['bytes_out']
+      if info['attempt']:
+        endpoint['retries'] = endpoint['retries'] + 1
+      for position, bound in enumerate(self.buckets):
+        if elapsed <= bound:
+          endpoint['buckets'][position] = endpoint['buckets'][position] + 1
+          break
+      status_key = endpoint_key + (status,)
+      self.statuses[status_key] = self.statuses.get(status_key, 0) + 1
+      tenant = self.tenants.setdefault(tenant_key, {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+      tenant['count'] = tenant['count'] + 1
+      tenant['seconds'] = tenant['seconds'] + elapsed
+      tenant['max_seconds'] = max(tenant['max_seconds'], elapsed)
+
+  def get_stats(self):
+    """Copy of everything recorded, with totals"""
+    with self._lock:
+      endpoints = dict((key, dict(values, buckets=list(values['buckets'])))
+                       for key, values in self.endpoints.items())
+      total = {
+          'requests': sum(values['count'] for values in endpoints.values()),
+          'seconds': sum(values['seconds'] for values in endpoints.values()),
+          'retries': sum(values['retries'] for values in endpoints.values()),
+          'bytes_in': sum(values['bytes_in'] for values in endpoints.values()),
+          'bytes_out': sum(values['bytes_out'] for values in endpoints.values()),
+          'in_flight': self.in_flight,
+          'max_in_flight': self.max_in_flight
+      }
+      return {
+          'endpoints': endpoints,
+          'statuses': dict(self.statuses),
+          'tenants': dict((key, dict(values)) for key, values in self.tenants.items()),
+          'total': total
+      }
+
+  def slowest(self, by='endpoint', limit=10):
+    """[(key, stats)] of the endpoints or tenants that took the most time in total"""
+    stats = self.get_stats()['endpoints' if by == 'endpoint' else 'tenants']
+    return sorted(stats.items(), key=lambda item: item[1]['seconds'], reverse=True)[:limit]
+
+  def to_prometheus(self, prefix=METRIC_PREFIX):
+    """All metrics in the Prometheus text exposition format"""
+    stats = self.get_stats()
+    lines = [
+        "# HELP " + prefix + "_request_duration_seconds Duration of API requests",
+        "# TYPE " + prefix + "_request_duration_seconds histogram"
+    ]
+    for (method, endpoint), values in sorted(stats['endpoints'].items()):
+      labels = [('method', method), ('endpoint', endpoint)]
+      cumulative = 0
+      for bound, count in zip(self.buckets, values['buckets']):
+        cumulative = cumulative + count
+        lines.append(prefix + "_request_duration_seconds_bucket" +
+                     format_labels(labels + [('le', repr(bound))]) + " " + str(cumulative))
+      lines.append(prefix + "_request_duration_seconds_bucket" +
+                   format_labels(labels + [('le', "+Inf")]) + " " + str(values['count']))
+      lines.append(prefix + "_request_duration_seconds_sum" + format_labels(labels) + " " + repr(values['seconds']))
+      lines.append(prefix + "_request_duration_seconds_count" + format_labels(labels) + " " + str(values['count']))
+
+    lines.append("# HELP " + prefix + "_responses_total Responses by status code (error: no response)")
+    lines.append("# TYPE " + prefix + "_responses_total counter")
+    for (method, endpoint, status), count in sorted(stats['statuses'].items()):
+      lines.append(prefix + "_responses_total" +
+                   format_labels([('method', method), ('endpoint', endpoint), ('status', status)]) +
+                   " " + str(count))
+
+    for name, field, description in (
+        ('retries_total', 'retries', "Retried requests"),
+        ('received_bytes_total', 'bytes_in', "Response body bytes"),
+        ('sent_bytes_total', 'bytes_out', "Request body bytes")):
+      lines.append("# HELP " + prefix + "_" + name + " " + description)
+      lines.append("# TYPE " + prefix + "_" + name + " counter")
+      for (method, endpoint), values in sorted(stats['endpoints'].items()):
+        lines.append(prefix + "_" + name + format_labels([('method', method), ('endpoint', endpoint)]) +
+                     " " + str(values[field]))
+
+    lines.append("# HELP " + prefix + "_tenant_request_seconds_total Time spent in requests per tenant")
+    lines.append("# TYPE " + prefix + "_tenant_request_seconds_total counter")
+    for (cluster, tenant), values in sorted(stats['tenants'].items()):
+      lines.append(prefix + "_tenant_request_seconds_total" +
+                   format_labels([('cluster', cluster), ('tenant', tenant)]) + " " + repr(values['seconds']))
+    lines.append("# HELP " + prefix + "_tenant_requests_total Requests per tenant")
+    lines.append("# TYPE " + prefix + "_tenant_requests_total counter")
+    for (cluster, tenant), values in sorted(stats['tenants'].items()):
+      lines.append(prefix + "_tenant_requests_total" +
+                   format_labels([('cluster', cluster), ('tenant', tenant)]) + " " + str(values['count']))
+
+    lines.append("# HELP " + prefix + "_requests_in_flight Requests currently being sent")
+    lines.append("# TYPE " + prefix + "_requests_in_flight gauge")
+    lines.append(prefix + "_requests_in_flight " + str(stats['total']['in_flight']))
+    lines.append("# HELP " + prefix + "_requests_in_flight_max Most requests in flight at once")
+    lines.append("# TYPE " + prefix + "_requests_in_flight_max gauge")
+    lines.append(prefix + "_requests_in_flight_max " + str(stats['total']['max_in_flight']))
+    return "\n".join(lines) + "\n"
+
+  def write_prometheus(self, file_name, prefix=METRIC_PREFIX):
+    """Write the Prometheus text to a file atomically (e.g. for node_exporter's textfile collector)"""
+    temp_file_name = file_name + ".tmp"
+    with open(temp_file_name, 'w') as metrics_file:
+      metrics_file.write(self.to_prometheus(prefix=prefix))
+    os.replace(temp_file_name, file_name)
+
+  def summary(self, limit=10, wall_seconds=None):
+    """Readable report of the slowest endpoints and tenants"""
+    total = self.get_stats()['total']
+    lines = [
+        str(total['requests']) + " requests, " + ("%.3f" % total['seconds']) + " s in requests" +
+        ("" if wall_seconds is None else " (" + ("%.3f" % wall_seconds) + " s wall time)") + ", " +
+        str(total['retries']) + " retries, " +
+        ("%.1f" % (total['bytes_in'] / 1024.0)) + " KB received, " +
+        ("%.1f" % (total['bytes_out'] / 1024.0)) + " KB sent, " +
+        "max " + str(total['max_in_flight']) + " in flight"
+    ]
+    header = "total_s".rjust(10) + "count".rjust(8) + "mean_ms".rjust(10) + "max_ms".rjust(10) + "  "
+    for title, by in (("Slowest endpoints", 'endpoint'), ("Slowest tenants", 'tenant')):
+      lines.append("")
+      lines.append(title + ":")
+      lines.append(header + ("method endpoint" if by == 'endpoint' else "cluster tenant"))
+      for key, values in self.slowest(by=by, limit=limit):
+        lines.append(
+            ("%.3f" % values['seconds']).rjust(10) + str(values['count']).rjust(8) +
+            ("%.1f" % (values['seconds'] / values['count'] * 1000)).rjust(10) +
+            ("%.1f" % (values['max_seconds'] * 1000)).rjust(10) + "  " + " ".join(key)
+        )
+    return "\n".join(lines)
+
+INSTRUMENTATION = Instrumentation()
+METRICS = RequestMetrics()
+
+def add_hooks(pre_hook=None, post_hook=None):
+  """Register hooks called around every request of request_handler and aio.request_handler"""
+  INSTRUMENTATION.add_hooks(pre_hook=pre_hook, post_hook=post_hook)
+
+def remove_hooks(pre_hook=None, post_hook=None):
+  """Unregister hooks"""
+  INSTRUMENTATION.remove_hooks(pre_hook=pre_hook, post_hook=post_hook)
+
+def enable_metrics():
+  """Start recording into the shared METRICS (off by default)"""
+  METRICS.remove_from(INSTRUMENTATION)
+  METRICS.add_to(INSTRUMENTATION)
+  return METRICS
+
+def disable_metrics():
+  """Stop recording into the shared METRICS. What was recorded is kept"""
+  METRICS.remove_from(INSTRUMENTATION)
+
+def get_metrics():
+  """Everything recorded in the shared METRICS"""
+  return METRICS.get_stats()
+
+def reset_metrics():
+  """Drop everything recorded in the shared METRICS"""
+  METRICS.reset()
+
+def export_prometheus(file_name=None):
+  """Shared METRICS in the Prometheus text format. Written to file_name if given"""
+  if file_name is not None:
+    METRICS.write_prometheus(file_name)
+  return METRICS.to_prometheus()
+
+class MetricsServer(ThreadingMixIn, HTTPServer):
+  """HTTP server handling each request in a daemon thread (http.server.ThreadingHTTPServer before 3.7)"""
+  daemon_threads = True
+
+def start_metrics_server(port=DEFAULT_METRICS_PORT, address='127.0.0.1', metrics=None):
+  """Serve the metrics on http://address:port/metrics from a background thread
+
+  Returns the server. Call shutdown() on it to stop serving.
+  """
+  metrics = metrics or METRICS
+
+  class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+      if urlparse(self.path).path not in ('/', '/metrics'):
+        self.send_error(404)
+        return
+      body = metrics.to_prometheus().encode('utf-8')
+      self.send_response(200)
+      self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+      self.send_header('Content-Length', str(len(body)))
+      self.end_headers()
+      self.wfile.write(body)
+
+    def log_message(self, *args):
+      return
+
+  server = MetricsServer((address, port), MetricsHandler)
+  threading.Thread(target=server.serve_forever, daemon=True).start()
+  return server
+
+@contextmanager
+def profile(limit=10, output=None):
+  """Record the requests made in a block and print the slowest endpoints and tenants afterwards
+
+    with instrumentation.profile():
+      hosts.get_host_units_setwide(FULL_SET)
+
+  Yields the RequestMetrics of the block.
+  """
+  metrics = RequestMetrics()
+  metrics.add_to(INSTRUMENTATION)
+  start = time.perf_counter()
+  try:
+    yield metrics
+  finally:
+    metrics.remove_from(INSTRUMENTATION)
+    print(metrics.summary(limit=limit, wall_seconds=time.perf_counter() - start), file=output or sys.stdout)
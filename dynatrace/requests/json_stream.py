@@ -0,0 +1,215 @@
+"""Incremental parsing of large JSON array responses"""
+import codecs
+import json
+import re
+
+DEFAULT_CHUNK_SIZE = 65536
+WHITESPACE = ' \t\n\r'
+DELIMITERS = WHITESPACE + ',]'
+# Counting works on the raw body: UTF-8 multi-byte sequences never contain
+# ASCII bytes, so quotes and brackets can be found without decoding
+ESCAPED_CHARACTER = re.compile(rb'\\.', re.DOTALL)
+INNERMOST_CONTAINER = re.compile(rb'\{[^\[\]{}]*\}|\[[^\[\]{}]*\]')
+NON_WHITESPACE = re.compile(rb'[^ \t\n\r]')
+NOT_STRUCTURAL = bytes(byte for byte in range(256) if byte not in b'[]{},"')
+WHITESPACE_BYTES = b' \t\n\r'
+
+def reduce_structure(structure):
+  """Remove complete containers from brackets and commas until none is left"""
+  while True:
+    reduced = INNERMOST_CONTAINER.sub(b'', structure)
+    if reduced == structure:
+      return structure
+    structure = reduced
+
+class JsonArrayReader():
+  """Reads a streamed response holding a top-level JSON array, one element at a time
+
+  Only the current chunk and the element being decoded are kept in memory.
+  The response is closed when iteration finishes or the generator is closed.
+  With raw=True, (element, element JSON text) pairs are yielded.
+  """
+  def __init__(self, response, chunk_size=DEFAULT_CHUNK_SIZE, raw=False):
+    self.response = response
+    self.raw = raw
+    self.buffer = ''
+    self.pos = 0
+    self.eof = False
+    self._chunks = response.iter_content(chunk_size=chunk_size)
+    self._text_decoder = codecs.getincrementaldecoder('utf-8')()
+    self._decoder = json.JSONDecoder()
+
+  def fill(self):
+    """Replace the consumed part of the buffer with the next chunk. False at end of body"""
+    if self.eof:
+      return False
+    for chunk in self._chunks:
+      text = self._text_decoder.decode(chunk)
+      if text:
+        self.buffer = self.buffer[self.pos:] + text
+        self.pos = 0
+        return True
+    self.eof = True
+    self.buffer = self.buffer[self.pos:] + self._text_decoder.decode(b'', final=True)
+    self.pos = 0
+    return False
+
+  def next_char(self):
+    """Skip whitespace and return the next character, None at end of body"""
+    while True:
+      while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+        self.pos = self.pos + 1
+      if self.pos < len(self.buffer):
+        return self.buffer[self.pos]
+      if not self.fill() and self.pos >= len(self.buffer):
+        return None
+
+  def decode_element(self):
+    """Decode the element at the current position, reading more of the body as needed"""
+    while True:
+      try:
+        element, end = self._decoder.raw_decode(self.buffer, self.pos)
+        # Without a delimiter after it, the element may be a number cut off mid-chunk
+        if self.eof or (end < len(self.buffer) and self.buffer[end] in DELIMITERS):
+          start = self.pos
+          self.pos = end
+          if self.raw:
+            return element, self.buffer[start:end]
+          return element
+      except ValueError:
+        if self.eof:
+          raise Exception("Incomplete JSON element in response\n" + self.response.url)
+      self.fill()
+
+  def __iter__(self):
+    try:
+      if self.next_char() != '[':
+        raise Exception("Response is not a JSON array\n" + self.response.url)
+      self.pos = self.pos + 1
+      char = self.next_char()
+      if char == ']':
+        self.finish()
+        return
+      while True:
+        if char is None:
+          raise Exception("JSON array ended unexpectedly\n" + self.response.url)
+        if char in ',]':
+          raise Exception("Missing JSON array element\n" + self.response.url)
+        yield self.decode_element()
+        char = self.next_char()
+        if char == ']':
+          self.finish()
+          return
+        if char == ',':
+          self.pos = self.pos + 1
+          char = self.next_char()
+        elif char is not None:
+          raise Exception("Missing comma between JSON array elements\n" + self.response.url)
+    finally:
+      self.response.close()
+
+  def finish(self):
+    """Step over the closing bracket and check that only whitespace follows"""
+    self.pos = self.pos + 1
+    if self.next_char() is not None:
+      raise Exception("Unexpected content after the JSON array\n" + self.response.url)
+
+def iter_json_array(response, chunk_size=DEFAULT_CHUNK_SIZE, raw=False):
+  """Yield the elements of a streamed JSON array response one at a time"""
+  return iter(JsonArrayReader(response, chunk_size=chunk_size, raw=raw))
+
+class JsonArrayCounter():
+  """Counts the elements of a top-level JSON array fed in byte chunks, without decoding them
+
+  Escapes and strings are cut out, everything but brackets and commas is dropped,
+  then complete containers are removed until only the commas between
+  top-level elements and the still open containers are left. All of it
+  runs in regex and bytes operations, one pass per nesting level.
+  Scalars are never read, so malformed separators ("[1,]", "[1 2]") are
+  not detected; JsonArrayReader rejects them.
+  """
+  def __init__(self):
+    self.started = False
+    self.first_checked = False
+    self.has_elements = False
+    self.finished = False
+    self.commas = 0
+    self.string_tail = b''
+    self.open_structure = b''
+
+  def feed(self, chunk):
+    """Count the next chunk of the body"""
+    if self.finished:
+      if NON_WHITESPACE.search(chunk):
+        raise Exception("Unexpected content after the JSON array")
+      return
+    if not self.started:
+      match = NON_WHITESPACE.search(chunk)
+      if match is None:
+        return
+      if match.group() != b'[':
+        raise Exception("Response is not a JSON array")
+      self.started = True
+      chunk = chunk[match.end():]
+    if not self.first_checked:
+      match = NON_WHITESPACE.search(chunk)
+      if match is None:
+        return
+      self.first_checked = True
+      self.has_elements = match.group() != b']'
+
+    data = self.string_tail + chunk
+    # Escapes only occur in strings. Without them, every quote opens or closes
+    # a string, so splitting on quotes puts string contents at the odd positions
+    if b'\\' in data:
+      data = ESCAPED_CHARACTER.sub(b'', data)
+    parts = data.split(b'"')
+    if len(parts) % 2 == 0:
+      # A string continues in the next chunk. A lone backslash at the end pairs up with it
+      self.string_tail = b'"' + parts.pop()
+    else:
+      self.string_tail = b''
+    stripped = b''.join(parts[0::2])
+
+    structure = reduce_structure(self.open_structure + stripped.translate(None, NOT_STRUCTURAL))
+    end = structure.find(b']')
+    opener = min(
+        position for position in (structure.find(b'{'), structure.find(b'['), len(structure))
+        if position != -1
+    )
+    if end != -1 and end < opener:
+      # The top-level array closed. Containers and strings after it are gone
+      # from structure, so check that its bracket is the last thing in the chunk
+      closed = stripped.rstrip(WHITESPACE_BYTES)[:-1].translate(None, NOT_STRUCTURAL)
+      if structure[end + 1:] or self.string_tail or \
+          not parts[-1].rstrip(WHITESPACE_BYTES).endswith(b']') or \
+          reduce_structure(self.open_structure + closed).strip(b','):
+        raise Exception("Unexpected content after the JSON array")
+      self.commas = self.commas + structure.count(b',', 0, end)
+      self.finished = True
+      self.open_structure = b''
+      return
+    self.commas = self.commas + structure.count(b',', 0, opener)
+    self.open_structure = structure[opener:]
+
+  def result(self):
+    """Number of elements, once the whole body was fed"""
+    if not self.finished:
+      raise Exception("JSON array ended unexpectedly")
+    return self.commas + 1 if self.has_elements else 0
+
+def count_json_array_chunks(chunks):
+  """Count the elements of a top-level JSON array given as byte chunks"""
+  counter = JsonArrayCounter()
+  for chunk in chunks:
+    counter.feed(chunk)
+  return counter.result()
+
+def count_json_array(response, chunk_size=DEFAULT_CHUNK_SIZE):
+  """Count the elements of a streamed JSON array response without building them"""
+  try:
+    return count_json_array_chunks(response.iter_content(chunk_size=chunk_size))
+  except Exception as error:
+    raise Exception(str(error) + "\n" + response.url)
+  finally:
+    response.close()
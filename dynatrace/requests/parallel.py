@@ -0,0 +1,70 @@
+"""Bounded Worker Pool for fanning requests out over tenants and clusters"""
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_MAX_WORKERS = 8
+
+def run_parallel(function, items, max_workers=None):
+  """Call function(item) for every item on a bounded pool. Results keep item order"""
+  items = list(items)
+  workers = min(max_workers or DEFAULT_MAX_WORKERS, len(items))
+  if workers <= 1:
+    return [function(item) for item in items]
+  with ThreadPoolExecutor(max_workers=workers) as executor:
+    return list(executor.map(function, items))
+
+def run_parallel_collect(function, items, max_workers=None):
+  """Like run_parallel, but failures are collected per item instead of raised
+
+  Returns (results, failures). results has None where a call failed and
+  failures maps the position of each failed item to its exception.
+  """
+  failures = {}
+  def call(position_item):
+    try:
+      return function(position_item[1])
+    except Exception as error:
+      failures[position_item[0]] = error
+      return None
+  results = run_parallel(call, list(enumerate(items)), max_workers=max_workers)
+  return results, failures
+
+def map_clusterwide(cluster, function, max_workers=None):
+  """Call function(tenant) for every tenant in a cluster. Returns {tenant: result}"""
+  tenants = list(cluster['tenant'])
+  results = run_parallel(function, tenants, max_workers=max_workers)
+  return dict(zip(tenants, results))
+
+def map_setwide(full_set, function, max_workers=None):
+  """Call function(cluster, tenant) for every tenant of every cluster on one pool
+
+  Returns {cluster_name: {tenant: result}} in the order of full_set
+  """
+  pairs = []
+  for cluster_name, cluster in full_set.items():
+    for tenant in cluster['tenant']:
+      pairs.append((cluster_name, tenant))
+  results = run_parallel(
+      lambda pair: function(full_set[pair[0]], pair[1]),
+      pairs,
+      max_workers=max_workers
+  )
+  set_results = {}
+  for cluster_name in full_set:
+    set_results[cluster_name] = {}
+  for (cluster_name, tenant), result in zip(pairs, results):
+    set_results[cluster_name][tenant] = result
+  return set_results
+
+def fold_clusterwide(results, function, initial):
+  """Fold {tenant: result} into one value in tenant order"""
+  total = initial
+  for result in results.values():
+    total = function(total, result)
+  return total
+
+def fold_setwide(results, function, initial):
+  """Fold {cluster: {tenant: result}} into one value in cluster/tenant order"""
+  total = initial
+  for tenant_results in results.values():
+    total = fold_clusterwide(tenant_results, function, total)
+  return total
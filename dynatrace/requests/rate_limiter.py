@@ -0,0 +1,197 @@
+"""Client-side Rate Limiting and Retries for the Dynatrace API"""
+import random
+import threading
+import time
+
+# Dynatrace reports its quota as X-RateLimit-Limit requests per period
+RATE_LIMIT_PERIOD = 60
+RETRY_STATUS_CODES = [429, 502, 503, 504]
+IDEMPOTENT_METHODS = ['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE']
+
+class TokenBucket():
+  """Token bucket that hands out the delay needed before the next request"""
+  def __init__(self, rate=None, capacity=None):
+    self.rate = rate
+    self.capacity = capacity if capacity else (rate if rate else 1)
+    self.tokens = self.capacity
+    self.blocked_until = 0.0
+    self._last = time.monotonic()
+    self._lock = threading.Lock()
+
+  def set_rate(self, rate, capacity=None):
+    """Change refill rate (tokens per second). None disables the bucket"""
+    with self._lock:
+      self._refill()
+      self.rate = rate
+      self.capacity = capacity if capacity else (rate if rate else 1)
+      self.tokens = min(self.tokens, self.capacity)
+
+  def block_for(self, seconds):
+    """Hold every request in this bucket for a number of seconds"""
+    with self._lock:
+      self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+  def reserve(self):
+    """Take a token and return how many seconds to wait before using it"""
+    with self._lock:
+      now = time.monotonic()
+      delay = max(0.0, self.blocked_until - now)
+      if self.rate:
+        self._refill()
+        self.tokens = self.tokens - 1
+        if self.tokens < 0:
+          delay = max(delay, -self.tokens / self.rate)
+      return delay
+
+  def _refill(self):
+    now = time.monotonic()
+    if self.rate:
+      self.tokens = min(self.capacity, self.tokens + (now - self._last) * self.rate)
+    self._last = now
+
+class RateLimiter():
+  """Separate token buckets per cluster API and per tenant API, with retry policy"""
+  def __init__(self, tenant_rate=None, cluster_rate=None, max_retries=5,
+               backoff_base=0.5, backoff_max=30.0, learn_from_headers=True):
+    self.tenant_rate = tenant_rate
+    self.cluster_rate = cluster_rate
+    self.max_retries = max_retries
+    self.backoff_base = backoff_base
+    self.backoff_max = backoff_max
+    self.learn_from_headers = learn_from_headers
+    self._buckets = {}
+    self._stats = {}
+    self._lock = threading.Lock()
+
+  def get_bucket(self, key):
+    """Get (or create) the bucket for a key made by bucket_key"""
+    with self._lock:
+      bucket = self._buckets.get(key)
+      if bucket is None:
+        bucket = TokenBucket(self.cluster_rate if key[1] is None else self.tenant_rate)
+        self._buckets[key] = bucket
+        self._stats[key] = {'requests': 0, 'throttled': 0, 'retries': 0, 'wait_seconds': 0.0}
+      return bucket
+
+  def reserve(self, key):
+    """Count a request and return how long it has to wait (for async callers)"""
+    delay = self.get_bucket(key).reserve()
+    if delay > 0:
+      self._count(key, 'wait_seconds', delay)
+    self._count(key, 'requests')
+    return delay
+
+  def acquire(self, key):
+    """Block until the bucket allows another request"""
+    delay = self.reserve(key)
+    if delay > 0:
+      time.sleep(delay)
+
+  def update(self, key, response):
+    """Adjust the bucket from X-RateLimit-* and Retry-After headers"""
+    bucket = self.get_bucket(key)
+    headers = response.headers
+    if response.status_code == 429:
+      self._count(key, 'throttled')
+    if self.learn_from_headers and 'X-RateLimit-Limit' in headers:
+      try:
+        limit = float(headers['X-RateLimit-Limit'])
+      except ValueError:
+        limit = 0
+      if limit > 0 and bucket.rate != limit / RATE_LIMIT_PERIOD:
+        bucket.set_rate(limit / RATE_LIMIT_PERIOD, capacity=max(1.0, limit / RATE_LIMIT_PERIOD))
+    wait = None
+    if response.status_code == 429 or headers.get('X-RateLimit-Remaining') == '0':
+      wait = parse_wait_seconds(headers)
+    if wait:
+      bucket.block_for(wait)
+
+  def should_retry(self, method, response, attempt):
+    """Retry throttled calls, and server errors only for idempotent methods"""
+    if attempt >= self.max_retries or response.status_code not in RETRY_STATUS_CODES:
+      return False
+    return response.status_code == 429 or str(method).upper() in IDEMPOTENT_METHODS
+
+  def retry_delay(self, key, response, attempt):
+    """Seconds to wait before a retry: server hint if given, else jittered backoff"""
+    self._count(key, 'retries')
+    wait = parse_wait_seconds(response.headers)
+    backoff = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+    if wait is not None:
+      return wait + random.uniform(0, self.backoff_base)
+    return backoff
+
+  def configure(self, tenant_rate=None, cluster_rate=None, max_retries=None,
+                backoff_base=None, backoff_max=None, learn_from_headers=None):
+    """Change limits. Rates are requests per second, None leaves a value unchanged"""
+    with self._lock:
+      if tenant_rate is not None:
+        self.tenant_rate = tenant_rate
+      if cluster_rate is not None:
+        self.cluster_rate = cluster_rate
+      if max_retries is not None:
+        self.max_retries = max_retries
+      if backoff_base is not None:
+        self.backoff_base = backoff_base
+      if backoff_max is not None:
+        self.backoff_max = backoff_max
+      if learn_from_headers is not None:
+        self.learn_from_headers = learn_from_headers
+      buckets = list(self._buckets.items())
+    for key, bucket in buckets:
+      bucket.set_rate(self.cluster_rate if key[1] is None else self.tenant_rate)
+
+  def get_stats(self):
+    """Return request/throttle/retry counters per bucket plus a total"""
+    with self._lock:
+      stats = {}
+      total = {'requests': 0, 'throttled': 0, 'retries': 0, 'wait_seconds': 0.0}
+      for key, counters in self._stats.items():
+        stats[key] = dict(counters)
+        for counter, value in counters.items():
+          total[counter] = total[counter] + value
+      stats['total'] = total
+      return stats
+
+  def reset_stats(self):
+    """Zero all counters"""
+    with self._lock:
+      for counters in self._stats.values():
+        for counter in counters:
+          counters[counter] = 0
+
+  def _count(self, key, counter, amount=1):
+    with self._lock:
+      self._stats[key][counter] = self._stats[key][counter] + amount
+
+def bucket_key(cluster, tenant=None):
+  """Bucket key for a cluster API (tenant=None) or a tenant API"""
+  return (cluster['url'], tenant)
+
+def parse_wait_seconds(headers):
+  """Seconds to wait from Retry-After or X-RateLimit-Reset (microseconds since epoch)"""
+  if 'Retry-After' in headers:
+    try:
+      return max(0.0, float(headers['Retry-After']))
+    except ValueError:
+      pass
+  if 'X-RateLimit-Reset' in headers:
+    try:
+      return max(0.0, float(headers['X-RateLimit-Reset']) / 1000000 - time.time())
+    except ValueError:
+      pass
+  return None
+
+RATE_LIMITER = RateLimiter()
+
+def configure(**kwargs):
+  """Configure the shared rate limiter used by request_handler"""
+  RATE_LIMITER.configure(**kwargs)
+
+def get_stats():
+  """Request, throttle and retry counts of the shared rate limiter"""
+  return RATE_LIMITER.get_stats()
+
+def reset_stats():
+  """Zero the counters of the shared rate limiter"""
+  RATE_LIMITER.reset_stats()
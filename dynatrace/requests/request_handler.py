@@ -1,45 +1,118 @@
 """Make API Request to available Dynatrace API"""
-import warnings
 import contextlib
+import threading
+import time
+import warnings
 import requests
+from requests.adapters import HTTPAdapter
 from urllib3.exceptions import InsecureRequestWarning
+from dynatrace.requests import instrumentation
+from dynatrace.requests import rate_limiter
 
 HTTPS_STR = "https://"
 CLUSTER_V1_PATH = "/api/v1.0/onpremise/"
 ENV_API_V1 = "/api/v1/"
 CONFIG_API_V1 = "/api/config/v1/"
 
-OLD_MERGE_ENVIRONMENT_SETTINGS = requests.Session.merge_environment_settings
-
-@contextlib.contextmanager
-def no_ssl_verification():
-  """Silence Request Warning for Unchecked SSL"""
-  opened_adapters = set()
-
-  def merge_environment_settings(self, url, proxies, stream, verify, cert):
-    # Verification happens only once per connection so we need to close
-    # all the opened adapters once we're done. Otherwise, the effects of
-    # verify=False persist beyond the end of this context manager.
-    opened_adapters.add(self.get_adapter(url))
-
-    settings = OLD_MERGE_ENVIRONMENT_SETTINGS(self, url, proxies, stream, verify, cert)
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 10
+
+class SessionRegistry():
+  """Thread-safe registry of keep-alive sessions, one per cluster API or tenant API"""
+  def __init__(self, pool_connections=DEFAULT_POOL_CONNECTIONS, pool_maxsize=DEFAULT_POOL_MAXSIZE):
+    self.pool_connections = pool_connections
+    self.pool_maxsize = pool_maxsize
+    self._sessions = {}
+    self._lock = threading.Lock()
+
+  def get_session(self, cluster, tenant=None):
+    """Return the pooled session for a cluster (tenant=None) or one of its tenants"""
+    verify = cluster.get('verify_ssl', True)
+    key = (cluster['url'], tenant, verify)
+    with self._lock:
+      session = self._sessions.get(key)
+      if session is None:
+        session = self._create_session(verify)
+        self._sessions[key] = session
+      return session
+
+  def configure(self, pool_connections=None, pool_maxsize=None):
+    """Change pool sizes. Open sessions are closed and rebuilt on next use"""
+    with self._lock:
+      if pool_connections is not None:
+        self.pool_connections = pool_connections
+      if pool_maxsize is not None:
+        self.pool_maxsize = pool_maxsize
+      self._close_sessions()
+
+  def close_all(self):
+    """Close every pooled session and its connections"""
+    with self._lock:
+      self._close_sessions()
+
+  def _close_sessions(self):
+    for session in self._sessions.values():
+      session.close()
+    self._sessions = {}
+
+  def _create_session(self, verify):
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=self.pool_connections,
+        pool_maxsize=self.pool_maxsize
+    )
+    session.mount(HTTPS_STR, adapter)
+    session.verify = verify
+    return session
+
+_SESSIONS = SessionRegistry()
+
+class InsecureWarningFilter():
+  """Ignore InsecureRequestWarning only while unverified requests are in flight
+
+  catch_warnings restores the filters it saved on entry, so overlapping
+  uses from several threads could leave the filter installed for good.
+  Here the first unverified request installs it and the last one removes it.
+  """
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._active = 0
+    self._catcher = None
+
+  @contextlib.contextmanager
+  def suppress(self, active=True):
+    """Context in which the warning is ignored, if active"""
+    if not active:
+      yield
+      return
+    with self._lock:
+      if not self._active:
+        self._catcher = warnings.catch_warnings()
+        self._catcher.__enter__()
+        warnings.simplefilter('ignore', InsecureRequestWarning)
+      self._active = self._active + 1
+    try:
+      yield
+    finally:
+      with self._lock:
+        self._active = self._active - 1
+        if not self._active:
+          self._catcher.__exit__(None, None, None)
+          self._catcher = None
 
-    return settings
+_INSECURE_WARNINGS = InsecureWarningFilter()
 
-  requests.Session.merge_environment_settings = merge_environment_settings
+def get_session(cluster, tenant=None):
+  """Get the pooled session used for a cluster (tenant=None) or tenant"""
+  return _SESSIONS.get_session(cluster, tenant)
 
-  try:
-    with warnings.catch_warnings():
-      warnings.simplefilter('ignore', InsecureRequestWarning)
-      yield
-  finally:
-    requests.Session.merge_environment_settings = OLD_MERGE_ENVIRONMENT_SETTINGS
+def configure_session_pool(pool_connections=None, pool_maxsize=None):
+  """Set the connection pool sizes used for every session"""
+  _SESSIONS.configure(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
 
-    for adapter in opened_adapters:
-      try:
-        adapter.close()
-      except Exception:
-        pass
+def close_sessions():
+  """Close all pooled sessions (e.g. at the end of a script)"""
+  _SESSIONS.close_all()
 
 def check_response(response):
   """Checks if the Reponse has a Successful Status Code"""
@@ -67,234 +140,120 @@ def generate_tenant_url(cluster, tenant):
     url = url + cluster['tenant'][tenant] + "." + cluster['url']
   return url
 
-def cluster_get(cluster, endpoint, params=None):
-  """Get Request to Cluster API"""
+def make_api_call(cluster, method, url, tenant=None, params=None, json=None, stream=False):
+  """Send a request through the pooled session for the cluster/tenant
+
+  With stream=True the body is not read up front. The caller must read it
+  completely or close the response so the connection goes back to the pool.
+  """
+  session = get_session(cluster, tenant)
+  limiter = rate_limiter.RATE_LIMITER
+  limiter_key = rate_limiter.bucket_key(cluster, tenant)
+  attempt = 0
+  while True:
+    limiter.acquire(limiter_key)
+    info = instrumentation.INSTRUMENTATION.before_request(
+        cluster, tenant, method, url, attempt, stream=stream, json=json
+    )
+    try:
+      # verify is passed per request as well, since a session-level value loses to
+      # REQUESTS_CA_BUNDLE/CURL_CA_BUNDLE when requests merges environment settings
+      with _INSECURE_WARNINGS.suppress(not session.verify):
+        response = session.request(
+            method,
+            url,
+            params=params,
+            json=json,
+            verify=session.verify,
+            stream=stream
+        )
+    except Exception as error:
+      instrumentation.INSTRUMENTATION.after_request(info, error=error)
+      raise
+    instrumentation.INSTRUMENTATION.after_request(info, response=response)
+    limiter.update(limiter_key, response)
+    if not limiter.should_retry(method, response, attempt):
+      break
+    response.close()
+    time.sleep(limiter.retry_delay(limiter_key, response, attempt))
+    attempt = attempt + 1
+  check_response(response)
+  return response
+
+def cluster_api_call(cluster, method, endpoint, params=None, json=None):
+  """Request to Cluster API"""
   check_managed(cluster["is_managed"])
 
-  if not params:
-    params = {}
-
-  endpoint = sanitize_endpoint(endpoint)
-
-  with no_ssl_verification():
-    params['Api-Token'] = cluster['cluster_token']
-    
-    response = requests.get(
-        HTTPS_STR + cluster['url'] + CLUSTER_V1_PATH + endpoint,
-        params=params,
-        verify=(True if "verify_ssl" not in cluster else cluster ["verify_ssl"])
-    )
-    check_response(response)
-    return response
+  params = dict(params) if params else {}
+  params['Api-Token'] = cluster['cluster_token']
+
+  return make_api_call(
+      cluster,
+      method,
+      HTTPS_STR + cluster['url'] + CLUSTER_V1_PATH + sanitize_endpoint(endpoint),
+      params=params,
+      json=json
+  )
+
+def tenant_api_call(cluster, tenant, method, api_path, endpoint, params=None, json=None, stream=False):
+  """Request to Tenant Environment or Configuration API"""
+  params = dict(params) if params else {}
+  params['Api-Token'] = cluster['api_token'][tenant]
+
+  return make_api_call(
+      cluster,
+      method,
+      generate_tenant_url(cluster, tenant) + api_path + sanitize_endpoint(endpoint),
+      tenant=tenant,
+      params=params,
+      json=json,
+      stream=stream
+  )
 
+def cluster_get(cluster, endpoint, params=None):
+  """Get Request to Cluster API"""
+  return cluster_api_call(cluster, "GET", endpoint, params=params)
 
 def cluster_post(cluster, endpoint, params=None, json=None):
   """Post Request to Cluster API"""
-  check_managed(cluster["is_managed"])
-
-  if not params:
-    params = {}
-
-  endpoint = sanitize_endpoint(endpoint)
-
-  with no_ssl_verification():
-    params['Api-Token'] = cluster['cluster_token']
-
-    response =  requests.post(
-        HTTPS_STR + cluster['url'] + CLUSTER_V1_PATH + endpoint,
-        params=params,
-        json=json,
-        verify=(True if "verify_ssl" not in cluster else cluster ["verify_ssl"])
-    )
-    check_response(response)
-    return response
+  return cluster_api_call(cluster, "POST", endpoint, params=params, json=json)
 
 def cluster_put(cluster, endpoint, params=None, json=None):
   """Post Request to Cluster API"""
-  check_managed(cluster["is_managed"])
-
-  if not params:
-    params = {}
-  
-  endpoint = sanitize_endpoint(endpoint)
-
-  with no_ssl_verification():
-    params['Api-Token'] = cluster['cluster_token']
-
-    response =  requests.put(
-        HTTPS_STR + cluster['url'] + CLUSTER_V1_PATH + endpoint,
-        params=params,
-        json=json,
-        verify=(True if "verify_ssl" not in cluster else cluster ["verify_ssl"])
-    )
-    check_response(response)
-    return response
+  return cluster_api_call(cluster, "PUT", endpoint, params=params, json=json)
 
 def cluster_delete(cluster, endpoint, params=None, json=None):
   """Delete Request to Cluster API"""
-  check_managed(cluster["is_managed"])
-
-  if not params:
-    params = {}
-
-  endpoint = sanitize_endpoint(endpoint)
-
-  with no_ssl_verification():
-    params['Api-Token'] = cluster['cluster_token']
-    response =  requests.delete(
-        HTTPS_STR + cluster['url'] + CLUSTER_V1_PATH + endpoint,
-        params=params,
-        json=json,
-        verify=(True if "verify_ssl" not in cluster else cluster ["verify_ssl"])
-    )
-    check_response(response)
-    return response
+  return cluster_api_call(cluster, "DELETE", endpoint, params=params, json=json)
 
-def env_get(cluster, tenant, endpoint, params=None):
+def env_get(cluster, tenant, endpoint, params=None, stream=False):
   """Get Request to Tenant Environment API"""
-  if not params:
-    params = {}
-
-  endpoint = sanitize_endpoint(endpoint)
-
-  with no_ssl_verification():
-    params['Api-Token'] = cluster['api_token'][tenant]
-    response = requests.get(
-        generate_tenant_url(cluster, tenant) + ENV_API_V1 + endpoint,
-        params=params,
-        verify=(True if "verify_ssl" not in cluster else cluster ["verify_ssl"])
-    )
-    check_response(response)
-    return response
+  return tenant_api_call(cluster, tenant, "GET", ENV_API_V1, endpoint, params=params, stream=stream)
 
 def env_post(cluster, tenant, endpoint, params=None, json=None):
   """Post Request to Tenant Environment API"""
-  if not params:
-    params = {}
-
-    endpoint = sanitize_endpoint(endpoint)
-
-  with no_ssl_verification():
-    params['Api-Token'] = cluster['api_token'][tenant]
-
-    response = requests.post(
-        generate_tenant_url(cluster, tenant) + ENV_API_V1 + endpoint,
-        params=params,
-        verify=(True if "verify_ssl" not in cluster else cluster ["verify_ssl"]),
-        json=json
-    )
-    check_response(response)
-    return response
+  return tenant_api_call(cluster, tenant, "POST", ENV_API_V1, endpoint, params=params, json=json)
 
 def env_put(cluster, tenant, endpoint, params=None, json=None):
   """Post Request to Tenant Environment API"""
-  if not params:
-    params = {}
-
-  endpoint = sanitize_endpoint(endpoint)
-
-  with no_ssl_verification():
-    params['Api-Token'] = cluster['api_token'][tenant]
-
-    response = requests.put(
-        generate_tenant_url(cluster, tenant) + ENV_API_V1 + endpoint,
-        params=params,
-        verify=(True if "verify_ssl" not in cluster else cluster ["verify_ssl"]),
-        json=json
-    )
-    check_response(response)
-    return response
+  return tenant_api_call(cluster, tenant, "PUT", ENV_API_V1, endpoint, params=params, json=json)
 
 def env_delete(cluster, tenant, endpoint, params=None):
   """Get Request to Tenant Environment API"""
-  if not params:
-    params = {}
-
-  endpoint = sanitize_endpoint(endpoint)
-
-  with no_ssl_verification():
-    params['Api-Token'] = cluster['api_token'][tenant]
-    response = requests.delete(
-        generate_tenant_url(cluster, tenant) + ENV_API_V1 + endpoint,
-        params=params,
-        verify=(True if "verify_ssl" not in cluster else cluster ["verify_ssl"])
-    )
-    check_response(response)
-    return response
-
+  return tenant_api_call(cluster, tenant, "DELETE", ENV_API_V1, endpoint, params=params)
 
 def config_get(cluster, tenant, endpoint, params=None, json=None):
   """Get Request to Tenant Configuration API"""
-  if not params:
-    params = {}
-
-  endpoint = sanitize_endpoint(endpoint)
-
-  with no_ssl_verification():
-    params['Api-Token'] = cluster['api_token'][tenant]
-
-    response = requests.get(
-        generate_tenant_url(cluster, tenant) + CONFIG_API_V1 + endpoint,
-        params=params,
-        verify=(True if "verify_ssl" not in cluster else cluster ["verify_ssl"]),
-        json=json
-    )
-    check_response(response)
-    return response
+  return tenant_api_call(cluster, tenant, "GET", CONFIG_API_V1, endpoint, params=params, json=json)
 
 def config_post(cluster, tenant, endpoint, params=None, json=None):
   """Post Request to Tenant Configuration API"""
-  if not params:
-    params = {}
-
-  endpoint = sanitize_endpoint(endpoint)
-
-  with no_ssl_verification():
-    params['Api-Token'] = cluster['api_token'][tenant]
-
-    response = requests.post(
-        generate_tenant_url(cluster, tenant) + CONFIG_API_V1 + endpoint,
-        params=params,
-        verify=(True if "verify_ssl" not in cluster else cluster ["verify_ssl"]),
-        json=json
-    )
-    check_response(response)
-    return response
+  return tenant_api_call(cluster, tenant, "POST", CONFIG_API_V1, endpoint, params=params, json=json)
 
 def config_put(cluster, tenant, endpoint, params=None, json=None):
   """Put Request to Tenant Configuration API"""
-  if not params:
-    params = {}
-
-  endpoint = sanitize_endpoint(endpoint)
-
-  with no_ssl_verification():
-    params['Api-Token'] = cluster['api_token'][tenant]
-
-    response = requests.put(
-        generate_tenant_url(cluster, tenant) + CONFIG_API_V1 + endpoint,
-        params=params,
-        verify=(True if "verify_ssl" not in cluster else cluster ["verify_ssl"]),
-        json=json
-    )
-    check_response(response)
-    return response
+  return tenant_api_call(cluster, tenant, "PUT", CONFIG_API_V1, endpoint, params=params, json=json)
 
 def config_delete(cluster, tenant, endpoint, params=None, json=None):
   """Delete Request to Tenant Configuration API"""
-  if not params:
-    params = {}
-
-  endpoint = sanitize_endpoint(endpoint)
-
-  with no_ssl_verification():
-    params['Api-Token'] = cluster['api_token'][tenant]
-
-    response = requests.delete(
-        generate_tenant_url(cluster, tenant) + CONFIG_API_V1 + endpoint,
-        params=params,
-        verify=(True if "verify_ssl" not in cluster else cluster ["verify_ssl"]),
-        json=json
-    )
-    check_response(response)
-    return response
+  return tenant_api_call(cluster, tenant, "DELETE", CONFIG_API_V1, endpoint, params=params, json=json)
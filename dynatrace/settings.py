@@ -0,0 +1,109 @@
+"""Lazy, cached loading of variable sets (user_variables.py and variable_sets/*.py)
+
+Modules that need FULL_SET, USER_GROUPS, USER_GROUP_TEMPLATE or
+DEFAULT_TIMEZONE resolve them at call time through get_variables, so
+importing them does not need a user_variables file. Several sets can be
+used in one process, e.g. get_variables('prod') and get_variables('nonprod').
+"""
+import importlib
+import importlib.util
+import os
+import threading
+
+# None stands for the user_variables module, as copied in by change_variables.py
+DEFAULT_SET_NAME = None
+USER_VARIABLES_MODULE = "user_variables"
+VARIABLE_SETS_DIRECTORY = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "variable_sets"
+)
+
+class VariableSet():
+  """The variables of one set. The file is only loaded when a variable is first read"""
+  def __init__(self, name=None, file_name=None):
+    self.name = name
+    self.file_name = file_name
+    self._module = None
+    self._lock = threading.Lock()
+
+  def __repr__(self):
+    return "VariableSet(" + repr(self.name or USER_VARIABLES_MODULE) + ")"
+
+  def __getattr__(self, key):
+    if key.startswith('_'):
+      raise AttributeError(key)
+    return getattr(self.load(), key)
+
+  def load(self):
+    """Load (once) and return the module holding the variables"""
+    if self._module is None:
+      with self._lock:
+        if self._module is None:
+          self._module = self._import()
+    return self._module
+
+  def _import(self):
+    if self.file_name is None:
+      return importlib.import_module(USER_VARIABLES_MODULE)
+    if not os.path.exists(self.file_name):
+      raise Exception("Variable set " + str(self.name) + " not found: " + self.file_name)
+    # Loaded under its own name and not put in sys.modules, so sets do not replace each other
+    spec = importlib.util.spec_from_file_location("variable_set_" + str(self.name), self.file_name)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+  def get(self, key, default=None):
+    """A variable of the set, default if the set does not define it"""
+    return getattr(self.load(), key, default)
+
+_SETS = {}
+_SETS_LOCK = threading.Lock()
+_DEFAULT = {'name': DEFAULT_SET_NAME}
+
+def get_set_file(name, directory=None):
+  """File of a named set: a path to a .py file as given, else <directory>/<name>.py"""
+  if name.endswith(".py"):
+    return os.path.abspath(name)
+  return os.path.join(directory or VARIABLE_SETS_DIRECTORY, name + ".py")
+
+def get_variable_set(name=None, directory=None):
+  """The cached VariableSet of a name (None: the default set)"""
+  if name is None:
+    name = _DEFAULT['name']
+  file_name = None if name is None else get_set_file(name, directory)
+  with _SETS_LOCK:
+    variable_set = _SETS.get(file_name)
+    if variable_set is None:
+      variable_set = VariableSet(name, file_name)
+      _SETS[file_name] = variable_set
+    return variable_set
+
+def get_variables(variables=None):
+  """Resolve the variables argument of a function
+
+  None gives the default set, a string the named set (see get_set_file).
+  Anything else (a VariableSet, a module or an object with the variables
+  as attributes) is returned as is.
+  """
+  if variables is None or isinstance(variables, str):
+    return get_variable_set(variables)
+  return variables
+
+def set_default_variable_set(name=None):
+  """Make a named set the default for calls without variables. None goes back to user_variables"""
+  _DEFAULT['name'] = name
+
+def clear_cache():
+  """Forget loaded sets, so changed files are read again on next use"""
+  with _SETS_LOCK:
+    _SETS.clear()
+
+def list_variable_sets(directory=None):
+  """Names of the sets in the variable_sets directory"""
+  directory = directory or VARIABLE_SETS_DIRECTORY
+  if not os.path.isdir(directory):
+    return []
+  return sorted(
+      file_name[:-3] for file_name in os.listdir(directory)
+      if file_name.endswith(".py") and not file_name.startswith("_")
+  )
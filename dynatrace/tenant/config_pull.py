@@ -0,0 +1,199 @@
+"""Incremental Pull of Configuration API items to local JSON files"""
+import hashlib
+import json
+import os
+from dynatrace.requests import request_handler as rh
+from dynatrace.requests import parallel
+
+MANIFEST_FILE = ".manifest.json"
+
+class ConfigPullError(Exception):
+  """Raised at the end of a pull when some items could not be fetched"""
+  def __init__(self, failures, file_list):
+    self.failures = failures
+    self.file_list = file_list
+    super().__init__(
+        "Could not pull " + str(len(failures)) + " item(s): " + ", ".join(sorted(failures))
+    )
+
+def fetch_details(cluster, tenant, endpoint, item_ids, max_workers=None):
+  """Fetch the details of many items concurrently
+
+  Returns (details, failures): details follows the order of item_ids with
+  None for items that failed, failures maps item id to the error message.
+  """
+  endpoint = endpoint.rstrip('/') + '/'
+  item_ids = [str(item_id) for item_id in item_ids]
+  details, errors = parallel.run_parallel_collect(
+      lambda item_id: rh.config_get(cluster, tenant, endpoint + item_id).json(),
+      item_ids,
+      max_workers=max_workers
+  )
+  failures = {}
+  for position, error in errors.items():
+    failures[item_ids[position]] = str(error)
+  return details, failures
+
+def pull_to_files(cluster, tenant, endpoint, file_name_function, ignore_disabled=True, max_workers=None):
+  """List a Configuration API endpoint and write every item's details to files
+
+  Details are fetched concurrently, files are written in list order.
+  Raises ConfigPullError after writing when some items failed.
+  """
+  item_list = rh.config_get(cluster, tenant, endpoint).json()['values']
+  details, failures = fetch_details(
+      cluster,
+      tenant,
+      endpoint,
+      [item['id'] for item in item_list],
+      max_workers=max_workers
+  )
+  file_list = []
+  for position, (list_item, item_json) in enumerate(zip(item_list, details)):
+    if item_json is None:
+      continue
+    if item_json['enabled'] or not ignore_disabled:
+      item_json.pop("metadata", None)
+      item_json.pop("id", None)
+      file_name = file_name_function(item_json, position)
+      with open(file_name, 'w') as current_file:
+        json.dump(item_json, current_file, indent=2)
+      file_list.append(file_name)
+  if failures:
+    raise ConfigPullError(failures, file_list)
+  return file_list
+
+def hash_json(json_data):
+  """Stable content hash of a JSON-serializable value"""
+  canonical = json.dumps(json_data, sort_keys=True, separators=(',', ':'))
+  return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+def load_manifest(directory, cluster, tenant):
+  """Load the manifest of a pull directory. Pulls from another tenant start empty"""
+  try:
+    with open(os.path.join(directory, MANIFEST_FILE), 'r') as manifest_file:
+      manifest = json.load(manifest_file)
+  except (IOError, ValueError):
+    manifest = None
+  if not manifest or manifest.get('source') != [cluster['url'], tenant]:
+    manifest = {'source': [cluster['url'], tenant], 'items': {}}
+  return manifest
+
+def write_json_file(file_name, json_data):
+  """Write a JSON file atomically so an interrupted pull leaves no partial files"""
+  temp_file_name = file_name + ".tmp"
+  with open(temp_file_name, 'w') as current_file:
+    json.dump(json_data, current_file, indent=2)
+  os.replace(temp_file_name, file_name)
+
+def remove_file(file_name):
+  """Delete a pulled file if it still exists"""
+  if os.path.exists(file_name):
+    os.remove(file_name)
+
+def pull_incremental(cluster, tenant, endpoint, directory, file_name_function,
+                     ignore_disabled=True, check_existing=True, max_workers=None):
+  """Pull only added, changed and removed items of a Configuration API list
+
+  file_name_function(list_item, position) gives the file for each listed item.
+  The manifest in the directory remembers the content hash and listing
+  hash of every pulled item. Items whose content hash did not change are
+  not rewritten. With check_existing=False, items already in the manifest
+  with an unchanged listing are not fetched at all (added, removed and
+  renamed items are still picked up), since the list endpoints carry no
+  version information to detect content changes with.
+
+  Details are fetched concurrently. Returns a report with the ids in
+  'added', 'changed' (content changed), 'moved' (same content, file
+  rewritten under a new name or after it went missing), 'removed',
+  'unchanged', the current 'files' in list order and 'failed'
+  ({id: error}). Failed items keep their previous file.
+  """
+  endpoint = endpoint.rstrip('/') + '/'
+  manifest = load_manifest(directory, cluster, tenant)
+  old_items = manifest['items']
+  new_items = {}
+  report = {
+      'added': [], 'changed': [], 'moved': [], 'removed': [], 'unchanged': [], 'files': [], 'failed': {}
+  }
+
+  item_list = rh.config_get(cluster, tenant, endpoint).json()['values']
+  planned = []
+  for position, list_item in enumerate(item_list):
+    item_id = str(list_item['id'])
+    file_name = file_name_function(list_item, position)
+    listing_hash = hash_json(list_item)
+    entry = old_items.get(item_id)
+    # Disabled items are remembered without a file so they are not refetched either
+    is_current = entry is not None and \
+        (entry['file'] is None or (entry['file'] == file_name and os.path.exists(file_name)))
+    needs_fetch = not (is_current and not check_existing and entry['listing_hash'] == listing_hash)
+    planned.append((item_id, list_item, file_name, listing_hash, entry, is_current, needs_fetch))
+
+  details, report['failed'] = fetch_details(
+      cluster,
+      tenant,
+      endpoint,
+      [plan[0] for plan in planned if plan[6]],
+      max_workers=max_workers
+  )
+  details = iter(details)
+  kept_files = set()
+
+  for item_id, list_item, file_name, listing_hash, entry, is_current, needs_fetch in planned:
+    item_json = next(details) if needs_fetch else None
+    if not needs_fetch:
+      new_items[item_id] = entry
+      if entry['file'] is not None:
+        report['unchanged'].append(item_id)
+        report['files'].append(file_name)
+      continue
+    if item_json is None:
+      # Failed fetch: keep whatever was pulled before
+      if entry is not None:
+        new_items[item_id] = entry
+        if entry['file'] is not None:
+          kept_files.add(entry['file'])
+      continue
+
+    # metadata only holds schema and cluster versions, nothing that tells item changes apart
+    item_json.pop('metadata', None)
+    item_json.pop('id', None)
+    new_entry = {
+        'name': list_item.get('name'),
+        'file': None,
+        'hash': None,
+        'listing_hash': listing_hash
+    }
+    new_items[item_id] = new_entry
+    if ignore_disabled and not item_json.get('enabled', True):
+      continue
+
+    new_entry['file'] = file_name
+    new_entry['hash'] = hash_json(item_json)
+    if entry is None or entry['file'] is None:
+      write_json_file(file_name, item_json)
+      report['added'].append(item_id)
+    elif entry['hash'] != new_entry['hash']:
+      write_json_file(file_name, item_json)
+      report['changed'].append(item_id)
+    elif not is_current:
+      # Same content, but its file was renamed (e.g. positions shifted) or deleted locally
+      write_json_file(file_name, item_json)
+      report['moved'].append(item_id)
+    else:
+      report['unchanged'].append(item_id)
+    report['files'].append(file_name)
+
+  current_files = kept_files.union(report['files'])
+  for item_id, entry in old_items.items():
+    if entry['file'] is None:
+      continue
+    if item_id not in new_items or new_items[item_id]['file'] is None:
+      report['removed'].append(item_id)
+    if entry['file'] not in current_files:
+      remove_file(entry['file'])
+
+  manifest['items'] = new_items
+  write_json_file(os.path.join(directory, MANIFEST_FILE), manifest)
+  return report
@@ -1,7 +1,7 @@
 """Host Group Information for Tenant"""
-import user_variables
 from dynatrace.topology import hosts as topology_hosts
 from dynatrace.requests import request_handler as rh
+from dynatrace.requests import parallel
 
 # TODO redo export function (break out to export function?)
 # def export_host_groups_setwide(full_set):
@@ -17,22 +17,31 @@ def get_host_groups_tenantwide(cluster, tenant):
       'relativeTime':'day',
       'includeDetails':'true'
   }
-  response = topology_hosts.get_hosts_tenantwide(cluster, tenant, params=params)
   host_groups = {}
-  for host in response:
+  for host in topology_hosts.iter_hosts_tenantwide(cluster, tenant, params=params):
     host_groups[host['hostGroup']['meId']] = host['hostGroup']['name']
   return host_groups
 
-def get_host_groups_clusterwide (cluster):
-  # TODO add split_by_tenant optional variable 
-  host_groups_custerwide = {}
-  for tenant in cluster['tenant']:
-    host_groups_custerwide.update(get_host_groups_tenantwide(cluster, tenant))
-  return host_groups_custerwide
+def merge_host_groups(host_groups, tenant_host_groups):
+  host_groups.update(tenant_host_groups)
+  return host_groups
+
+def get_host_groups_clusterwide (cluster, max_workers=None, split_by_tenant=False):
+  host_groups_by_tenant = parallel.map_clusterwide(
+      cluster,
+      lambda tenant: get_host_groups_tenantwide(cluster, tenant),
+      max_workers=max_workers
+  )
+  if split_by_tenant:
+    return host_groups_by_tenant
+  return parallel.fold_clusterwide(host_groups_by_tenant, merge_host_groups, {})
 
-def get_host_groups_setwide (full_set):
-  # TODO add split_by_tenant optional variable 
-  host_groups_setwide = {}
-  for cluster in full_set.values():
-    host_groups_setwide.update(get_host_groups_clusterwide(cluster))
-  return host_groups_setwide
\ No newline at end of file
+def get_host_groups_setwide (full_set, max_workers=None, split_by_tenant=False):
+  host_groups_by_tenant = parallel.map_setwide(
+      full_set,
+      get_host_groups_tenantwide,
+      max_workers=max_workers
+  )
+  if split_by_tenant:
+    return host_groups_by_tenant
+  return parallel.fold_setwide(host_groups_by_tenant, merge_host_groups, {})
\ No newline at end of file
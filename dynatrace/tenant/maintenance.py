@@ -2,7 +2,7 @@
 import datetime
 import re
 import dynatrace.requests.request_handler as rh
-import user_variables as uv
+from dynatrace import settings
 
 
 MZ_ENDPOINT = "/maintenanceWindows/"
@@ -56,8 +56,9 @@ def generate_window_json(name, description, suppression, schedule, scope=None, i
     window_json['scope'] = scope
   return window_json
 
-def generate_schedule(recurrence_type, start_time, duration, range_start, range_end, day=None, zoneId=None,):
-  """Create schedule structure for maintenance window"""
+def generate_schedule(recurrence_type, start_time, duration, range_start, range_end, day=None, zoneId=None,
+                      variables=None):
+  """Create schedule structure for maintenance window. zoneId defaults to DEFAULT_TIMEZONE of the variable set"""
   # This structure requires a lot of input validation
   types_available = [ "DAILY", "MONTHLY", "ONCE", "WEEKLY" ]
   days_of_week = [ "FRIDAY", "MONDAY", "SATURDAY", "SUNDAY", "THURSDAY", "TUESDAY", "WEDNESDAY" ]
@@ -79,7 +80,8 @@ def generate_schedule(recurrence_type, start_time, duration, range_start, range_
   }
   
   if zoneId is None:
-    schedule['zoneId'] = uv.DEFAULT_TIMEZONE
+    zoneId = settings.get_variables(variables).DEFAULT_TIMEZONE
+  schedule['zoneId'] = zoneId
 
   if recurrence_type != "ONCE":
     # Check Start Time
@@ -3,13 +3,108 @@
 """Management Zone Operations for Environment"""
 import copy
 import json
+import os
+import threading
 from dynatrace.requests import request_handler as rh
+from dynatrace.requests import parallel
 
-def generate_mz_payload(application, env_zone=None):
-  """Create Payload for Management Zone based on Application and Environment"""
-  with open('../templates/mz_template.json', 'r') as mz_template:
-    mz_payload = json.load(mz_template)
+# Relative to the working directory, like scripts run from ./scripts expect
+MZ_TEMPLATE_FILE = '../templates/mz_template.json'
+# Stand-ins for the Application and Environment while compiling the template
+MZ_APP_PLACEHOLDER = "\u0000APPLICATION\u0000"
+MZ_ENV_PLACEHOLDER = "\u0000ENVIRONMENT\u0000"
+
+class ManagementZoneIndex():
+  """Name and ID lookups for the Management Zones of one tenant
+
+  Loads the zone list once and is kept up to date by add_management_zone,
+  change_management_zone and the delete functions in this module. Use
+  refresh() after zones are changed outside of this process.
+  """
+  def __init__(self, cluster, tenant):
+    self.cluster = cluster
+    self.tenant = tenant
+    self.loaded = False
+    self._zones = {}
+    self._ids_by_name = {}
+    self._lock = threading.RLock()
+
+  def refresh(self, mz_list=None):
+    """Rebuild the index from the API (or from an already fetched zone list)"""
+    if mz_list is None:
+      mz_list = fetch_management_zone_list(self.cluster, self.tenant)
+    with self._lock:
+      self._zones = {}
+      self._ids_by_name = {}
+      for m_zone in mz_list:
+        self._zones[str(m_zone['id'])] = m_zone
+        self._ids_by_name[m_zone['name']] = str(m_zone['id'])
+      self.loaded = True
+
+  def get_id(self, mz_name):
+    """Management Zone ID for a name, None if there is no such zone"""
+    self._ensure_loaded()
+    return self._ids_by_name.get(mz_name)
+
+  def get_zone(self, mz_id):
+    """Management Zone entry for an ID, None if there is no such zone"""
+    self._ensure_loaded()
+    return self._zones.get(str(mz_id))
+
+  def names(self):
+    """All Management Zone names in the tenant"""
+    self._ensure_loaded()
+    return list(self._ids_by_name)
+
+  def add(self, mz_id, mz_name):
+    """Record a created zone"""
+    with self._lock:
+      if self.loaded:
+        self._zones[str(mz_id)] = {'id': str(mz_id), 'name': mz_name}
+        self._ids_by_name[mz_name] = str(mz_id)
+
+  def rename(self, mz_id, mz_name):
+    """Record a changed zone name"""
+    with self._lock:
+      if self.loaded:
+        self.remove(mz_id)
+        self.add(mz_id, mz_name)
 
+  def remove(self, mz_id):
+    """Record a deleted zone"""
+    with self._lock:
+      m_zone = self._zones.pop(str(mz_id), None)
+      if m_zone is not None and self._ids_by_name.get(m_zone['name']) == str(mz_id):
+        del self._ids_by_name[m_zone['name']]
+
+  def _ensure_loaded(self):
+    with self._lock:
+      if not self.loaded:
+        self.refresh()
+
+_MZ_INDEXES = {}
+_MZ_INDEXES_LOCK = threading.Lock()
+
+def get_management_zone_index(cluster, tenant, refresh=False):
+  """Get the Management Zone index of a tenant, loading it on first use"""
+  # Keyed by tenant URL: SaaS clusters share their url, tenant names repeat across clusters
+  with _MZ_INDEXES_LOCK:
+    key = rh.generate_tenant_url(cluster, tenant)
+    if key not in _MZ_INDEXES:
+      _MZ_INDEXES[key] = ManagementZoneIndex(cluster, tenant)
+    mz_index = _MZ_INDEXES[key]
+  if refresh:
+    mz_index.refresh()
+  return mz_index
+
+def clear_management_zone_indexes():
+  """Forget every loaded Management Zone index"""
+  with _MZ_INDEXES_LOCK:
+    _MZ_INDEXES.clear()
+
+def build_mz_payload(template, application, env_zone=None):
+  """Fill a parsed template in place for an Application and Environment"""
+  mz_payload = template
   mz_payload['name'] = str(application)
   # The Template will have
   # Service Rules(0), Process Group Rules(1), Application Rules(2),
@@ -49,6 +144,53 @@ def generate_mz_payload(application, env_zone=None):
 
   return mz_payload
 
+class ManagementZoneTemplate():
+  """mz_template.json compiled into JSON text with holes for the Application and Environment
+
+  build_mz_payload runs once per variant (with and without Environment)
+  on placeholder values. A payload is then the text with the escaped
+  values filled in, decoded into a fresh dict.
+  """
+  def __init__(self, template):
+    self.parts = {}
+    for has_env in (False, True):
+      payload = build_mz_payload(
+          copy.deepcopy(template), MZ_APP_PLACEHOLDER, MZ_ENV_PLACEHOLDER if has_env else None
+      )
+      self.parts[has_env] = [
+          part.split(json.dumps(MZ_ENV_PLACEHOLDER)[1:-1])
+          for part in json.dumps(payload).split(json.dumps(MZ_APP_PLACEHOLDER)[1:-1])
+      ]
+
+  def generate(self, application, env_zone=None):
+    """Payload for an Application and Environment"""
+    app_text = json.dumps(str(application))[1:-1]
+    env_text = json.dumps(str(env_zone))[1:-1] if env_zone else ""
+    return json.loads(app_text.join(env_text.join(pieces) for pieces in self.parts[bool(env_zone)]))
+
+_MZ_TEMPLATES = {}
+_MZ_TEMPLATES_LOCK = threading.Lock()
+
+def get_mz_template(template_file=None):
+  """The compiled template of a file (default MZ_TEMPLATE_FILE), read from disk only once"""
+  template_file = os.path.abspath(template_file or MZ_TEMPLATE_FILE)
+  with _MZ_TEMPLATES_LOCK:
+    mz_template = _MZ_TEMPLATES.get(template_file)
+    if mz_template is None:
+      with open(template_file, 'r') as template:
+        mz_template = ManagementZoneTemplate(json.load(template))
+      _MZ_TEMPLATES[template_file] = mz_template
+    return mz_template
+
+def clear_mz_templates():
+  """Forget compiled templates, so an edited template file is read again"""
+  with _MZ_TEMPLATES_LOCK:
+    _MZ_TEMPLATES.clear()
+
+def generate_mz_payload(application, env_zone=None, template_file=None):
+  """Create Payload for Management Zone based on Application and Environment"""
+  return get_mz_template(template_file).generate(application, env_zone)
+
 def add_management_zone(cluster, tenant, application, env_zone=None):
   """Add Management Zone based on Application and Environment"""
   mz_payload = generate_mz_payload(application, env_zone)
@@ -60,10 +202,43 @@ def add_management_zone(cluster, tenant, application, env_zone=None):
       json=mz_payload
   )
   if "id" in response.json():
+    get_management_zone_index(cluster, tenant).add(response.json()['id'], mz_payload['name'])
     return (response.json())['id']
   else:
     return (response.text)
 
+def add_management_zones(cluster, tenant, zones, max_workers=None, template_file=None):
+  """Add Management Zones for many (application, env_zone) pairs concurrently
+
+  Zones whose name already exists in the tenant (per its index) are
+  skipped, duplicates in zones are created once. Returns a report with
+  "created" and "existing" ({name: id}) and "failed" ({name: error}).
+  """
+  mz_index = get_management_zone_index(cluster, tenant)
+  report = {'created': {}, 'existing': {}, 'failed': {}}
+  payloads = {}
+  for application, env_zone in zones:
+    mz_payload = generate_mz_payload(application, env_zone, template_file=template_file)
+    mz_id = mz_index.get_id(mz_payload['name'])
+    if mz_id is not None:
+      report['existing'][mz_payload['name']] = mz_id
+    else:
+      payloads.setdefault(mz_payload['name'], mz_payload)
+
+  mz_payloads = list(payloads.values())
+  mz_ids, errors = parallel.run_parallel_collect(
+      lambda mz_payload: rh.config_post(cluster, tenant, '/managementZones', json=mz_payload).json()['id'],
+      mz_payloads,
+      max_workers=max_workers
+  )
+  for position, (mz_payload, mz_id) in enumerate(zip(mz_payloads, mz_ids)):
+    if position in errors:
+      report['failed'][mz_payload['name']] = str(errors[position])
+      continue
+    mz_index.add(mz_id, mz_payload['name'])
+    report['created'][mz_payload['name']] = mz_id
+  return report
+
 def change_management_zone(cluster, tenant, mz_id, application, env_zone=None):
   """Add Management Zone based on Application and Environment"""
   mz_payload = generate_mz_payload(application, env_zone)
@@ -74,6 +249,7 @@ def change_management_zone(cluster, tenant, mz_id, application, env_zone=None):
       'managementZones/' + str(mz_id),
       json=mz_payload
   )
+  get_management_zone_index(cluster, tenant).rename(mz_id, mz_payload['name'])
   print(response.status_code)
 
 def delete_management_zone_by_id(cluster, tenant, mz_id):
@@ -83,16 +259,40 @@ def delete_management_zone_by_id(cluster, tenant, mz_id):
       tenant,
       "managementZones/" + str(mz_id),
   )
-  print(response.status_code)
+  get_management_zone_index(cluster, tenant).remove(mz_id)
+  return response.status_code
 
 def delete_management_zone_by_name(cluster, tenant, mz_name):
   """Delete Management Zone by Management Zone Name"""
-  #TODO This function
-  return "TODO " + cluster + tenant + mz_name
+  mz_id = get_management_zone_id(cluster, tenant, mz_name)
+  if mz_id is None:
+    return None
+  return delete_management_zone_by_id(cluster, tenant, mz_id)
 
-def get_management_zone_list(cluster, tenant):
-  """Get all Management Zones in Environment"""
-  #TODO Cache Management Zone list for Env, and add a cleanup script to remove after run.
+def delete_management_zones_by_name(cluster, tenant, mz_names, max_workers=None):
+  """Delete many Management Zones by Name concurrently
+
+  Returns a report with "deleted" ({name: status code}), "missing" (names
+  not found in the tenant) and "failed" ({name: error}).
+  """
+  mz_names = list(mz_names)
+  report = {'deleted': {}, 'missing': [], 'failed': {}}
+  statuses, errors = parallel.run_parallel_collect(
+      lambda mz_name: delete_management_zone_by_name(cluster, tenant, mz_name),
+      mz_names,
+      max_workers=max_workers
+  )
+  for position, (mz_name, status) in enumerate(zip(mz_names, statuses)):
+    if position in errors:
+      report['failed'][mz_name] = str(errors[position])
+    elif status is None:
+      report['missing'].append(mz_name)
+    else:
+      report['deleted'][mz_name] = status
+  return report
+
+def fetch_management_zone_list(cluster, tenant):
+  """Download the Management Zone list of an Environment"""
   response = rh.config_get(
       cluster,
       tenant,
@@ -101,11 +301,12 @@ def get_management_zone_list(cluster, tenant):
   mz_list_raw = response.json()
   return mz_list_raw['values']
 
+def get_management_zone_list(cluster, tenant):
+  """Get all Management Zones in Environment (also refreshes the tenant's index)"""
+  mz_list = fetch_management_zone_list(cluster, tenant)
+  get_management_zone_index(cluster, tenant).refresh(mz_list)
+  return mz_list
+
 def get_management_zone_id(cluster, tenant, mz_name):
   """Get Management Zone ID of Management Zone Name"""
-  mz_list = get_management_zone_list(cluster, tenant)
-
-  for m_zone in mz_list:
-    if m_zone['name'] == mz_name:
-      return m_zone['id']
-  return None
+  return get_management_zone_index(cluster, tenant).get_id(mz_name)
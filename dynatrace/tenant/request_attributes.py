@@ -2,35 +2,35 @@
 """Request Attributes Operations"""
 import json
 from dynatrace.requests import request_handler as rh
+from dynatrace.tenant import config_pull
 
 ENDPOINT = "/service/requestAttributes/"
+PULL_DIRECTORY = "jsons/request_attributes/"
 
-def pull_to_files(cluster, tenant, ignore_disabled=True):
+def pull_to_files(cluster, tenant, ignore_disabled=True, max_workers=None):
   """Pull files from an environment to local"""
-  # API Calls needed: Pull RA, take the ID and pull the details of each RA
-  all_ra_call = rh.config_get(cluster, tenant, ENDPOINT)
-  all_ra_json = all_ra_call.json()
-  all_ra_json = all_ra_json['values']
-  #print (json.dumps(all_ra_json, indent=2))
-  ra_file_list = []
-  for request_attribute in all_ra_json:
-    single_ra_call = rh.config_get(
-        cluster,
-        tenant,
-        ENDPOINT + str(request_attribute['id'])
-    )
-    if single_ra_call.status_code == 200:
-      single_ra_json = single_ra_call.json()
-      if single_ra_json['enabled'] and ignore_disabled:
-        single_ra_json.pop("metadata")
-        single_ra_json.pop("id")
-        ra_file_name = "jsons/request_attributes/" + str(single_ra_json['name']) + ".json"
-        with open(ra_file_name, 'w') as current_file:
-          json.dump(single_ra_json, current_file, indent=2)
-        ra_file_list.append(ra_file_name)
-    else:
-      print (single_ra_call.status_code)
-  return ra_file_list
+  # API Calls needed: Pull RA, take the ID and pull the details of each RA (concurrently)
+  return config_pull.pull_to_files(
+      cluster,
+      tenant,
+      ENDPOINT,
+      lambda request_attribute, position: PULL_DIRECTORY + str(request_attribute['name']) + ".json",
+      ignore_disabled=ignore_disabled,
+      max_workers=max_workers
+  )
+
+def pull_to_files_incremental(cluster, tenant, ignore_disabled=True, check_existing=True, max_workers=None):
+  """Pull only added, changed and removed Request Attributes. Returns a report of the delta"""
+  return config_pull.pull_incremental(
+      cluster,
+      tenant,
+      ENDPOINT,
+      PULL_DIRECTORY,
+      lambda request_attribute, position: PULL_DIRECTORY + str(request_attribute['name']) + ".json",
+      ignore_disabled=ignore_disabled,
+      check_existing=check_existing,
+      max_workers=max_workers
+  )
 
 def push_from_files(file_list, cluster, tenant):
   """Push Request Attributes in JSONs to a tenant"""
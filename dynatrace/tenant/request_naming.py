@@ -4,35 +4,35 @@
 import os
 import json
 from dynatrace.requests import request_handler as rh
+from dynatrace.tenant import config_pull
 
-def pull_to_files(cluster, tenant, ignore_disabled=True):
+ENDPOINT = "/service/requestNaming/"
+PULL_DIRECTORY = "jsons/request_naming/"
+
+def pull_to_files(cluster, tenant, ignore_disabled=True, max_workers=None):
   """Pull Service Naming Rules to Files"""
-  all_rules_call = rh.config_get(cluster, tenant, "/service/requestNaming")
-  all_rules_list = all_rules_call.json()
-  all_rules_list = all_rules_list['values']
-  # print (json.dumps(all_rules_list, indent=2))
+  # Files are numbered by the rule's position in the list, disabled rules included
+  return config_pull.pull_to_files(
+      cluster,
+      tenant,
+      ENDPOINT,
+      lambda naming_rule, rule_num: PULL_DIRECTORY + str(rule_num) + ".json",
+      ignore_disabled=ignore_disabled,
+      max_workers=max_workers
+  )
 
-  rules_file_list = []
-  rule_num = 0
-  for naming_rule in all_rules_list:
-    rule_call = rh.config_get(
-        cluster,
-        tenant,
-        "/service/requestNaming/" + str(naming_rule['id'])
-    )
-    if rule_call.status_code == 200:
-      rule_json = rule_call.json()
-      if rule_json['enabled'] and ignore_disabled:
-        rule_json.pop('metadata')
-        rule_json.pop('id')
-        rule_file_name = "jsons/request_naming/" + str(rule_num) + ".json"
-        with open(rule_file_name, 'w') as current_file:
-          json.dump(rule_json, current_file, indent=2)
-        rules_file_list.append(rule_file_name)
-    else:
-      print (rule_call.status_code)
-    rule_num = rule_num + 1
-  return rules_file_list
+def pull_to_files_incremental(cluster, tenant, ignore_disabled=True, check_existing=True, max_workers=None):
+  """Pull only added, changed and removed Naming Rules. Returns a report of the delta"""
+  return config_pull.pull_incremental(
+      cluster,
+      tenant,
+      ENDPOINT,
+      PULL_DIRECTORY,
+      lambda naming_rule, rule_num: PULL_DIRECTORY + str(rule_num) + ".json",
+      ignore_disabled=ignore_disabled,
+      check_existing=check_existing,
+      max_workers=max_workers
+  )
 
 def push_from_files(file_list, cluster, tenant):
   """Push Service Naming Rules from Files"""
@@ -0,0 +1,179 @@
+"""Buffered Writer for custom metric data points"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from dynatrace.requests import parallel
+from dynatrace.timeseries import timeseries
+from dynatrace.topology import custom
+
+# Data points sent in one custom device request
+DEFAULT_MAX_POINTS = 1000
+# Data points held in buffers before the largest buffer is sent early
+DEFAULT_MAX_BUFFERED = 100000
+DEFAULT_FLUSH_INTERVAL = 10.0
+
+def now_ms():
+  """Current time in epoch milliseconds"""
+  return int(time.time() * 1000)
+
+def default_metric_definition(metric):
+  """Registration payload for a custom metric without an explicit definition"""
+  return {
+      'displayName': metric,
+      'unit': 'Count',
+      'dimensions': [],
+      'types': []
+  }
+
+def build_series(points):
+  """Group (metric, dimensions, timestamp, value) points into the series of a custom device payload"""
+  series = {}
+  for metric, dimensions, timestamp, value in points:
+    key = (metric, tuple(sorted(dimensions.items())) if dimensions else ())
+    if key not in series:
+      series[key] = {'timeseriesId': metric, 'dataPoints': []}
+      if dimensions:
+        series[key]['dimensions'] = dict(dimensions)
+    series[key]['dataPoints'].append([timestamp, value])
+  return list(series.values())
+
+class CustomMetricWriter():
+  """Buffers custom metric data points per tenant and custom device and sends them in batches
+
+  A device's buffer is flushed when it holds max_points points and every
+  flush_interval seconds. When all buffers together hold max_buffered
+  points, the largest one is flushed early. Flushes run concurrently on
+  max_workers threads; write() blocks while max_pending flushes are
+  queued or running. Metrics are registered (create_custom_metric) once
+  per tenant before their first data points are sent.
+  """
+  def __init__(self, cluster, max_points=DEFAULT_MAX_POINTS, max_buffered=DEFAULT_MAX_BUFFERED,
+               flush_interval=DEFAULT_FLUSH_INTERVAL, max_workers=None, max_pending=None,
+               metric_definitions=None, device_properties=None):
+    max_workers = max_workers or parallel.DEFAULT_MAX_WORKERS
+    self.cluster = cluster
+    self.max_points = max_points
+    self.max_buffered = max_buffered
+    self.max_pending = max_pending or 2 * max_workers
+    self.metric_definitions = metric_definitions or {}
+    self.device_properties = device_properties or {}
+    self.condition = threading.Condition()
+    self.buffers = {}
+    self.buffered = 0
+    self.pending = set()
+    self.registered = set()
+    self.registration_lock = threading.Lock()
+    self.stats = {'points': 0, 'requests': 0, 'registrations': 0, 'failed_points': 0}
+    self.failures = []
+    self.closed = False
+    self.executor = ThreadPoolExecutor(max_workers=max_workers)
+    self.stop_event = threading.Event()
+    self.timer = None
+    if flush_interval:
+      self.timer = threading.Thread(target=self.flush_periodically, args=(flush_interval,), daemon=True)
+      self.timer.start()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+  def write(self, tenant, device, metric, value, timestamp=None, dimensions=None):
+    """Buffer one data point of a custom metric for a custom device"""
+    point = (metric, dimensions, now_ms() if timestamp is None else timestamp, value)
+    with self.condition:
+      if self.closed:
+        raise Exception("CustomMetricWriter is closed")
+      while len(self.pending) >= self.max_pending:
+        self.condition.wait()
+      buffer = self.buffers.setdefault((tenant, device), [])
+      buffer.append(point)
+      self.buffered = self.buffered + 1
+      if len(buffer) >= self.max_points:
+        self.submit(tenant, device)
+      elif self.buffered >= self.max_buffered:
+        self.submit(*max(self.buffers, key=lambda key: len(self.buffers[key])))
+
+  def submit(self, tenant, device):
+    """Hand a device's buffer to the flush pool (condition must be held)"""
+    points = self.buffers.pop((tenant, device), None)
+    if not points:
+      return
+    self.buffered = self.buffered - len(points)
+    future = self.executor.submit(self.send, tenant, device, points)
+    self.pending.add(future)
+    future.add_done_callback(self.done)
+
+  def done(self, future):
+    """Flush finished: wake up writers waiting for a free slot"""
+    with self.condition:
+      self.pending.discard(future)
+      self.condition.notify_all()
+
+  def submit_all(self):
+    """Hand every buffer to the flush pool (condition must be held)"""
+    for tenant, device in list(self.buffers):
+      self.submit(tenant, device)
+
+  def register(self, tenant, metrics):
+    """Register custom metrics that were not registered in this tenant yet"""
+    with self.registration_lock:
+      for metric in metrics:
+        if (tenant, metric) in self.registered:
+          continue
+        definition = self.metric_definitions.get(metric) or default_metric_definition(metric)
+        timeseries.create_custom_metric(self.cluster, tenant, metric, definition)
+        self.registered.add((tenant, metric))
+        self.stats['registrations'] = self.stats['registrations'] + 1
+
+  def send(self, tenant, device, points):
+    """Post a device's points in requests of at most max_points points"""
+    for chunk_start in range(0, len(points), self.max_points):
+      chunk = points[chunk_start:chunk_start + self.max_points]
+      try:
+        self.register(tenant, set(point[0] for point in chunk))
+        payload = dict(self.device_properties.get(device, {}))
+        payload['series'] = build_series(chunk)
+        custom.set_custom_properties(self.cluster, tenant, device, payload)
+      except Exception as error:
+        with self.condition:
+          self.stats['failed_points'] = self.stats['failed_points'] + len(chunk)
+          self.failures.append((tenant, device, len(chunk), str(error)))
+        continue
+      with self.condition:
+        self.stats['points'] = self.stats['points'] + len(chunk)
+        self.stats['requests'] = self.stats['requests'] + 1
+
+  def flush(self):
+    """Send everything buffered so far and wait until it is sent"""
+    with self.condition:
+      self.submit_all()
+      futures = list(self.pending)
+    wait(futures)
+
+  def flush_periodically(self, flush_interval):
+    """Timer thread: hand all buffers to the flush pool every flush_interval seconds"""
+    while not self.stop_event.wait(flush_interval):
+      with self.condition:
+        self.submit_all()
+
+  def close(self):
+    """Stop the timer, send the remaining points and shut the flush pool down"""
+    with self.condition:
+      if self.closed:
+        return
+      self.closed = True
+    self.stop_event.set()
+    if self.timer is not None:
+      self.timer.join()
+    self.flush()
+    self.executor.shutdown(wait=True)
+
+  def get_stats(self):
+    """Points and requests sent, registrations, failed points, buffered points and pending flushes"""
+    with self.condition:
+      stats = dict(self.stats)
+      stats['buffered'] = self.buffered
+      stats['pending'] = len(self.pending)
+      return stats
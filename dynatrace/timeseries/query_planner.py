@@ -0,0 +1,113 @@
+"""Query Planner that splits long timeseries queries into parallel windows"""
+from dynatrace.requests import parallel
+from dynatrace.timeseries import timeseries
+
+# Data points per series the planner asks for in one request
+DEFAULT_MAX_POINTS = 720
+RESOLUTION_UNITS = {
+    'm': 60 * 1000,
+    'h': 60 * 60 * 1000,
+    'd': 24 * 60 * 60 * 1000,
+    'w': 7 * 24 * 60 * 60 * 1000
+}
+
+def parse_resolution(resolution):
+  """Resolution ("1m", "5m", "1h", "1d", "1w" or milliseconds) in milliseconds"""
+  if isinstance(resolution, int):
+    return resolution
+  resolution = str(resolution).strip()
+  if resolution[-1:] in RESOLUTION_UNITS and resolution[:-1].isdigit():
+    return int(resolution[:-1]) * RESOLUTION_UNITS[resolution[-1]]
+  raise Exception("Resolution " + resolution + " can not be split. Use e.g. 1m, 5m, 1h, 1d")
+
+def plan_windows(start, end, resolution, max_points=None):
+  """Split [start, end] (epoch ms) into windows of at most max_points buckets
+
+  Window boundaries fall on multiples of the resolution so no bucket is
+  cut in half between two windows.
+  """
+  if end <= start:
+    raise Exception("endTimestamp must be after startTimestamp")
+  resolution_ms = parse_resolution(resolution)
+  window_ms = resolution_ms * (max_points or DEFAULT_MAX_POINTS)
+  windows = []
+  window_start = start
+  while window_start < end:
+    window_end = min((window_start // resolution_ms) * resolution_ms + window_ms, end)
+    windows.append((window_start, window_end))
+    window_start = window_end
+  return windows
+
+def window_params(params, window, resolution):
+  """Query parameters of one window"""
+  window_params_dict = dict(params) if params else {}
+  window_params_dict.pop('relativeTime', None)
+  window_params_dict['startTimestamp'] = window[0]
+  window_params_dict['endTimestamp'] = window[1]
+  window_params_dict['resolution'] = resolution
+  window_params_dict.setdefault('includeData', 'true')
+  window_params_dict.setdefault('queryMode', 'series')
+  return window_params_dict
+
+class TimeseriesStitcher():
+  """Merges window responses in time order, dropping points repeated at boundaries"""
+  def __init__(self):
+    self.result = None
+    self.last_timestamps = {}
+
+  def add(self, window_json):
+    """Merge the next window's response"""
+    data_result = window_json.get('dataResult', window_json)
+    if self.result is None:
+      self.result = dict(window_json)
+      self.result['dataResult'] = dict(data_result)
+      self.result['dataResult']['dataPoints'] = {}
+      self.result['dataResult']['entities'] = {}
+    merged = self.result['dataResult']
+    merged['entities'].update(data_result.get('entities') or {})
+    for series_key, points in (data_result.get('dataPoints') or {}).items():
+      last_timestamp = self.last_timestamps.get(series_key)
+      if last_timestamp is not None:
+        points = [point for point in points if point[0] > last_timestamp]
+      if points:
+        merged['dataPoints'].setdefault(series_key, []).extend(points)
+        self.last_timestamps[series_key] = points[-1][0]
+
+  def get_result(self):
+    """Stitched response in the shape of get_timeseries_metric"""
+    return self.result if self.result is not None else {'dataResult': {'dataPoints': {}, 'entities': {}}}
+
+def iter_timeseries_windows(cluster, tenant, metric, start, end, resolution, params=None,
+                            max_points=None, max_workers=None):
+  """Fetch the windows of a long query concurrently and yield their responses in time order
+
+  At most max_workers windows are fetched (and held in memory) at once.
+  """
+  windows = plan_windows(start, end, resolution, max_points=max_points)
+  batch_size = max_workers or parallel.DEFAULT_MAX_WORKERS
+  for batch_start in range(0, len(windows), batch_size):
+    batch = windows[batch_start:batch_start + batch_size]
+    responses = parallel.run_parallel(
+        lambda window: timeseries.get_timeseries_metric(
+            cluster, tenant, metric, params=window_params(params, window, resolution)
+        ),
+        batch,
+        max_workers=max_workers
+    )
+    for response in responses:
+      yield response
+
+def get_timeseries_range(cluster, tenant, metric, start, end, resolution, params=None,
+                         max_points=None, max_workers=None):
+  """Get a timeseries metric over a long range at full resolution
+
+  The range is split into windows of max_points buckets that are fetched
+  concurrently and stitched back into one get_timeseries_metric response.
+  """
+  stitcher = TimeseriesStitcher()
+  for window_json in iter_timeseries_windows(
+      cluster, tenant, metric, start, end, resolution, params=params,
+      max_points=max_points, max_workers=max_workers
+  ):
+    stitcher.add(window_json)
+  return stitcher.get_result()
@@ -1,4 +1,5 @@
 from dynatrace.requests import request_handler as rh
+from dynatrace.timeseries.timeseries_result import TimeseriesResult
 
 ENDPOINT = "timeseries/"
 
@@ -13,6 +14,10 @@ def get_timeseries_metric (cluster, tenant, metric, params=None):
   response = rh.env_get(cluster, tenant, ENDPOINT + metric, params=params)
   return response.json()
 
+def get_timeseries_result(cluster, tenant, metric, params=None):
+  """Get Timeseries Metric as a NumPy-backed TimeseriesResult (requires numpy)"""
+  return TimeseriesResult.from_json(get_timeseries_metric(cluster, tenant, metric, params=params))
+
 def create_custom_metric (cluster, tenant, metric, json, params=None):
   response = rh.env_put(cluster, tenant, ENDPOINT + metric, params=params, json=json)
   return response.status_code
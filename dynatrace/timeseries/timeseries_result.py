@@ -0,0 +1,188 @@
+"""NumPy-backed Timeseries Results (requires numpy)"""
+import warnings
+
+try:
+  import numpy as np
+except ImportError:
+  np = None
+
+AGGREGATIONS = ['mean', 'sum', 'min', 'max', 'count']
+
+def check_numpy():
+  """Raise a readable error when numpy is missing"""
+  if np is None:
+    raise Exception("numpy is required for TimeseriesResult (python3 -m pip install numpy)")
+
+class TimeseriesResult():
+  """Timeseries data as one timestamp vector and a (series x timestamps) value matrix
+
+  timestamps: int64 array of epoch milliseconds, sorted ascending
+  values: float64 matrix, one row per series key, NaN where there is no value
+  series_keys: dataPoints keys (entity ID, or comma separated dimension IDs)
+  """
+  def __init__(self, timestamps, values, series_keys, entities=None, unit=None,
+               timeseries_id=None, aggregation=None, resolution=None):
+    check_numpy()
+    self.timestamps = timestamps
+    self.values = values
+    self.series_keys = list(series_keys)
+    self.entities = entities if entities is not None else {}
+    self.unit = unit
+    self.timeseries_id = timeseries_id
+    self.aggregation = aggregation
+    self.resolution = resolution
+    self._rows = dict((key, row) for row, key in enumerate(self.series_keys))
+
+  @classmethod
+  def from_json(cls, timeseries_json):
+    """Build from a get_timeseries_metric response (or its dataResult)"""
+    check_numpy()
+    data_result = timeseries_json.get('dataResult', timeseries_json)
+    data_points = data_result.get('dataPoints') or {}
+    series_keys = list(data_points)
+    series = [np.array(data_points[key], dtype=float).reshape(-1, 2) for key in series_keys]
+
+    if series and all(
+        len(points) == len(series[0]) and np.array_equal(points[:, 0], series[0][:, 0])
+        for points in series
+    ):
+      # Usual case: every series has the same timestamps, so stack them directly
+      timestamps = series[0][:, 0].astype(np.int64)
+      values = np.vstack([points[:, 1] for points in series])
+      order = np.argsort(timestamps, kind='stable')
+      timestamps = timestamps[order]
+      values = values[:, order]
+    else:
+      all_timestamps = [points[:, 0] for points in series]
+      timestamps = np.unique(np.concatenate(all_timestamps)).astype(np.int64) if series \
+          else np.zeros(0, dtype=np.int64)
+      values = np.full((len(series), len(timestamps)), np.nan)
+      for row, points in enumerate(series):
+        values[row, np.searchsorted(timestamps, points[:, 0].astype(np.int64))] = points[:, 1]
+
+    return cls(
+        timestamps,
+        values,
+        series_keys,
+        entities=data_result.get('entities'),
+        unit=data_result.get('unit', timeseries_json.get('unit')),
+        timeseries_id=data_result.get('timeseriesId', timeseries_json.get('timeseriesId')),
+        aggregation=data_result.get('aggregationType'),
+        resolution=data_result.get('resolutionInMillisUTC')
+    )
+
+  def __len__(self):
+    return len(self.series_keys)
+
+  def series(self, series_key):
+    """Values of one series (view into the matrix)"""
+    return self.values[self._rows[series_key]]
+
+  def display_name(self, series_key):
+    """Display names of the entities in a series key, joined like the key"""
+    return ", ".join(
+        self.entities.get(part.strip(), part.strip()) for part in series_key.split(",")
+    )
+
+  def _reduce(self, function, axis):
+    with warnings.catch_warnings():
+      # All-null rows/columns give NaN, which is the answer we want
+      warnings.simplefilter('ignore', RuntimeWarning)
+      return function(self.values, axis=1 if axis == 'time' else 0)
+
+  def min(self, axis='time'):
+    """Minimum per series (axis='time') or per timestamp (axis='series'), nulls ignored"""
+    return self._reduce(np.nanmin, axis)
+
+  def max(self, axis='time'):
+    """Maximum per series or per timestamp, nulls ignored"""
+    return self._reduce(np.nanmax, axis)
+
+  def mean(self, axis='time'):
+    """Average per series or per timestamp, nulls ignored"""
+    return self._reduce(np.nanmean, axis)
+
+  def sum(self, axis='time'):
+    """Sum per series or per timestamp, nulls ignored"""
+    return self._reduce(np.nansum, axis)
+
+  def count(self, axis='time'):
+    """Number of non-null values per series or per timestamp"""
+    return (~np.isnan(self.values)).sum(axis=1 if axis == 'time' else 0)
+
+  def percentile(self, percent, axis='time'):
+    """Percentile (0-100) per series or per timestamp, nulls ignored"""
+    return self._reduce(lambda values, axis: np.nanpercentile(values, percent, axis=axis), axis)
+
+  def _copy_with(self, timestamps, values, series_keys=None, resolution=None):
+    return TimeseriesResult(
+        timestamps,
+        values,
+        self.series_keys if series_keys is None else series_keys,
+        entities=self.entities,
+        unit=self.unit,
+        timeseries_id=self.timeseries_id,
+        aggregation=self.aggregation,
+        resolution=self.resolution if resolution is None else resolution
+    )
+
+  def fill_nulls(self, method='zero', value=0.0):
+    """New result with nulls replaced: 'zero', 'value', 'ffill' (last value) or 'bfill' (next value)"""
+    values = self.values.copy()
+    mask = np.isnan(values)
+    if method == 'zero':
+      values[mask] = 0.0
+    elif method == 'value':
+      values[mask] = value
+    elif method in ['ffill', 'bfill']:
+      if method == 'bfill':
+        values = values[:, ::-1]
+        mask = mask[:, ::-1]
+      positions = np.where(mask, 0, np.arange(values.shape[1]))
+      np.maximum.accumulate(positions, axis=1, out=positions)
+      values = values[np.arange(values.shape[0])[:, None], positions]
+      if method == 'bfill':
+        values = values[:, ::-1]
+    else:
+      raise Exception("Unknown fill method " + str(method) + ". Use zero, value, ffill or bfill")
+    return self._copy_with(self.timestamps, values)
+
+  def drop_nulls(self, how='all'):
+    """New result without timestamps where all (how='all') or any (how='any') series are null"""
+    mask = np.isnan(self.values)
+    drop = mask.all(axis=0) if how == 'all' else mask.any(axis=0)
+    return self._copy_with(self.timestamps[~drop], self.values[:, ~drop])
+
+  def resample(self, resolution_ms, how='mean'):
+    """New result on a coarser grid of resolution_ms buckets, aggregated with how"""
+    if how not in AGGREGATIONS:
+      raise Exception("Unknown aggregation " + str(how) + ". Use " + ", ".join(AGGREGATIONS))
+    if len(self.timestamps) == 0:
+      return self._copy_with(self.timestamps, self.values, resolution=resolution_ms)
+    buckets = self.timestamps // resolution_ms
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(buckets)) + 1))
+    timestamps = buckets[starts] * resolution_ms
+    present = ~np.isnan(self.values)
+    counts = np.add.reduceat(present, starts, axis=1)
+    if how in ['mean', 'sum']:
+      sums = np.add.reduceat(np.where(present, self.values, 0.0), starts, axis=1)
+      values = sums if how == 'sum' else sums / np.where(counts == 0, 1, counts)
+      values[counts == 0] = np.nan
+    elif how == 'count':
+      values = counts.astype(float)
+    else:
+      function = np.fmin if how == 'min' else np.fmax
+      values = function.reduceat(self.values, starts, axis=1)
+    return self._copy_with(timestamps, values, resolution=resolution_ms)
+
+  def to_data_points(self):
+    """Back to the API's dataPoints shape: {series_key: [[timestamp, value or None]]}"""
+    data_points = {}
+    timestamps = self.timestamps.tolist()
+    for row, key in enumerate(self.series_keys):
+      row_values = self.values[row].tolist()
+      data_points[key] = [
+          [timestamp, None if value != value else value]
+          for timestamp, value in zip(timestamps, row_values)
+      ]
+    return data_points
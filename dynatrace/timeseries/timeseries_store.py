@@ -0,0 +1,267 @@
+"""Local Incremental Timeseries Store with per-entity watermarks"""
+import array
+import bisect
+import os
+import threading
+import time
+from urllib.parse import quote, unquote
+from dynatrace.requests import request_handler as rh
+from dynatrace.timeseries import timeseries
+
+# History fetched the first time a metric is polled
+DEFAULT_LOOKBACK_MS = 2 * 60 * 60 * 1000
+# Buckets this close to now may still change, so they are fetched again next poll
+DEFAULT_SETTLE_MS = 2 * 60 * 1000
+TIMESTAMP_SUFFIX = ".ts"
+VALUE_SUFFIX = ".val"
+ITEM_SIZE = 8
+
+def now_ms():
+  """Current time in epoch milliseconds"""
+  return int(time.time() * 1000)
+
+def read_column(file_name, typecode):
+  """Read a whole column file into an array"""
+  column = array.array(typecode)
+  if os.path.exists(file_name):
+    with open(file_name, 'rb') as column_file:
+      data = column_file.read()
+    # Ignore a partially written last entry
+    column.frombytes(data[:len(data) - len(data) % column.itemsize])
+  return column
+
+def write_column(file_name, column):
+  """Replace a column file atomically"""
+  temp_file_name = file_name + ".tmp"
+  with open(temp_file_name, 'wb') as column_file:
+    column.tofile(column_file)
+  os.replace(temp_file_name, file_name)
+
+def get_tenant_key(cluster, tenant):
+  """Key of a tenant in the store. Tenant names repeat across clusters, tenant URLs do not"""
+  return rh.generate_tenant_url(cluster, tenant)
+
+def list_names(directory):
+  """Unquoted names of the entries of a store directory"""
+  if not os.path.isdir(directory):
+    return []
+  return [unquote(name) for name in os.listdir(directory)]
+
+class TimeseriesStore():
+  """Append-only columnar files per (tenant, metric, entity)
+
+  Each series is two files: int64 timestamps (.ts) and float64 values
+  (.val, NaN for nulls). The last stored timestamp is the watermark, so
+  each poll only requests the interval after it. Tenants are stored by
+  their URL (get_tenant_key).
+  """
+  def __init__(self, directory, max_age_ms=None, lookback_ms=DEFAULT_LOOKBACK_MS,
+               settle_ms=DEFAULT_SETTLE_MS):
+    self.directory = directory
+    self.max_age_ms = max_age_ms
+    self.lookback_ms = lookback_ms
+    self.settle_ms = settle_ms
+    self.lock = threading.RLock()
+    self.watermarks = {}
+
+  def metric_directory(self, tenant_key, metric):
+    """Directory of one metric"""
+    return os.path.join(self.directory, quote(tenant_key, safe=''), quote(metric, safe=''))
+
+  def series_file(self, tenant_key, metric, entity):
+    """Base file name (without suffix) of one series"""
+    return os.path.join(self.metric_directory(tenant_key, metric), quote(entity, safe=''))
+
+  def get_entities(self, cluster, tenant, metric):
+    """Series keys stored for a metric"""
+    return self.get_key_entities(get_tenant_key(cluster, tenant), metric)
+
+  def get_key_entities(self, tenant_key, metric):
+    """get_entities by tenant key"""
+    metric_directory = self.metric_directory(tenant_key, metric)
+    if not os.path.isdir(metric_directory):
+      return []
+    return sorted(
+        unquote(file_name[:-len(TIMESTAMP_SUFFIX)])
+        for file_name in os.listdir(metric_directory)
+        if file_name.endswith(TIMESTAMP_SUFFIX)
+    )
+
+  def get_watermark(self, cluster, tenant, metric, entity):
+    """Last stored timestamp of a series, None if nothing is stored"""
+    return self.get_key_watermark(get_tenant_key(cluster, tenant), metric, entity)
+
+  def get_key_watermark(self, tenant_key, metric, entity):
+    """get_watermark by tenant key"""
+    key = (tenant_key, metric, entity)
+    with self.lock:
+      if key not in self.watermarks:
+        watermark = None
+        timestamp_file = self.series_file(tenant_key, metric, entity) + TIMESTAMP_SUFFIX
+        if os.path.exists(timestamp_file):
+          # Only the last entry is read, not the whole file
+          with open(timestamp_file, 'rb') as column_file:
+            column_file.seek(0, os.SEEK_END)
+            size = column_file.tell() - column_file.tell() % ITEM_SIZE
+            if size:
+              column_file.seek(size - ITEM_SIZE)
+              watermark = array.array('q', column_file.read(ITEM_SIZE))[0]
+        self.watermarks[key] = watermark
+      return self.watermarks[key]
+
+  def get_metric_watermark(self, cluster, tenant, metric):
+    """Latest watermark over the stored series of a metric"""
+    watermarks = [
+        watermark for watermark in self.get_key_watermarks(get_tenant_key(cluster, tenant), metric)
+        if watermark is not None and watermark >= oldest
+    ]
+    return max(watermarks) if watermarks else None
+
+  def get_key_watermarks(self, tenant_key, metric):
+    """Watermarks of all stored series of a metric"""
+    return [
+        self.get_key_watermark(tenant_key, metric, entity)
+        for entity in self.get_key_entities(tenant_key, metric)
+    ]
+
+  def get_poll_start(self, cluster, tenant, metric, end):
+    """Start of the next query: just after the watermark of the series that lags most
+
+    Only series with data in the last lookback_ms count. Series that stopped
+    reporting before that (e.g. removed hosts) would otherwise pull the
+    start back further on every poll. Without any such series the query
+    starts lookback_ms before end. Series that are ahead get points again,
+    which append drops. With max_age_ms nothing older than that is requested.
+    """
+    oldest = end - self.lookback_ms
+    starts = [
+        watermark + 1
+        for watermark in self.get_key_watermarks(get_tenant_key(cluster, tenant), metric)
+        if watermark is not None and watermark >= oldest
+    ]
+    start = min(starts) if starts else oldest
+    if self.max_age_ms is not None:
+      start = max(start, end - self.max_age_ms)
+    return start
+
+  def append(self, cluster, tenant, metric, entity, points):
+    """Append [timestamp, value] points newer than the watermark. Returns the number stored"""
+    tenant_key = get_tenant_key(cluster, tenant)
+    with self.lock:
+      watermark = self.get_key_watermark(tenant_key, metric, entity)
+      timestamps = array.array('q')
+      values = array.array('d')
+      for timestamp, value in points:
+        if watermark is not None and timestamp <= watermark:
+          continue
+        timestamps.append(int(timestamp))
+        values.append(float('nan') if value is None else float(value))
+        watermark = timestamp
+      if not timestamps:
+        return 0
+      series_file = self.series_file(tenant_key, metric, entity)
+      os.makedirs(os.path.dirname(series_file), exist_ok=True)
+      # Values are written first. An append interrupted in between leaves
+      # values without timestamps, which are cut off here before appending
+      if os.path.exists(series_file + VALUE_SUFFIX):
+        stored_size = os.path.getsize(series_file + TIMESTAMP_SUFFIX) \
+            if os.path.exists(series_file + TIMESTAMP_SUFFIX) else 0
+        if os.path.getsize(series_file + VALUE_SUFFIX) > stored_size:
+          os.truncate(series_file + VALUE_SUFFIX, stored_size)
+      with open(series_file + VALUE_SUFFIX, 'ab') as column_file:
+        values.tofile(column_file)
+      with open(series_file + TIMESTAMP_SUFFIX, 'ab') as column_file:
+        timestamps.tofile(column_file)
+      self.watermarks[(tenant_key, metric, entity)] = watermark
+      return len(timestamps)
+
+  def read(self, cluster, tenant, metric, entity, start=None, end=None):
+    """Stored (timestamps, values) arrays of a series, optionally limited to [start, end]"""
+    with self.lock:
+      series_file = self.series_file(get_tenant_key(cluster, tenant), metric, entity)
+      timestamps = read_column(series_file + TIMESTAMP_SUFFIX, 'q')
+      values = read_column(series_file + VALUE_SUFFIX, 'd')
+    length = min(len(timestamps), len(values))
+    first = 0 if start is None else bisect.bisect_left(timestamps, start, 0, length)
+    last = length if end is None else bisect.bisect_right(timestamps, end, 0, length)
+    return timestamps[first:last], values[first:last]
+
+  def read_metric(self, cluster, tenant, metric, start=None, end=None):
+    """Stored series of a metric in the shape of a get_timeseries_metric response"""
+    data_points = {}
+    for entity in self.get_entities(cluster, tenant, metric):
+      timestamps, values = self.read(cluster, tenant, metric, entity, start=start, end=end)
+      data_points[entity] = [
+          [timestamp, None if value != value else value]
+          for timestamp, value in zip(timestamps, values)
+      ]
+    return {'timeseriesId': metric, 'dataResult': {'dataPoints': data_points}}
+
+  def poll(self, cluster, tenant, metric, params=None):
+    """Fetch only the interval after the series' watermarks and append it
+
+    The query starts at get_poll_start, so a lagging series gets all its
+    missing points. append keeps per series only the points after its own
+    watermark. The first poll fetches lookback_ms of history. Buckets
+    younger than settle_ms are not stored so they are fetched complete next
+    time. Returns {entity: number of points stored}.
+    """
+    end = now_ms()
+    query_params = dict(params) if params else {}
+    query_params.pop('relativeTime', None)
+    query_params['startTimestamp'] = self.get_poll_start(cluster, tenant, metric, end)
+    query_params['endTimestamp'] = end
+    query_params.setdefault('includeData', 'true')
+    query_params.setdefault('queryMode', 'series')
+    response = timeseries.get_timeseries_metric(cluster, tenant, metric, params=query_params)
+    data_points = response.get('dataResult', response).get('dataPoints') or {}
+
+    settled = end - self.settle_ms
+    stored = {}
+    for entity, points in data_points.items():
+      stored[entity] = self.append(
+          cluster, tenant, metric, entity, [point for point in points if point[0] <= settled]
+      )
+    if self.max_age_ms is not None:
+      self.evict(cluster=cluster, tenant=tenant, metric=metric, now=end)
+    return stored
+
+  def evict(self, cluster=None, tenant=None, metric=None, now=None):
+    """Drop points older than max_age_ms. Returns the number of points removed
+
+    Without cluster and tenant all tenants of the store are evicted.
+    """
+    if self.max_age_ms is None:
+      return 0
+    cutoff = (now or now_ms()) - self.max_age_ms
+    if cluster is not None and tenant is not None:
+      tenant_keys = [get_tenant_key(cluster, tenant)]
+    else:
+      tenant_keys = list_names(self.directory)
+    removed = 0
+    with self.lock:
+      for tenant_key in tenant_keys:
+        tenant_directory = os.path.join(self.directory, quote(tenant_key, safe=''))
+        metrics = [metric] if metric is not None else list_names(tenant_directory)
+        for metric_name in metrics:
+          for entity in self.get_key_entities(tenant_key, metric_name):
+            removed = removed + self.evict_series(tenant_key, metric_name, entity, cutoff)
+    return removed
+
+  def evict_series(self, tenant_key, metric, entity, cutoff):
+    """Rewrite a series without the points before cutoff"""
+    series_file = self.series_file(tenant_key, metric, entity)
+    timestamps = read_column(series_file + TIMESTAMP_SUFFIX, 'q')
+    values = read_column(series_file + VALUE_SUFFIX, 'd')
+    length = min(len(timestamps), len(values))
+    first = bisect.bisect_left(timestamps, cutoff, 0, length)
+    if first == 0 and length == len(timestamps) == len(values):
+      return 0
+    if first == length:
+      os.remove(series_file + TIMESTAMP_SUFFIX)
+      os.remove(series_file + VALUE_SUFFIX)
+      self.watermarks.pop((tenant_key, metric, entity), None)
+      return length
+    write_column(series_file + VALUE_SUFFIX, values[first:length])
+    write_column(series_file + TIMESTAMP_SUFFIX, timestamps[first:length])
+    return first
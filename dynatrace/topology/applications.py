@@ -1,50 +1,71 @@
 """Application operations from the Dynatrace API"""
 # Applications needs a seperate definition since the url is not the same (not /infrastructre/)
 from dynatrace.requests import request_handler as rh
+from dynatrace.requests import parallel
+from dynatrace.topology import entity_cache
+from dynatrace.topology import shared as topology_shared
 
 ENDPOINT = "entity/applications/"
 
 def get_applications_tenantwide(cluster, tenant):
   """Get Information for all applications in a tenant"""
-  response = rh.env_get(cluster, tenant, ENDPOINT)
-  return response.json()
+  return entity_cache.cached(
+      cluster,
+      tenant,
+      'applications',
+      None,
+      None,
+      lambda: rh.env_get(cluster, tenant, ENDPOINT).json()
+  )
 
 def get_application(cluster, tenant, entity):
   """Get Information on one application for in a tenant"""
-  response = rh.env_get(cluster, tenant, ENDPOINT + entity)
-  return response.json()
+  return entity_cache.cached(
+      cluster,
+      tenant,
+      'applications',
+      entity,
+      None,
+      lambda: rh.env_get(cluster, tenant, ENDPOINT + entity).json()
+  )
 
 def set_application_properties(cluster, tenant, entity, prop_json):
   """Update properties of application entity"""
   response = rh.env_post(cluster, tenant, ENDPOINT + entity, json=prop_json)
+  entity_cache.invalidate(cluster=cluster, tenant=tenant, layer='applications', entity=entity)
   return response.json()
 
 def get_application_count_tenantwide(cluster, tenant):
   """Get total count for all applications in a tenant"""
-  params = {
-      "relativeTime" : "day",
-      "includeDetails" : "false"
-  }
+  return topology_shared.count_env_entities(
+      cluster,
+      tenant,
+      'applications',
+      ENDPOINT,
+      params=topology_shared.get_count_params()
+  )
 
-  response = rh.env_get(cluster, tenant, ENDPOINT, params=params)
-  env_app_count = len(response.json())
-  return env_app_count
-
-def get_application_count_clusterwide(cluster):
+def get_application_count_clusterwide(cluster, max_workers=None, split_by_tenant=False):
   """Get total count for all applications in cluster"""
-  cluster_app_count = 0
-  for env_key in cluster['tenant']:
-    cluster_app_count = cluster_app_count + get_application_count_tenantwide(
-        cluster,
-        env_key
-    )
-  return cluster_app_count
-
-def get_application_count_setwide(full_set):
-  full_set_app_count = 0
-  for cluster_items in full_set.values():
-    full_set_app_count = full_set_app_count + get_application_count_clusterwide(cluster_items)
-  return full_set_app_count
+  tenant_counts = parallel.map_clusterwide(
+      cluster,
+      lambda tenant: get_application_count_tenantwide(cluster, tenant),
+      max_workers=max_workers
+  )
+  if split_by_tenant:
+    return tenant_counts
+  return parallel.fold_clusterwide(tenant_counts, lambda total, count: total + count, 0)
+
+def get_application_count_setwide(full_set, max_workers=None, split_by_tenant=False):
+  """Get total count of applications for all clusters definied in variable file"""
+  set_counts = parallel.map_setwide(
+      full_set,
+      get_application_count_tenantwide,
+      max_workers=max_workers
+  )
+  if split_by_tenant:
+    return set_counts
+  return parallel.fold_setwide(set_counts, lambda total, count: total + count, 0)
 
 def add_application_tags (cluster, tenant, entity, tag_list):
   """Add tags to application"""
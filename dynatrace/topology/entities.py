@@ -0,0 +1,150 @@
+"""Compact Entity Objects for large topology lists"""
+import json
+import sys
+from dynatrace.topology import entity_cache
+from dynatrace.topology import shared as topology_shared
+
+def intern_string(value):
+  """Interned copy of a string so repeated IDs and names share memory"""
+  return sys.intern(value) if isinstance(value, str) else value
+
+def compact_relationships(relationships):
+  """Relationships dict as a tuple of (relation, tuple of interned entity IDs)"""
+  if not relationships:
+    return ()
+  return tuple(
+      (intern_string(relation), tuple(intern_string(entity_id) for entity_id in entity_ids))
+      for relation, entity_ids in relationships.items()
+  )
+
+class Entity():
+  """Common fields of a topology entity in __slots__
+
+  Repeated strings (IDs, names, tags, zones) are interned. All other
+  fields stay in the entity's JSON text and are decoded on access with
+  get() or raw_json(), so nothing else is kept as Python objects.
+  """
+  __slots__ = (
+      'entity_id',
+      'display_name',
+      'discovered_name',
+      'first_seen',
+      'last_seen',
+      'tags',
+      'management_zones',
+      '_from_relationships',
+      '_to_relationships',
+      '_raw'
+  )
+
+  def __init__(self, entity_json, raw=None):
+    self.entity_id = intern_string(entity_json.get('entityId'))
+    self.display_name = intern_string(entity_json.get('displayName'))
+    self.discovered_name = intern_string(entity_json.get('discoveredName'))
+    self.first_seen = entity_json.get('firstSeenTimestamp')
+    self.last_seen = entity_json.get('lastSeenTimestamp')
+    self.tags = tuple(
+        (intern_string(tag.get('context')), intern_string(tag.get('key')), intern_string(tag.get('value')))
+        for tag in entity_json.get('tags') or ()
+    )
+    self.management_zones = tuple(
+        (intern_string(zone.get('id')), intern_string(zone.get('name')))
+        for zone in entity_json.get('managementZones') or ()
+    )
+    self._from_relationships = compact_relationships(entity_json.get('fromRelationships'))
+    self._to_relationships = compact_relationships(entity_json.get('toRelationships'))
+    self._raw = raw if raw is not None else json.dumps(entity_json, separators=(',', ':'))
+
+  def __repr__(self):
+    return type(self).__name__ + "(" + str(self.entity_id) + ", " + repr(self.display_name) + ")"
+
+  @property
+  def from_relationships(self):
+    """fromRelationships as {relation: [entity IDs]}"""
+    return dict((relation, list(entity_ids)) for relation, entity_ids in self._from_relationships)
+
+  @property
+  def to_relationships(self):
+    """toRelationships as {relation: [entity IDs]}"""
+    return dict((relation, list(entity_ids)) for relation, entity_ids in self._to_relationships)
+
+  def related_ids(self, direction='from', relation=None):
+    """IDs related to this entity, optionally only for one relation"""
+    relationships = self._from_relationships if direction == 'from' else self._to_relationships
+    entity_ids = []
+    for name, ids in relationships:
+      if relation is None or name == relation:
+        entity_ids.extend(ids)
+    return entity_ids
+
+  def tag_strings(self):
+    """Tags as "key" or "key:value" strings"""
+    return [key if value is None else key + ":" + value for _, key, value in self.tags]
+
+  def raw_json(self):
+    """The full entity JSON from the API, decoded on every call"""
+    return json.loads(self._raw)
+
+  def get(self, key, default=None):
+    """Any field of the entity JSON, decoded from the raw text"""
+    return self.raw_json().get(key, default)
+
+class Host(Entity):
+  """Host entity"""
+  __slots__ = ('host_group_id', 'host_group_name', 'consumed_host_units', 'os_type')
+
+  def __init__(self, entity_json, raw=None):
+    super().__init__(entity_json, raw=raw)
+    host_group = entity_json.get('hostGroup') or {}
+    self.host_group_id = intern_string(host_group.get('meId'))
+    self.host_group_name = intern_string(host_group.get('name'))
+    self.consumed_host_units = entity_json.get('consumedHostUnits')
+    self.os_type = intern_string(entity_json.get('osType'))
+
+class Process(Entity):
+  """Process (process group instance) entity"""
+  __slots__ = ()
+
+class ProcessGroup(Entity):
+  """Process group entity"""
+  __slots__ = ()
+
+class Service(Entity):
+  """Service entity"""
+  __slots__ = ('service_type',)
+
+  def __init__(self, entity_json, raw=None):
+    super().__init__(entity_json, raw=raw)
+    self.service_type = intern_string(entity_json.get('serviceType'))
+
+LAYER_CLASSES = {
+    'hosts': Host,
+    'processes': Process,
+    'process-groups': ProcessGroup,
+    'services': Service
+}
+
+def from_json(layer, entity_json, raw=None):
+  """Entity object for one entity JSON of a layer"""
+  topology_shared.check_valid_layer(layer, list(LAYER_CLASSES))
+  return LAYER_CLASSES[layer](entity_json, raw=raw)
+
+def iter_env_layer_objects(cluster, tenant, layer, params=None):
+  """Yield entity objects of a layer while the response streams in"""
+  topology_shared.check_valid_layer(layer, list(LAYER_CLASSES))
+  entity_class = LAYER_CLASSES[layer]
+  for entity_json, raw in topology_shared.iter_env_layer_entities(cluster, tenant, layer, params=params, raw=True):
+    yield entity_class(entity_json, raw=raw)
+
+def get_env_layer_objects(cluster, tenant, layer, params=None):
+  """Get all entities of a layer as entity objects. Goes through the entity cache"""
+  topology_shared.check_valid_layer(layer, list(LAYER_CLASSES))
+  return entity_cache.cached(
+      cluster,
+      tenant,
+      layer,
+      None,
+      params,
+      lambda: list(iter_env_layer_objects(cluster, tenant, layer, params=params)),
+      kind='objects'
+  )
@@ -0,0 +1,125 @@
+"""Opt-in TTL cache for topology entity lookups"""
+import threading
+import time
+from collections import OrderedDict
+from dynatrace.requests import request_handler as rh
+
+DEFAULT_TTL = 300
+DEFAULT_MAX_ENTRIES = 256
+
+class EntityCache():
+  """LRU cache with a time to live, keyed by (cluster, tenant URL, layer, entity, params, kind)
+
+  Cached values are shared between callers, so treat them as read-only.
+  """
+  def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+    self.ttl = ttl
+    self.max_entries = max_entries
+    self._entries = OrderedDict()
+    self._lock = threading.Lock()
+    self._stats = {'hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0, 'invalidations': 0}
+
+  def get(self, key):
+    """Return (True, value) for a fresh entry, else (False, None)"""
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is not None and entry[0] < time.monotonic():
+        del self._entries[key]
+        self._stats['expired'] = self._stats['expired'] + 1
+        entry = None
+      if entry is None:
+        self._stats['misses'] = self._stats['misses'] + 1
+        return False, None
+      self._entries.move_to_end(key)
+      self._stats['hits'] = self._stats['hits'] + 1
+      return True, entry[1]
+
+  def put(self, key, value):
+    """Store a value, evicting the least recently used entries past max_entries"""
+    with self._lock:
+      self._entries[key] = (time.monotonic() + self.ttl, value)
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.max_entries:
+        self._entries.popitem(last=False)
+        self._stats['evictions'] = self._stats['evictions'] + 1
+
+  def invalidate(self, cluster=None, tenant=None, layer=None, entity=None):
+    """Drop entries matching every given part. Entity matches also drop their layer lists
+
+    A tenant is only told apart by its URL, so it needs its cluster.
+    """
+    if tenant is not None and cluster is None:
+      raise Exception("Invalidating a tenant needs its cluster")
+    url = cluster['url'] if cluster else None
+    tenant_url = rh.generate_tenant_url(cluster, tenant) if tenant is not None else None
+    with self._lock:
+      for key in list(self._entries):
+        key_url, key_tenant_url, key_layer, key_entity = key[:4]
+        if url is not None and key_url != url:
+          continue
+        if tenant_url is not None and key_tenant_url != tenant_url:
+          continue
+        if layer is not None and key_layer != layer:
+          continue
+        if entity is not None and key_entity not in (entity, None):
+          continue
+        del self._entries[key]
+        self._stats['invalidations'] = self._stats['invalidations'] + 1
+
+  def clear(self):
+    """Drop every entry"""
+    with self._lock:
+      self._entries.clear()
+
+  def get_stats(self):
+    """Hit/miss/eviction counters, current size and hit ratio"""
+    with self._lock:
+      stats = dict(self._stats)
+      stats['size'] = len(self._entries)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = float(stats['hits']) / lookups if lookups else 0.0
+    return stats
+
+CACHE = None
+
+def enable_cache(ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+  """Turn on caching of topology lookups for this process"""
+  global CACHE
+  CACHE = EntityCache(ttl=ttl, max_entries=max_entries)
+  return CACHE
+
+def disable_cache():
+  """Turn off caching and drop all cached entries"""
+  global CACHE
+  CACHE = None
+
+def make_key(cluster, tenant, layer, entity=None, params=None, kind=None):
+  """Cache key for a topology lookup. kind separates e.g. counts from entity lists
+
+  SaaS tenants share the cluster url, so the tenant is keyed by its URL.
+  """
+  params_key = tuple(sorted((str(key), str(value)) for key, value in params.items())) if params else ()
+  return (cluster['url'], rh.generate_tenant_url(cluster, tenant), layer, entity, params_key, kind)
+
+def cached(cluster, tenant, layer, entity, params, loader, kind=None):
+  """Return loader() through the cache when caching is enabled"""
+  cache = CACHE
+  if cache is None:
+    return loader()
+  key = make_key(cluster, tenant, layer, entity, params, kind=kind)
+  hit, value = cache.get(key)
+  if not hit:
+    value = loader()
+    cache.put(key, value)
+  return value
+
+def invalidate(cluster=None, tenant=None, layer=None, entity=None):
+  """Drop cached entries. Called automatically when entities are changed through the framework"""
+  if CACHE is not None:
+    CACHE.invalidate(cluster=cluster, tenant=tenant, layer=layer, entity=entity)
+
+def get_cache_stats():
+  """Cache statistics, or None when caching is disabled"""
+  if CACHE is None:
+    return None
+  return CACHE.get_stats()
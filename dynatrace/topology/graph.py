@@ -0,0 +1,243 @@
+"""Topology Relationship Graph with integer IDs and array adjacency lists"""
+import array
+import threading
+from collections import deque
+from dynatrace.requests import request_handler as rh
+from dynatrace.requests import json_stream
+from dynatrace.requests import parallel
+from dynatrace.topology import applications as topology_applications
+from dynatrace.topology import entities
+from dynatrace.topology import shared as topology_shared
+
+GRAPH_LAYERS = ['applications', 'hosts', 'processes', 'process-groups', 'services']
+# Layer of an entity, from the prefix of its ID
+ID_PREFIX_LAYERS = [
+    ('PROCESS_GROUP_INSTANCE-', 'processes'),
+    ('PROCESS_GROUP-', 'process-groups'),
+    ('SERVICE-', 'services'),
+    ('APPLICATION-', 'applications'),
+    ('HOST-', 'hosts')
+]
+
+def get_layer(entity_id):
+  """Layer of an entity ID, None if the prefix is unknown"""
+  for prefix, layer in ID_PREFIX_LAYERS:
+    if entity_id.startswith(prefix):
+      return layer
+  return None
+
+def build_csr(node_count, sources, targets, relations):
+  """Compressed adjacency (offsets, targets, relations) of an edge list, without duplicate edges
+
+  The neighbours of node n are targets[offsets[n]:offsets[n + 1]].
+  """
+  counts = array.array('i', bytes(4 * (node_count + 1)))
+  for source in sources:
+    counts[source + 1] = counts[source + 1] + 1
+  for node in range(node_count):
+    counts[node + 1] = counts[node + 1] + counts[node]
+  positions = array.array('i', counts)
+  sorted_targets = array.array('i', bytes(4 * len(sources)))
+  sorted_relations = array.array('i', bytes(4 * len(sources)))
+  for source, target, relation in zip(sources, targets, relations):
+    position = positions[source]
+    sorted_targets[position] = target
+    sorted_relations[position] = relation
+    positions[source] = position + 1
+
+  offsets = array.array('i', [0])
+  unique_targets = array.array('i')
+  unique_relations = array.array('i')
+  for node in range(node_count):
+    seen = set()
+    for position in range(counts[node], counts[node + 1]):
+      edge = (sorted_targets[position], sorted_relations[position])
+      if edge not in seen:
+        seen.add(edge)
+        unique_targets.append(edge[0])
+        unique_relations.append(edge[1])
+    offsets.append(len(unique_targets))
+  return offsets, unique_targets, unique_relations
+
+class TopologyGraph():
+  """Entities as integer nodes with outgoing and incoming adjacency arrays
+
+  An edge A -> B means A's fromRelationships (or B's toRelationships) list
+  B, e.g. process -isProcessOf-> host, service -runsOnProcessGroupInstance->
+  process, service -calls-> service, application -calls-> service. Edges
+  point from the dependent entity to what it depends on.
+  """
+  def __init__(self):
+    self.entity_ids = []
+    self.node_index = {}
+    self.relations = []
+    self.relation_index = {}
+    self.lock = threading.Lock()
+    self._sources = array.array('i')
+    self._targets = array.array('i')
+    self._relations = array.array('i')
+    self._built_edges = -1
+    self.out_edges = None
+    self.in_edges = None
+
+  def __len__(self):
+    return len(self.entity_ids)
+
+  def __contains__(self, entity_id):
+    return entity_id in self.node_index
+
+  def node(self, entity_id):
+    """Integer ID of an entity, added if new"""
+    node = self.node_index.get(entity_id)
+    if node is None:
+      node = len(self.entity_ids)
+      self.node_index[entity_id] = node
+      self.entity_ids.append(entity_id)
+    return node
+
+  def relation(self, name):
+    """Integer ID of a relation name, added if new"""
+    code = self.relation_index.get(name)
+    if code is None:
+      code = len(self.relations)
+      self.relation_index[name] = code
+      self.relations.append(name)
+    return code
+
+  def add_edge(self, source_id, target_id, relation):
+    """Add the edge source -relation-> target"""
+    with self.lock:
+      self._sources.append(self.node(source_id))
+      self._targets.append(self.node(target_id))
+      self._relations.append(self.relation(relation))
+
+  def add_entity(self, entity):
+    """Add an entity and its relationships. Takes entity JSON or an entities.Entity"""
+    if isinstance(entity, entities.Entity):
+      entity_id = entity.entity_id
+      from_relationships = entity.from_relationships
+      to_relationships = entity.to_relationships
+    else:
+      entity_id = entity['entityId']
+      from_relationships = entity.get('fromRelationships') or {}
+      to_relationships = entity.get('toRelationships') or {}
+    with self.lock:
+      self.node(entity_id)
+    for relation, entity_ids in from_relationships.items():
+      for other_id in entity_ids:
+        self.add_edge(entity_id, other_id, relation)
+    for relation, entity_ids in to_relationships.items():
+      for other_id in entity_ids:
+        self.add_edge(other_id, entity_id, relation)
+
+  def build(self):
+    """Build the adjacency arrays. Called by the queries whenever edges were added"""
+    with self.lock:
+      if self._built_edges == len(self._sources) and self.out_edges is not None:
+        return
+      node_count = len(self.entity_ids)
+      self.out_edges = build_csr(node_count, self._sources, self._targets, self._relations)
+      self.in_edges = build_csr(node_count, self._targets, self._sources, self._relations)
+      self._built_edges = len(self._sources)
+
+  def _adjacent(self, node, direction, relation_codes):
+    """Integer neighbours of a node"""
+    adjacency = []
+    if direction in ('out', 'both'):
+      adjacency.append(self.out_edges)
+    if direction in ('in', 'both'):
+      adjacency.append(self.in_edges)
+    for offsets, targets, relations in adjacency:
+      for position in range(offsets[node], offsets[node + 1]):
+        if relation_codes is None or relations[position] in relation_codes:
+          yield targets[position]
+
+  def _relation_codes(self, relations):
+    if relations is None:
+      return None
+    return set(self.relation_index[name] for name in relations if name in self.relation_index)
+
+  def neighbours(self, entity_id, direction='both', relations=None):
+    """Entity IDs one edge away ("out": what it depends on, "in": what depends on it)"""
+    self.build()
+    if entity_id not in self.node_index:
+      return []
+    relation_codes = self._relation_codes(relations)
+    found = []
+    seen = set()
+    for node in self._adjacent(self.node_index[entity_id], direction, relation_codes):
+      if node not in seen:
+        seen.add(node)
+        found.append(self.entity_ids[node])
+    return found
+
+  def k_hop(self, entity_ids, hops, direction='both', relations=None):
+    """Entity IDs reachable within hops edges, {entity ID: distance}. hops=None is unlimited"""
+    self.build()
+    if isinstance(entity_ids, str):
+      entity_ids = [entity_ids]
+    relation_codes = self._relation_codes(relations)
+    distances = {}
+    queue = deque()
+    for entity_id in entity_ids:
+      if entity_id in self.node_index:
+        distances[self.node_index[entity_id]] = 0
+        queue.append(self.node_index[entity_id])
+    while queue:
+      node = queue.popleft()
+      distance = distances[node]
+      if hops is not None and distance >= hops:
+        continue
+      for neighbour in self._adjacent(node, direction, relation_codes):
+        if neighbour not in distances:
+          distances[neighbour] = distance + 1
+          queue.append(neighbour)
+    return dict((self.entity_ids[node], distance) for node, distance in distances.items())
+
+  def host_outage_impact(self, host_ids, relations=None):
+    """Entities that depend on the given hosts, directly or through other entities, by layer
+
+    Follows incoming edges: processes on the hosts, services running on
+    those processes, services and applications calling those services,
+    and so on. Returns {layer: [entity IDs]} without the hosts themselves.
+    """
+    if isinstance(host_ids, str):
+      host_ids = [host_ids]
+    reached = self.k_hop(host_ids, None, direction='in', relations=relations)
+    impact = {}
+    for entity_id in reached:
+      if entity_id in host_ids:
+        continue
+      impact.setdefault(get_layer(entity_id), []).append(entity_id)
+    return impact
+
+  def get_stats(self):
+    """Number of nodes, edges and relation types"""
+    self.build()
+    return {
+        'nodes': len(self.entity_ids),
+        'edges': len(self.out_edges[1]),
+        'relations': len(self.relations)
+    }
+
+def iter_layer(cluster, tenant, layer, params=None, raw=False):
+  """Stream the entities of any graph layer. raw=True yields (entity, entity JSON text) pairs"""
+  if layer == 'applications':
+    response = rh.env_get(cluster, tenant, topology_applications.ENDPOINT, params=params, stream=True)
+    return json_stream.iter_json_array(response, raw=raw)
+  return topology_shared.iter_env_layer_entities(cluster, tenant, layer, params=params, raw=raw)
+
+def build_topology_graph(cluster, tenant, layers=None, params=None, max_workers=None):
+  """Stream the layers of a tenant (concurrently) into a TopologyGraph"""
+  layers = layers or GRAPH_LAYERS
+  for layer in layers:
+    topology_shared.check_valid_layer(layer, GRAPH_LAYERS)
+  graph = TopologyGraph()
+
+  def ingest(layer):
+    for entity in iter_layer(cluster, tenant, layer, params=params):
+      graph.add_entity(entity)
+
+  parallel.run_parallel(ingest, layers, max_workers=max_workers)
+  graph.build()
+  return graph
@@ -0,0 +1,163 @@
+"""Host Unit Report across tenants, clusters and the full set"""
+import array
+import csv
+import json
+from dynatrace.requests import parallel
+from dynatrace.topology import hosts as topology_hosts
+
+DIMENSIONS = ['cluster', 'tenant', 'host_group', 'os', 'management_zone']
+NO_VALUE = "(none)"
+
+class LabelColumn():
+  """Dictionary encoded string column: one int code per row and the distinct labels"""
+  def __init__(self):
+    self.codes = array.array('i')
+    self.labels = []
+    self.index = {}
+
+  def encode(self, label):
+    """Code of a label, added to the labels if new"""
+    code = self.index.get(label)
+    if code is None:
+      code = len(self.labels)
+      self.index[label] = code
+      self.labels.append(label)
+    return code
+
+  def append(self, label):
+    """Add a row"""
+    self.codes.append(self.encode(label))
+
+class HostUnitTable():
+  """Only the host fields needed for licensing, stored as columns
+
+  Management zones are kept as (host row, zone) pairs, since a host can
+  be in several zones. Its host units count towards each of them.
+  """
+  def __init__(self):
+    self.host_units = array.array('d')
+    self.columns = dict(
+        (dimension, LabelColumn()) for dimension in DIMENSIONS if dimension != 'management_zone'
+    )
+    self.zone_rows = array.array('i')
+    self.zones = LabelColumn()
+
+  def __len__(self):
+    return len(self.host_units)
+
+  def add_host(self, cluster_name, tenant, host):
+    """Project one host from the hosts API into the columns"""
+    row = len(self.host_units)
+    self.host_units.append(host.get('consumedHostUnits') or 0.0)
+    self.columns['cluster'].append(cluster_name)
+    self.columns['tenant'].append(tenant)
+    self.columns['host_group'].append((host.get('hostGroup') or {}).get('name', NO_VALUE))
+    self.columns['os'].append(host.get('osType') or NO_VALUE)
+    zones = host.get('managementZones') or [{'name': NO_VALUE}]
+    for zone in zones:
+      self.zone_rows.append(row)
+      self.zones.append(zone['name'])
+
+  def extend(self, other):
+    """Append the rows of another table"""
+    offset = len(self.host_units)
+    self.host_units.extend(other.host_units)
+    for dimension, column in self.columns.items():
+      other_column = other.columns[dimension]
+      recode = [column.encode(label) for label in other_column.labels]
+      column.codes.extend(recode[code] for code in other_column.codes)
+    recode = [self.zones.encode(label) for label in other.zones.labels]
+    self.zone_rows.extend(row + offset for row in other.zone_rows)
+    self.zones.codes.extend(recode[code] for code in other.zones.codes)
+
+  def summarize(self):
+    """Hosts and host units per value of every dimension, in one pass over the rows
+
+    Returns {'total': {...}, dimension: {label: {'hosts': int, 'host_units': float}}}
+    """
+    sums = {}
+    counts = {}
+    for dimension, column in self.columns.items():
+      sums[dimension] = array.array('d', bytes(8 * len(column.labels)))
+      counts[dimension] = array.array('i', bytes(4 * len(column.labels)))
+    column_items = [(sums[dimension], counts[dimension], column.codes)
+                    for dimension, column in self.columns.items()]
+    for row, units in enumerate(self.host_units):
+      for dimension_sums, dimension_counts, codes in column_items:
+        code = codes[row]
+        dimension_sums[code] = dimension_sums[code] + units
+        dimension_counts[code] = dimension_counts[code] + 1
+
+    zone_sums = array.array('d', bytes(8 * len(self.zones.labels)))
+    zone_counts = array.array('i', bytes(4 * len(self.zones.labels)))
+    for row, code in zip(self.zone_rows, self.zones.codes):
+      zone_sums[code] = zone_sums[code] + self.host_units[row]
+      zone_counts[code] = zone_counts[code] + 1
+    sums['management_zone'] = zone_sums
+    counts['management_zone'] = zone_counts
+
+    summary = {'total': {'hosts': len(self.host_units), 'host_units': sum(self.host_units)}}
+    for dimension in DIMENSIONS:
+      labels = self.zones.labels if dimension == 'management_zone' else self.columns[dimension].labels
+      summary[dimension] = dict(
+          (label, {'hosts': counts[dimension][code], 'host_units': sums[dimension][code]})
+          for code, label in enumerate(labels)
+      )
+    return summary
+
+  def export_json(self, file_name):
+    """Write the summary to a JSON file"""
+    with open(file_name, 'w') as report_file:
+      json.dump(self.summarize(), report_file, indent=2)
+
+  def export_csv(self, file_name, dimensions=None):
+    """Write the summary as "dimension,value,hosts,host_units" rows to a CSV file"""
+    summary = self.summarize()
+    with open(file_name, 'w', newline='') as report_file:
+      writer = csv.writer(report_file)
+      writer.writerow(['dimension', 'value', 'hosts', 'host_units'])
+      writer.writerow(['total', '', summary['total']['hosts'], summary['total']['host_units']])
+      for dimension in dimensions or DIMENSIONS:
+        for label, values in sorted(summary[dimension].items()):
+          writer.writerow([dimension, label, values['hosts'], values['host_units']])
+
+def get_host_unit_table_tenantwide(cluster, tenant, params=None, cluster_name=None):
+  """Stream the hosts of a tenant into a HostUnitTable"""
+  table = HostUnitTable()
+  cluster_name = cluster_name or cluster['url']
+  for host in topology_hosts.iter_hosts_tenantwide(cluster, tenant, params=params):
+    table.add_host(cluster_name, tenant, host)
+  return table
+
+def get_host_unit_table_clusterwide(cluster, params=None, max_workers=None, cluster_name=None):
+  """HostUnitTable of every tenant in a cluster. Tenants are fetched in parallel"""
+  tenant_tables = parallel.map_clusterwide(
+      cluster,
+      lambda tenant: get_host_unit_table_tenantwide(
+          cluster, tenant, params=params, cluster_name=cluster_name
+      ),
+      max_workers=max_workers
+  )
+  table = HostUnitTable()
+  for tenant_table in tenant_tables.values():
+    table.extend(tenant_table)
+  return table
+
+def get_host_unit_table_setwide(full_set, params=None, max_workers=None):
+  """HostUnitTable of every tenant of every cluster in the set, fetched in parallel"""
+  pairs = [
+      (cluster_name, tenant)
+      for cluster_name, cluster in full_set.items()
+      for tenant in cluster['tenant']
+  ]
+  tenant_tables = parallel.run_parallel(
+      lambda pair: get_host_unit_table_tenantwide(
+          full_set[pair[0]], pair[1], params=params, cluster_name=pair[0]
+      ),
+      pairs,
+      max_workers=max_workers
+  )
+  table = HostUnitTable()
+  for tenant_table in tenant_tables:
+    table.extend(tenant_table)
+  return table
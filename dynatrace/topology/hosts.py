@@ -1,11 +1,20 @@
 """Host operations from the Dynatrace API"""
 import dynatrace.topology.shared as topology_shared
+from dynatrace.topology import entities
 from dynatrace.requests import request_handler as rh
+from dynatrace.requests import parallel
+from dynatrace.topology import entity_cache
 
-def get_hosts_tenantwide(cluster, tenant, params=None):
-  """Get Information for all hosts in a tenant"""
+def get_hosts_tenantwide(cluster, tenant, params=None, as_objects=False):
+  """Get Information for all hosts in a tenant. as_objects returns compact Host objects"""
+  if as_objects:
+    return entities.get_env_layer_objects(cluster, tenant, 'hosts', params=params)
   return topology_shared.get_env_layer_entities(cluster, tenant, 'hosts', params=params)
 
+def iter_hosts_tenantwide(cluster, tenant, params=None):
+  """Yield hosts of a tenant one at a time without loading the full list"""
+  return topology_shared.iter_env_layer_entities(cluster, tenant, 'hosts', params=params)
+
 def get_host(cluster, tenant, entity, params=None):
   """Get Information on one host for in a tenant"""
   return topology_shared.get_env_layer_entity(cluster, tenant,'hosts', entity, params=params)
@@ -18,13 +27,25 @@ def get_host_count_tenantwide(cluster, tenant, params=None):
   """Get total count for all hosts in a tenant"""
   return topology_shared.get_env_layer_count(cluster, tenant, 'hosts', params=params)
 
-def get_host_count_clusterwide(cluster, params=None):
+def get_host_count_clusterwide(cluster, params=None, max_workers=None, split_by_tenant=False):
   """Get total count for all hosts in cluster"""
-  return topology_shared.get_cluster_layer_count(cluster, 'hosts', params=params)
+  return topology_shared.get_cluster_layer_count(
+      cluster,
+      'hosts',
+      params=params,
+      max_workers=max_workers,
+      split_by_tenant=split_by_tenant
+  )
 
-def get_host_count_setwide(full_set, params=None):
+def get_host_count_setwide(full_set, params=None, max_workers=None, split_by_tenant=False):
   """Get total count of hosts for all clusters definied in variable file"""
-  return topology_shared.get_set_layer_count(full_set, 'hosts', params=params)
+  return topology_shared.get_set_layer_count(
+      full_set,
+      'hosts',
+      params=params,
+      max_workers=max_workers,
+      split_by_tenant=split_by_tenant
+  )
 
 def add_host_tags (cluster, tenant, entity, tag_list):
   """Add tags to host"""
@@ -34,11 +55,35 @@ def delete_host_tag (cluster, tenant, entity, tag):
   """Remove single tag from host"""
   if tag is None:
     raise Exception ("Tag cannot be None!")
-  return rh.env_delete(cluster, tenant, "entity/infrastructure/hosts/" + entity + "/tags/" + str(tag))
+  response = rh.env_delete(cluster, tenant, "entity/infrastructure/hosts/" + entity + "/tags/" + str(tag))
+  entity_cache.invalidate(cluster=cluster, tenant=tenant, layer='hosts', entity=entity)
+  return response
 
 def get_host_units_tenantwide(cluster, tenant, params=None):
+  """Get total consumed host units in a tenant"""
   consumed_host_units = 0
-  host_list = get_hosts_tenantwide (cluster, tenant, params=params)
-  for host in host_list:
+  for host in iter_hosts_tenantwide(cluster, tenant, params=params):
     consumed_host_units = consumed_host_units + host['consumedHostUnits']
-  return consumed_host_units
\ No newline at end of file
+  return consumed_host_units
+
+def get_host_units_clusterwide(cluster, params=None, max_workers=None, split_by_tenant=False):
+  """Get total consumed host units in a cluster. Tenants are queried in parallel"""
+  tenant_units = parallel.map_clusterwide(
+      cluster,
+      lambda tenant: get_host_units_tenantwide(cluster, tenant, params=params),
+      max_workers=max_workers
+  )
+  if split_by_tenant:
+    return tenant_units
+  return parallel.fold_clusterwide(tenant_units, lambda total, units: total + units, 0)
+
+def get_host_units_setwide(full_set, params=None, max_workers=None, split_by_tenant=False):
+  """Get total consumed host units in all clusters of the set. Tenants are queried in parallel"""
+  set_units = parallel.map_setwide(
+      full_set,
+      lambda cluster, tenant: get_host_units_tenantwide(cluster, tenant, params=params),
+      max_workers=max_workers
+  )
+  if split_by_tenant:
+    return set_units
+  return parallel.fold_setwide(set_units, lambda total, units: total + units, 0)
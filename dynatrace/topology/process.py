@@ -1,11 +1,18 @@
 """Process operations from the Dynatrace API"""
 import dynatrace.topology.shared as topology_shared
+from dynatrace.topology import entities
 from dynatrace.requests import request_handler as rh
 
-def get_processes_tenantwide(cluster, tenant, params=None):
-  """Get Information for all processes in a tenant"""
+def get_processes_tenantwide(cluster, tenant, params=None, as_objects=False):
+  """Get Information for all processes in a tenant. as_objects returns compact Process objects"""
+  if as_objects:
+    return entities.get_env_layer_objects(cluster, tenant, 'processes', params=params)
   return topology_shared.get_env_layer_entities(cluster, tenant, 'processes', params=params)
 
+def iter_processes_tenantwide(cluster, tenant, params=None):
+  """Yield processes of a tenant one at a time without loading the full list"""
+  return topology_shared.iter_env_layer_entities(cluster, tenant, 'processes', params=params)
+
 def get_process(cluster, tenant, entity, params=None):
   """Get Information on one process for in a tenant"""
   return topology_shared.get_env_layer_entity(cluster, tenant,'processes', entity, params=params)
\ No newline at end of file
@@ -1,11 +1,18 @@
 """Process Group operations from the Dynatrace API"""
 import dynatrace.topology.shared as topology_shared
+from dynatrace.topology import entities
 from dynatrace.requests import request_handler as rh
 
-def get_process_groups_tenantwide(cluster, tenant):
-  """Get Information for all process-groups in a tenant"""
+def get_process_groups_tenantwide(cluster, tenant, as_objects=False):
+  """Get Information for all process-groups in a tenant. as_objects returns compact ProcessGroup objects"""
+  if as_objects:
+    return entities.get_env_layer_objects(cluster, tenant, 'process-groups')
   return topology_shared.get_env_layer_entities(cluster, tenant, 'process-groups')
 
+def iter_process_groups_tenantwide(cluster, tenant, params=None):
+  """Yield process-groups of a tenant one at a time without loading the full list"""
+  return topology_shared.iter_env_layer_entities(cluster, tenant, 'process-groups', params=params)
+
 def get_process_group(cluster, tenant, entity):
   """Get Information on one process-group for in a tenant"""
   return topology_shared.get_env_layer_entity(cluster, tenant,'process-groups', entity)
@@ -18,13 +25,25 @@ def get_process_group_count_tenantwide(cluster, tenant, params=None):
   """Get total count for all process-groups in a tenant"""
   return topology_shared.get_env_layer_count(cluster, tenant, 'process-groups', params=params)
 
-def get_process_group_count_clusterwide(cluster, params=None):
+def get_process_group_count_clusterwide(cluster, params=None, max_workers=None, split_by_tenant=False):
   """Get total count for all process-groups in cluster"""
-  return topology_shared.get_cluster_layer_count(cluster, 'process-groups', params=params)
+  return topology_shared.get_cluster_layer_count(
+      cluster,
+      'process-groups',
+      params=params,
+      max_workers=max_workers,
+      split_by_tenant=split_by_tenant
+  )
 
-def get_process_group_count_setwide(full_set, params=None):
+def get_process_group_count_setwide(full_set, params=None, max_workers=None, split_by_tenant=False):
   """Get total count of process-groups for all clusters defined in variable file"""
-  return topology_shared.get_set_layer_count(full_set, 'process-groups', params=params)
+  return topology_shared.get_set_layer_count(
+      full_set,
+      'process-groups',
+      params=params,
+      max_workers=max_workers,
+      split_by_tenant=split_by_tenant
+  )
 
 def add_process_group_tags (cluster, tenant, entity, tag_list):
   """Add tags to a process group"""
@@ -1,11 +1,18 @@
 """Service operations from the Dynatrace API"""
 import dynatrace.topology.shared as topology_shared
+from dynatrace.topology import entities
 from dynatrace.requests import request_handler as rh
 
-def get_services_tenantwide(cluster, tenant):
-  """Get Information for all services in a tenant"""
+def get_services_tenantwide(cluster, tenant, as_objects=False):
+  """Get Information for all services in a tenant. as_objects returns compact Service objects"""
+  if as_objects:
+    return entities.get_env_layer_objects(cluster, tenant, 'services')
   return topology_shared.get_env_layer_entities(cluster, tenant, 'services')
 
+def iter_services_tenantwide(cluster, tenant, params=None):
+  """Yield services of a tenant one at a time without loading the full list"""
+  return topology_shared.iter_env_layer_entities(cluster, tenant, 'services', params=params)
+
 def get_service(cluster, tenant, entity):
   """Get Information on one service for in a tenant"""
   return topology_shared.get_env_layer_entity(cluster, tenant,'services', entity)
@@ -18,13 +25,25 @@ def get_service_count_tenantwide(cluster, tenant, params=None):
   """Get total count for all services in a tenant"""
   return topology_shared.get_env_layer_count(cluster, tenant, 'services', params=params)
 
-def get_service_count_clusterwide(cluster, params=None):
+def get_service_count_clusterwide(cluster, params=None, max_workers=None, split_by_tenant=False):
   """Get total count for all services in cluster"""
-  return topology_shared.get_cluster_layer_count(cluster, 'services', params=params)
+  return topology_shared.get_cluster_layer_count(
+      cluster,
+      'services',
+      params=params,
+      max_workers=max_workers,
+      split_by_tenant=split_by_tenant
+  )
 
-def get_service_count_setwide(full_set, params=None):
+def get_service_count_setwide(full_set, params=None, max_workers=None, split_by_tenant=False):
   """Get total count of services for all clusters definied in variable file"""
-  return topology_shared.get_set_layer_count(full_set, 'services', params=params)
+  return topology_shared.get_set_layer_count(
+      full_set,
+      'services',
+      params=params,
+      max_workers=max_workers,
+      split_by_tenant=split_by_tenant
+  )
 
 def add_service_tags (cluster, tenant, entity, tag_list):
   """Add tags to a service"""
@@ -1,5 +1,8 @@
 """Shared topology operations for multiple layers from the Dynatrace API"""
 from dynatrace.requests import request_handler as rh
+from dynatrace.requests import parallel
+from dynatrace.requests import json_stream
+from dynatrace.topology import entity_cache
 # Layer Compatibility
 # 1. Get all entities - application, host, process, process group, service
 #   1a. Count all entities
@@ -20,25 +23,44 @@ def get_env_layer_entities(cluster, tenant, layer, params=None):
   """Get all Entities of Specified Layer"""
   layer_list = ['applications','hosts', 'processes', 'process-groups', 'services']
   check_valid_layer(layer, layer_list)
+  return entity_cache.cached(
+      cluster,
+      tenant,
+      layer,
+      None,
+      params,
+      lambda: rh.env_get(cluster, tenant, ENDPOINT + layer, params=params).json()
+  )
+
+def iter_env_layer_entities(cluster, tenant, layer, params=None, chunk_size=json_stream.DEFAULT_CHUNK_SIZE,
+                            raw=False):
+  """Yield Entities of Specified Layer one at a time while the response streams in
+
+  With raw=True, (entity, entity JSON text) pairs are yielded.
+  """
+  layer_list = ['applications','hosts', 'processes', 'process-groups', 'services']
+  check_valid_layer(layer, layer_list)
   response = rh.env_get(
       cluster,
       tenant,
       ENDPOINT + layer,
-      params=params
+      params=params,
+      stream=True
   )
-  return response.json()
+  return json_stream.iter_json_array(response, chunk_size=chunk_size, raw=raw)
 
 def get_env_layer_entity(cluster, tenant, layer, entity, params=None):
   """Get Entity Information for Specified Layer"""
   layer_list = ['applications','hosts', 'processes', 'process-groups', 'services']
   check_valid_layer(layer, layer_list)
-  response = rh.env_get(
+  return entity_cache.cached(
       cluster,
       tenant,
-      ENDPOINT + layer + "/" + entity,
-      params=params
+      layer,
+      entity,
+      params,
+      lambda: rh.env_get(cluster, tenant, ENDPOINT + layer + "/" + entity, params=params).json()
   )
-  return response.json()
 
 def set_env_layer_properties(cluster, tenant, layer, entity, prop_json):
   """Update Properties of Entity"""
@@ -50,44 +72,57 @@ def set_env_layer_properties(cluster, tenant, layer, entity, prop_json):
       ENDPOINT + layer + "/" + entity,
       json=prop_json
   )
+  entity_cache.invalidate(cluster=cluster, tenant=tenant, layer=layer, entity=entity)
   return response.status_code
 
-def get_env_layer_count(cluster, tenant, layer, params=None):
-  """Get total hosts in an environment"""
+def get_count_params(params=None):
+  """Copy of params with the slimmest list payload as default"""
+  count_params = dict(params) if params else {}
+  count_params.setdefault('relativeTime', "day")
+  count_params.setdefault('includeDetails', "false")
+  return count_params
 
-  layer_list = ['applications','hosts', 'processes', 'process-groups', 'services']
-  if not params:
-    params = {}
-  if 'relativeTime' not in params.keys():
-    params['relativeTime'] : "day"
-  if 'includeDetails' not in params.keys():
-    params['includeDetails'] : "false"
+def count_env_entities(cluster, tenant, layer, endpoint, params=None):
+  """Count the entities of a list endpoint while the response streams in. Cached per tenant"""
+  return entity_cache.cached(
+      cluster,
+      tenant,
+      layer,
+      None,
+      params,
+      lambda: json_stream.count_json_array(
+          rh.env_get(cluster, tenant, endpoint, params=params, stream=True)
+      ),
+      kind='count'
+  )
 
+def get_env_layer_count(cluster, tenant, layer, params=None):
+  """Get total entities of a layer in an environment without downloading their details"""
+  layer_list = ['applications','hosts', 'processes', 'process-groups', 'services']
   check_valid_layer(layer, layer_list)
-  response = rh.env_get(cluster, tenant, ENDPOINT + layer, params=params)
-  env_layer_count = len(response.json())
-  return env_layer_count
+  return count_env_entities(cluster, tenant, layer, ENDPOINT + layer, params=get_count_params(params))
 
-def get_cluster_layer_count(cluster, layer, params=None):
+def get_cluster_layer_count(cluster, layer, params=None, max_workers=None, split_by_tenant=False):
   """Get total count for all environments in cluster"""
-  cluster_layer_count = 0
-  for env_key in cluster['tenant']:
-    cluster_layer_count = cluster_layer_count + get_env_layer_count(
-        cluster,
-        env_key,
-        layer,
-        params=params
-    )
-  return cluster_layer_count
+  tenant_counts = parallel.map_clusterwide(
+      cluster,
+      lambda tenant: get_env_layer_count(cluster, tenant, layer, params=params),
+      max_workers=max_workers
+  )
+  if split_by_tenant:
+    return tenant_counts
+  return parallel.fold_clusterwide(tenant_counts, lambda total, count: total + count, 0)
 
-def get_set_layer_count(full_set, layer, params=None):
+def get_set_layer_count(full_set, layer, params=None, max_workers=None, split_by_tenant=False):
   """Get total count for all clusters definied in variable file"""
-  full_set_layer_count = 0
-  for cluster_items in full_set.values():
-    full_set_layer_count = \
-        full_set_layer_count + \
-        get_cluster_layer_count(cluster_items, layer, params=params)
-  return full_set_layer_count
+  set_counts = parallel.map_setwide(
+      full_set,
+      lambda cluster, tenant: get_env_layer_count(cluster, tenant, layer, params=params),
+      max_workers=max_workers
+  )
+  if split_by_tenant:
+    return set_counts
+  return parallel.fold_setwide(set_counts, lambda total, count: total + count, 0)
 
 def add_env_layer_tags (cluster, tenant, layer, entity, tag_list):
   layer_list = ['applications','hosts', 'custom', 'process-groups', 'services']
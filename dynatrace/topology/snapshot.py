@@ -0,0 +1,310 @@
+"""Persistent Topology Snapshot in SQLite with incremental refresh"""
+import json
+import sqlite3
+import threading
+import time
+from dynatrace.requests import parallel
+from dynatrace.topology import graph as topology_graph
+from dynatrace.topology import shared as topology_shared
+
+# A refresh asks for entities seen since the watermark minus this overlap
+DEFAULT_OVERLAP_MS = 10 * 60 * 1000
+# Entities not seen for this long are removed by prune(), like the API's default 72h window
+DEFAULT_MAX_AGE_MS = 72 * 60 * 60 * 1000
+BATCH_SIZE = 500
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS entities (
+        cluster TEXT NOT NULL,
+        tenant TEXT NOT NULL,
+        layer TEXT NOT NULL,
+        entity_id TEXT NOT NULL,
+        display_name TEXT,
+        host_group_id TEXT,
+        host_group_name TEXT,
+        first_seen INTEGER,
+        last_seen INTEGER,
+        json TEXT NOT NULL,
+        PRIMARY KEY (cluster, tenant, entity_id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS tags (
+        cluster TEXT NOT NULL,
+        tenant TEXT NOT NULL,
+        entity_id TEXT NOT NULL,
+        context TEXT,
+        key TEXT,
+        value TEXT
+    )""",
+    """CREATE TABLE IF NOT EXISTS refreshes (
+        cluster TEXT NOT NULL,
+        tenant TEXT NOT NULL,
+        layer TEXT NOT NULL,
+        watermark INTEGER,
+        refreshed INTEGER,
+        PRIMARY KEY (cluster, tenant, layer)
+    )""",
+    "CREATE INDEX IF NOT EXISTS entities_entity_id ON entities (entity_id)",
+    "CREATE INDEX IF NOT EXISTS entities_display_name ON entities (display_name)",
+    "CREATE INDEX IF NOT EXISTS entities_host_group_id ON entities (host_group_id)",
+    "CREATE INDEX IF NOT EXISTS entities_host_group_name ON entities (host_group_name)",
+    "CREATE INDEX IF NOT EXISTS entities_layer ON entities (cluster, tenant, layer, last_seen)",
+    "CREATE INDEX IF NOT EXISTS tags_key ON tags (key, value)",
+    "CREATE INDEX IF NOT EXISTS tags_entity ON tags (cluster, tenant, entity_id)"
+]
+
+def now_ms():
+  """Current time in epoch milliseconds"""
+  return int(time.time() * 1000)
+
+def entity_row(cluster_name, tenant, layer, entity, raw):
+  """Row of the entities table for one entity"""
+  host_group = entity.get('hostGroup') or {}
+  return (
+      cluster_name,
+      tenant,
+      layer,
+      entity['entityId'],
+      entity.get('displayName'),
+      host_group.get('meId'),
+      host_group.get('name'),
+      entity.get('firstSeenTimestamp'),
+      entity.get('lastSeenTimestamp'),
+      raw
+  )
+
+def tag_rows(cluster_name, tenant, entity):
+  """Rows of the tags table for one entity"""
+  return [
+      (cluster_name, tenant, entity['entityId'], tag.get('context'), tag.get('key'), tag.get('value'))
+      for tag in entity.get('tags') or ()
+  ]
+
+class TopologySnapshot():
+  """All topology layers of any number of tenants in one SQLite file
+
+  Entities are stored as their API JSON, with indexed columns for
+  entityId, displayName, host group and tags. The highest
+  lastSeenTimestamp of a (cluster, tenant, layer) is its watermark: a
+  refresh only asks for the entities seen since then (startTimestamp),
+  which are the ones that can have changed. Queries never call the API.
+  """
+  def __init__(self, file_name, overlap_ms=DEFAULT_OVERLAP_MS, max_age_ms=DEFAULT_MAX_AGE_MS):
+    self.file_name = file_name
+    self.overlap_ms = overlap_ms
+    self.max_age_ms = max_age_ms
+    self.lock = threading.Lock()
+    self.connection = sqlite3.connect(file_name, check_same_thread=False)
+    with self.lock:
+      self.connection.execute("PRAGMA journal_mode=WAL")
+      self.connection.execute("PRAGMA synchronous=NORMAL")
+      for statement in SCHEMA:
+        self.connection.execute(statement)
+      self.connection.commit()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+  def close(self):
+    """Close the database"""
+    with self.lock:
+      self.connection.close()
+
+  def query(self, statement, parameters=()):
+    """Run a read query and return all rows"""
+    with self.lock:
+      return self.connection.execute(statement, parameters).fetchall()
+
+  def get_watermark(self, cluster_name, tenant, layer):
+    """Highest lastSeenTimestamp stored for a layer, None before the first refresh"""
+    rows = self.query(
+        "SELECT watermark FROM refreshes WHERE cluster = ? AND tenant = ? AND layer = ?",
+        (cluster_name, tenant, layer)
+    )
+    return rows[0][0] if rows else None
+
+  def store(self, cluster_name, tenant, layer, batch):
+    """Insert or replace a batch of (entity, raw JSON) pairs and their tags"""
+    entity_rows = [entity_row(cluster_name, tenant, layer, entity, raw) for entity, raw in batch]
+    tags = []
+    for entity, _ in batch:
+      tags.extend(tag_rows(cluster_name, tenant, entity))
+    with self.lock:
+      with self.connection:
+        self.connection.executemany(
+            "DELETE FROM tags WHERE cluster = ? AND tenant = ? AND entity_id = ?",
+            [(cluster_name, tenant, entity['entityId']) for entity, _ in batch]
+        )
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO entities VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", entity_rows
+        )
+        self.connection.executemany("INSERT INTO tags VALUES (?, ?, ?, ?, ?, ?)", tags)
+
+  def refresh_layer(self, cluster, tenant, layer, params=None, cluster_name=None):
+    """Pull the entities of a layer seen since its watermark. Returns the number stored
+
+    The first refresh pulls the whole layer (with params as given).
+    """
+    cluster_name = cluster_name or cluster['url']
+    watermark = self.get_watermark(cluster_name, tenant, layer)
+    refreshed = now_ms()
+    layer_params = dict(params) if params else {}
+    if watermark is not None:
+      layer_params.pop('relativeTime', None)
+      layer_params['startTimestamp'] = watermark - self.overlap_ms
+      layer_params['endTimestamp'] = refreshed
+
+    stored = 0
+    batch = []
+    for entity, raw in topology_graph.iter_layer(cluster, tenant, layer, params=layer_params, raw=True):
+      batch.append((entity, raw))
+      last_seen = entity.get('lastSeenTimestamp')
+      if last_seen is not None and (watermark is None or last_seen > watermark):
+        watermark = last_seen
+      if len(batch) >= BATCH_SIZE:
+        self.store(cluster_name, tenant, layer, batch)
+        stored = stored + len(batch)
+        batch = []
+    if batch:
+      self.store(cluster_name, tenant, layer, batch)
+      stored = stored + len(batch)
+    if watermark is None:
+      watermark = refreshed
+
+    with self.lock:
+      with self.connection:
+        self.connection.execute(
+            "INSERT OR REPLACE INTO refreshes VALUES (?, ?, ?, ?, ?)",
+            (cluster_name, tenant, layer, watermark, refreshed)
+        )
+    return stored
+
+  def refresh(self, targets, layers=None, params=None, max_workers=None):
+    """Refresh every layer of [(cluster_name, cluster, tenant)] concurrently
+
+    Returns {cluster_name: {tenant: {layer: number stored}}}
+    """
+    layers = layers or topology_graph.GRAPH_LAYERS
+    for layer in layers:
+      topology_shared.check_valid_layer(layer, topology_graph.GRAPH_LAYERS)
+    items = [
+        (cluster_name, cluster, tenant, layer)
+        for cluster_name, cluster, tenant in targets
+        for layer in layers
+    ]
+    results = parallel.run_parallel(
+        lambda item: self.refresh_layer(item[1], item[2], item[3], params=params, cluster_name=item[0]),
+        items,
+        max_workers=max_workers
+    )
+    counts = {}
+    for (cluster_name, _, tenant, layer), stored in zip(items, results):
+      counts.setdefault(cluster_name, {}).setdefault(tenant, {})[layer] = stored
+    return counts
+
+  def refresh_tenantwide(self, cluster, tenant, layers=None, params=None, max_workers=None,
+                         cluster_name=None):
+    """Refresh the layers of one tenant"""
+    cluster_name = cluster_name or cluster['url']
+    return self.refresh([(cluster_name, cluster, tenant)], layers=layers, params=params,
+                        max_workers=max_workers)
+
+  def refresh_clusterwide(self, cluster, layers=None, params=None, max_workers=None,
+                          cluster_name=None):
+    """Refresh the layers of every tenant in a cluster"""
+    cluster_name = cluster_name or cluster['url']
+    targets = [(cluster_name, cluster, tenant) for tenant in cluster['tenant']]
+    return self.refresh(targets, layers=layers, params=params, max_workers=max_workers)
+
+  def refresh_setwide(self, full_set, layers=None, params=None, max_workers=None):
+    """Refresh the layers of every tenant of every cluster in the set"""
+    targets = [
+        (cluster_name, cluster, tenant)
+        for cluster_name, cluster in full_set.items()
+        for tenant in cluster['tenant']
+    ]
+    return self.refresh(targets, layers=layers, params=params, max_workers=max_workers)
+
+  def prune(self, now=None):
+    """Remove entities not seen within max_age_ms. Returns the number removed"""
+    cutoff = (now or now_ms()) - self.max_age_ms
+    with self.lock:
+      with self.connection:
+        self.connection.execute(
+            "DELETE FROM tags WHERE (cluster, tenant, entity_id) IN "
+            "(SELECT cluster, tenant, entity_id FROM entities WHERE last_seen < ?)",
+            (cutoff,)
+        )
+        return self.connection.execute("DELETE FROM entities WHERE last_seen < ?", (cutoff,)).rowcount
+
+  def select(self, condition, parameters, cluster_name=None, tenant=None, layer=None, join=""):
+    """Entity JSON of the rows matching a condition, optionally within one cluster, tenant or layer"""
+    conditions = [condition]
+    parameters = list(parameters)
+    for column, value in (('cluster', cluster_name), ('tenant', tenant), ('layer', layer)):
+      if value is not None:
+        conditions.append("entities." + column + " = ?")
+        parameters.append(value)
+    rows = self.query(
+        "SELECT DISTINCT entities.json FROM entities " + join + " WHERE " + " AND ".join(conditions),
+        parameters
+    )
+    return [json.loads(row[0]) for row in rows]
+
+  def get_entity(self, entity_id, cluster_name=None, tenant=None):
+    """Entity JSON by entityId, None if it is not in the snapshot"""
+    entities = self.select("entities.entity_id = ?", [entity_id], cluster_name=cluster_name, tenant=tenant)
+    return entities[0] if entities else None
+
+  def get_layer_entities(self, tenant, layer, cluster_name=None):
+    """All stored entities of a layer, like get_env_layer_entities"""
+    return self.select("1 = 1", [], cluster_name=cluster_name, tenant=tenant, layer=layer)
+
+  def find_by_name(self, name, cluster_name=None, tenant=None, layer=None):
+    """Entities with this displayName"""
+    return self.select("entities.display_name = ?", [name],
+                       cluster_name=cluster_name, tenant=tenant, layer=layer)
+
+  def find_by_host_group(self, host_group, cluster_name=None, tenant=None, layer=None):
+    """Hosts in a host group, by its name or meId"""
+    return self.select(
+        "(entities.host_group_name = ? OR entities.host_group_id = ?)", [host_group, host_group],
+        cluster_name=cluster_name, tenant=tenant, layer=layer
+    )
+
+  def find_by_tag(self, key, value=None, context=None, cluster_name=None, tenant=None, layer=None):
+    """Entities with a tag key, optionally with this value and context"""
+    condition = "tags.key = ?"
+    parameters = [key]
+    if value is not None:
+      condition = condition + " AND tags.value = ?"
+      parameters.append(value)
+    if context is not None:
+      condition = condition + " AND tags.context = ?"
+      parameters.append(context)
+    return self.select(
+        condition, parameters, cluster_name=cluster_name, tenant=tenant, layer=layer,
+        join="JOIN tags ON tags.cluster = entities.cluster AND tags.tenant = entities.tenant"
+             " AND tags.entity_id = entities.entity_id"
+    )
+
+  def count(self, cluster_name=None, tenant=None, layer=None):
+    """Number of stored entities, optionally within one cluster, tenant or layer"""
+    conditions = ["1 = 1"]
+    parameters = []
+    for column, value in (('cluster', cluster_name), ('tenant', tenant), ('layer', layer)):
+      if value is not None:
+        conditions.append(column + " = ?")
+        parameters.append(value)
+    return self.query("SELECT COUNT(*) FROM entities WHERE " + " AND ".join(conditions), parameters)[0][0]
+
+  def get_graph(self, tenant, cluster_name=None, layers=None):
+    """TopologyGraph of a tenant built from the snapshot"""
+    graph = topology_graph.TopologyGraph()
+    for layer in layers or topology_graph.GRAPH_LAYERS:
+      for entity in self.get_layer_entities(tenant, layer, cluster_name=cluster_name):
+        graph.add_entity(entity)
+    graph.build()
+    return graph
@@ -0,0 +1,126 @@
+"""Bulk Tag Reconciliation for topology entities"""
+import threading
+from dynatrace.requests import request_handler as rh
+from dynatrace.requests import json_stream
+from dynatrace.requests import parallel
+from dynatrace.topology import applications as topology_applications
+from dynatrace.topology import hosts as topology_hosts
+from dynatrace.topology import shared as topology_shared
+
+TAG_LAYERS = ['applications', 'hosts', 'process-groups', 'services']
+# The v1 API can only remove tags from hosts
+TAG_DELETE_LAYERS = ['hosts']
+
+def tag_to_string(tag):
+  """Tag dict from the API as the "key" or "key:value" string used to add it"""
+  if tag.get('value') is not None:
+    return str(tag['key']) + ":" + str(tag['value'])
+  return str(tag['key'])
+
+def tag_key(tag_string):
+  """Key part of a "key" or "key:value" tag string"""
+  return tag_string.split(":", 1)[0]
+
+def iter_layer_entities(cluster, tenant, layer):
+  """Stream every entity of a layer"""
+  if layer == 'applications':
+    response = rh.env_get(cluster, tenant, topology_applications.ENDPOINT, stream=True)
+    return json_stream.iter_json_array(response)
+  return topology_shared.iter_env_layer_entities(cluster, tenant, layer)
+
+def get_current_tags(cluster, tenant, layer, entity_ids):
+  """Manual (CONTEXTLESS) tags of the given entities from one list fetch. {entity: set}"""
+  entity_ids = set(entity_ids)
+  current_tags = {}
+  for entity in iter_layer_entities(cluster, tenant, layer):
+    if entity['entityId'] in entity_ids:
+      current_tags[entity['entityId']] = set(
+          tag_to_string(tag) for tag in entity.get('tags', []) if tag.get('context') == 'CONTEXTLESS'
+      )
+  return current_tags
+
+def plan_tag_changes(desired_tags, current_tags, managed_keys=None):
+  """Minimal changes per entity: ({entity: tags to add}, {entity: tags to remove})
+
+  Tags are only removed when their key is in managed_keys and the tag is
+  not in the desired list of the entity.
+  """
+  managed_keys = set(managed_keys) if managed_keys else set()
+  to_add = {}
+  to_remove = {}
+  for entity, tags in desired_tags.items():
+    if entity not in current_tags:
+      continue
+    desired = set(tags)
+    current = current_tags[entity]
+    missing = sorted(desired - current)
+    stale = sorted(tag for tag in current - desired if tag_key(tag) in managed_keys)
+    if missing:
+      to_add[entity] = missing
+    if stale:
+      to_remove[entity] = stale
+  return to_add, to_remove
+
+def add_tags(cluster, tenant, layer, entity, tag_list):
+  """Add tags to an entity of any taggable layer"""
+  if layer == 'applications':
+    return topology_applications.add_application_tags(cluster, tenant, entity, tag_list)
+  return topology_shared.add_env_layer_tags(cluster, tenant, layer, entity, tag_list)
+
+def sync_tags(cluster, tenant, desired_tags, managed_keys=None, max_workers=None, progress=None):
+  """Bring the tags of many entities to a desired state with the fewest API calls
+
+  desired_tags is {layer: {entity_id: ["key", "key:value", ...]}}. Each layer
+  is listed once to read the current tags. Then one add call is made per
+  entity that is missing tags, and one delete call per stale tag (hosts
+  only). Tags are removed only if their key is in managed_keys. The calls
+  run concurrently. progress(done, total) is called after each one.
+
+  Returns a report with "added" and "removed" ({entity: tags}), "unchanged"
+  (count), "missing" (entities not found) and "failures" ({entity: errors}).
+  """
+  report = {'added': {}, 'removed': {}, 'unchanged': 0, 'missing': [], 'failures': {}}
+  operations = []
+  for layer, layer_tags in desired_tags.items():
+    topology_shared.check_valid_layer(layer, TAG_LAYERS)
+    current_tags = get_current_tags(cluster, tenant, layer, layer_tags)
+    report['missing'].extend(sorted(set(layer_tags) - set(current_tags)))
+    to_add, to_remove = plan_tag_changes(layer_tags, current_tags, managed_keys=managed_keys)
+    report['unchanged'] = report['unchanged'] + \
+        len([entity for entity in current_tags if entity not in to_add and entity not in to_remove])
+    for entity, tags in to_add.items():
+      operations.append(('add', layer, entity, tags))
+    for entity, tags in to_remove.items():
+      if layer not in TAG_DELETE_LAYERS:
+        report['failures'].setdefault(entity, []).append(
+            "Tag removal is not supported for " + layer + ": " + ", ".join(tags)
+        )
+        continue
+      for tag in tags:
+        operations.append(('remove', layer, entity, [tag]))
+
+  progress_lock = threading.Lock()
+  progress_count = [0]
+
+  def apply_operation(operation):
+    action, layer, entity, tags = operation
+    try:
+      if action == 'add':
+        add_tags(cluster, tenant, layer, entity, tags)
+      else:
+        topology_hosts.delete_host_tag(cluster, tenant, entity, tags[0])
+    finally:
+      if progress is not None:
+        with progress_lock:
+          progress_count[0] = progress_count[0] + 1
+          progress(progress_count[0], len(operations))
+
+  _, failures = parallel.run_parallel_collect(apply_operation, operations, max_workers=max_workers)
+  for position, (action, layer, entity, tags) in enumerate(operations):
+    if position in failures:
+      report['failures'].setdefault(entity, []).append(
+          action + " " + ", ".join(tags) + ": " + str(failures[position])
+      )
+    else:
+      report['added' if action == 'add' else 'removed'].setdefault(entity, []).extend(tags)
+  return report
@@ -0,0 +1,152 @@
+"""Checks json_stream's incremental reader and counter against json.loads
+
+Run from the repository root: python -m unittest discover -s tests
+"""
+import json
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from dynatrace.requests import json_stream
+
+SEED = 20201017
+DOCUMENTS = 200
+CHUNKINGS = 5
+# Characters strings are built from: escapes, structural characters, multi-byte UTF-8
+STRING_CHARACTERS = ['a', 'Z', ' ', '"', '\\', '/', '\n', '\t', '\b', '\u0001', '[', ']', '{', '}',
+                     ',', ':', 'é', 'ß', '€', '中', '😀']
+
+class FakeResponse():
+  """Just enough of a requests response: chunks, url and close"""
+  def __init__(self, chunks):
+    self.chunks = chunks
+    self.url = "https://example.com/api"
+    self.closed = False
+
+  def iter_content(self, chunk_size=None):
+    return iter(self.chunks)
+
+  def close(self):
+    self.closed = True
+
+def random_string(rng):
+  return ''.join(rng.choice(STRING_CHARACTERS) for _ in range(rng.randint(0, 8)))
+
+def random_value(rng, depth=0):
+  kind = rng.randint(0, 9 if depth < 3 else 5)
+  if kind == 0:
+    return None
+  if kind == 1:
+    return rng.random() < 0.5
+  if kind == 2:
+    return rng.randint(-10 ** 12, 10 ** 12)
+  if kind == 3:
+    return rng.choice([0.0, -1.5, 1e-7, 3.25e21, rng.uniform(-1e6, 1e6)])
+  if kind in (4, 5):
+    return random_string(rng)
+  if kind in (6, 7):
+    return [random_value(rng, depth + 1) for _ in range(rng.randint(0, 4))]
+  return dict(
+      (random_string(rng), random_value(rng, depth + 1)) for _ in range(rng.randint(0, 4))
+  )
+
+def random_body(rng):
+  """A JSON array as UTF-8 bytes, in a random layout"""
+  elements = [random_value(rng) for _ in range(rng.randint(0, 12))]
+  layout = rng.choice([
+      {},
+      {'separators': (',', ':')},
+      {'indent': 2},
+      {'ensure_ascii': False},
+      {'ensure_ascii': False, 'indent': 1, 'separators': (' , ', ' : ')}
+  ])
+  text = json.dumps(elements, **layout)
+  return (rng.choice(['', ' ', '\n']) + text + rng.choice(['', '\n', ' \r\n'])).encode('utf-8')
+
+def random_chunks(rng, body):
+  """body cut at random byte positions, including inside multi-byte characters"""
+  if not body:
+    return [body]
+  chunk_size = rng.choice([1, 2, 3, 7, 64, len(body)])
+  chunks = []
+  position = 0
+  while position < len(body):
+    size = rng.randint(1, chunk_size)
+    chunks.append(body[position:position + size])
+    position = position + size
+  return chunks
+
+class JsonStreamTest(unittest.TestCase):
+
+  def setUp(self):
+    self.rng = random.Random(SEED)
+    self.bodies = [random_body(self.rng) for _ in range(DOCUMENTS)]
+    self.bodies += [b'[]', b' [ ] ', b'[[]]', b'[{}]', b'[""]', b'["\\\\"]', b'["\\""]',
+                    b'[1,2.5e3,-0]', b'[true,false,null]', '["€😀"]'.encode('utf-8')]
+
+  def test_iter_json_array(self):
+    for body in self.bodies:
+      expected = json.loads(body.decode('utf-8'))
+      for _ in range(CHUNKINGS):
+        response = FakeResponse(random_chunks(self.rng, body))
+        self.assertEqual(list(json_stream.iter_json_array(response)), expected, body)
+        self.assertTrue(response.closed)
+
+  def test_iter_json_array_raw(self):
+    for body in self.bodies:
+      expected = json.loads(body.decode('utf-8'))
+      response = FakeResponse(random_chunks(self.rng, body))
+      pairs = list(json_stream.iter_json_array(response, raw=True))
+      self.assertEqual([element for element, _ in pairs], expected)
+      self.assertEqual([json.loads(text) for _, text in pairs], expected)
+
+  def test_count_json_array(self):
+    for body in self.bodies:
+      expected = len(json.loads(body.decode('utf-8')))
+      for _ in range(CHUNKINGS):
+        chunks = random_chunks(self.rng, body)
+        self.assertEqual(json_stream.count_json_array_chunks(chunks), expected, body)
+      response = FakeResponse(random_chunks(self.rng, body))
+      self.assertEqual(json_stream.count_json_array(response), expected)
+      self.assertTrue(response.closed)
+
+  def test_not_an_array(self):
+    for body in [b'{"a": 1}', b'"text"', b'']:
+      with self.assertRaises(Exception):
+        list(json_stream.iter_json_array(FakeResponse([body])))
+      with self.assertRaises(Exception):
+        json_stream.count_json_array_chunks([body])
+
+  def test_truncated(self):
+    for body in self.bodies:
+      if len(body.strip()) <= 2:
+        continue
+      cut = body.strip()[:-1]
+      chunks = random_chunks(self.rng, cut)
+      with self.assertRaises(Exception):
+        list(json_stream.iter_json_array(FakeResponse(chunks)))
+      with self.assertRaises(Exception):
+        json_stream.count_json_array_chunks(chunks)
+
+  def test_content_after_array(self):
+    for body in [b'[1] [2]', b'[1]{}', b'[[1]] ["a"]', b'[1] "x"', b'[1] 2', b'[{"a": [1]}]]', b'[1]x']:
+      for _ in range(CHUNKINGS):
+        with self.assertRaises(Exception):
+          json_stream.count_json_array_chunks(random_chunks(self.rng, body))
+        with self.assertRaises(Exception):
+          list(json_stream.iter_json_array(FakeResponse(random_chunks(self.rng, body))))
+
+  def test_malformed_separators(self):
+    for body in [b'[1,]', b'[,1]', b'[,]', b'[1,,2]', b'[1 2]', b'[{} []]', b'["a" "b"]', b'[1\n,\n]']:
+      for _ in range(CHUNKINGS):
+        response = FakeResponse(random_chunks(self.rng, body))
+        with self.assertRaises(Exception):
+          list(json_stream.iter_json_array(response))
+        self.assertTrue(response.closed)
+
+if __name__ == '__main__':
+  unittest.main()
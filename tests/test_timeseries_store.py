@@ -0,0 +1,118 @@
+"""Checks the poll window and tenant keys of TimeseriesStore against a simulated API
+
+Run from the repository root: python -m unittest discover -s tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from dynatrace.timeseries import timeseries_store
+
+MINUTE = 60 * 1000
+HOUR = 60 * MINUTE
+START = 1600000000000 - 1600000000000 % MINUTE
+
+def make_cluster(url):
+  return {
+      'url': url,
+      'tenant': {'prod': "tenant-id"},
+      'api_token': {'prod': "token"},
+      'is_managed': True,
+      'verify_ssl': True
+  }
+
+class SimulatedApi():
+  """Minute buckets per host, for the hosts reporting at the time of each bucket"""
+  def __init__(self):
+    self.now = START
+    self.windows = []
+    # host: (first bucket, last bucket or None)
+    self.hosts = {}
+    # cluster url: value reported by its hosts
+    self.values = {}
+
+  def get_timeseries_metric(self, cluster, tenant, metric, params=None):
+    start = params['startTimestamp']
+    end = params['endTimestamp']
+    self.windows.append(end - start)
+    data_points = {}
+    for host, (first, last) in self.hosts.items():
+      points = [
+          [timestamp, self.values.get(cluster['url'], 1.0)]
+          for timestamp in range(start - start % MINUTE, end + 1, MINUTE)
+          if start <= timestamp <= end and timestamp >= first and (last is None or timestamp <= last)
+      ]
+      if points:
+        data_points[host] = points
+    return {'timeseriesId': metric, 'dataResult': {'dataPoints': data_points}}
+
+class TimeseriesStoreTest(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.api = SimulatedApi()
+    patches = [
+        mock.patch.object(timeseries_store.timeseries, 'get_timeseries_metric',
+                          self.api.get_timeseries_metric),
+        mock.patch.object(timeseries_store, 'now_ms', lambda: self.api.now)
+    ]
+    for patch in patches:
+      patch.start()
+      self.addCleanup(patch.stop)
+    self.addCleanup(shutil.rmtree, self.directory)
+    self.cluster = make_cluster("cluster1.example.com")
+    self.store = timeseries_store.TimeseriesStore(self.directory, lookback_ms=2 * HOUR, settle_ms=0)
+
+  def poll_every_minute(self, until):
+    while self.api.now < until:
+      self.api.now = self.api.now + MINUTE
+      self.store.poll(self.cluster, "prod", "cpu")
+
+  def test_stored_series_are_complete(self):
+    self.api.hosts = {'HOST-A': (START - HOUR, None), 'HOST-B': (START - HOUR, None)}
+    self.poll_every_minute(START + 30 * MINUTE)
+    for host in self.api.hosts:
+      timestamps, _ = self.store.read(self.cluster, "prod", "cpu", host)
+      # Every minute from the first poll's lookback on, once
+      self.assertEqual(list(timestamps), list(range(START - HOUR, START + 30 * MINUTE + 1, MINUTE)))
+      self.assertEqual(timestamps[-1], START + 30 * MINUTE)
+
+  def test_disappearing_series_does_not_grow_the_window(self):
+    self.api.hosts = {'HOST-A': (START - HOUR, None), 'HOST-B': (START - HOUR, START + HOUR)}
+    self.poll_every_minute(START + 24 * HOUR)
+    # Once HOST-B is older than lookback_ms only the interval after HOST-A is requested
+    self.assertTrue(max(self.api.windows[-60:]) <= MINUTE, self.api.windows[-60:])
+    self.assertTrue(max(self.api.windows) <= 2 * HOUR + MINUTE)
+    timestamps, _ = self.store.read(self.cluster, "prod", "cpu", 'HOST-A')
+    self.assertEqual(timestamps[-1], START + 24 * HOUR)
+
+  def test_lagging_series_is_caught_up(self):
+    self.api.hosts = {'HOST-A': (START - HOUR, None), 'HOST-B': (START - HOUR, START + 10 * MINUTE)}
+    self.poll_every_minute(START + 20 * MINUTE)
+    # HOST-B reports its missing buckets late
+    self.api.hosts['HOST-B'] = (START - HOUR, None)
+    self.poll_every_minute(START + 21 * MINUTE)
+    timestamps, _ = self.store.read(self.cluster, "prod", "cpu", 'HOST-B')
+    self.assertEqual(list(timestamps[-11:]), list(range(START + 11 * MINUTE, START + 22 * MINUTE, MINUTE)))
+
+  def test_same_tenant_name_on_two_clusters(self):
+    other_cluster = make_cluster("cluster2.example.com")
+    self.api.hosts = {'HOST-A': (START - HOUR, None)}
+    self.api.values = {"cluster1.example.com": 1.0, "cluster2.example.com": 2.0}
+    self.api.now = START
+    self.store.poll(self.cluster, "prod", "cpu")
+    self.store.poll(other_cluster, "prod", "cpu")
+    _, values = self.store.read(self.cluster, "prod", "cpu", 'HOST-A')
+    _, other_values = self.store.read(other_cluster, "prod", "cpu", 'HOST-A')
+    self.assertTrue(len(values) > 0)
+    self.assertEqual(set(values), {1.0})
+    self.assertEqual(set(other_values), {2.0})
+
+if __name__ == '__main__':
+  unittest.main()